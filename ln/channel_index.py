@@ -0,0 +1,189 @@
+import weakref
+import numpy as np
+import networkx as nx
+from bisect import bisect_right
+from collections import OrderedDict
+from ln import utils as utils
+
+# Max number of payment amounts whose feasible channels and view are kept per graph
+MAX_FEASIBLE_AMOUNTS = 16
+# Channel indexes of each graph, they are released along with the graph
+channel_indexes = weakref.WeakKeyDictionary()
+
+
+class ChannelIndex:
+    """
+        Class used to prefilter the channels of the network that can forward a payment amount. The channels of each
+        directed pair of nodes (u, v) are laid out on flat arrays sorted by the balance available to forward the payment
+        (balance - fee_base_msat) along with their enabled flags and min_htlc, thus, the channels of a pair of nodes
+        with enough balance for an amount are found by a binary search. A channel can forward an amount when both of
+        its policies are enabled, their min_htlc are lower than the amount and the balance is greater than their
+        fee_base_msat plus the amount (the conditions checked by get_min_source_dest_channels on each policy), thus,
+        the values of a channel are the most restrictive ones of both policies. The feasible channels are kept per
+        amount, and the searches run on a view of the graph without the channels that can not forward the amount, so
+        they never reach them and the cost index of the view only charges the channels that can forward the amount
+    """
+
+    def __init__(self, graph: nx):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        """
+        self.graph = graph
+        self.version = utils.get_graph_version(graph)
+        self.num_edges = graph.number_of_edges()
+        # Position of each directed pair (u, v) and bounds of its channels on the flat arrays
+        self.pairs = {}
+        self.indptr = [0]
+        for u, nbrs in graph.adj.items():
+            for v, channels in nbrs.items():
+                self.pairs[(u, v)] = len(self.pairs)
+                self.indptr.append(self.indptr[-1] + len(channels))
+        # Key, balance available, enabled flag and min_htlc of each channel sorted by balance within its pair of nodes
+        self.keys = [None] * self.indptr[-1]
+        self.headroom = np.zeros(self.indptr[-1], dtype=np.float64)
+        self.enabled = np.zeros(self.indptr[-1], dtype=bool)
+        self.min_htlc = np.zeros(self.indptr[-1], dtype=np.float64)
+        # Position of each channel on the flat arrays
+        self.slots = {}
+        for (u, v), pos in self.pairs.items():
+            self.__load(u, v, pos)
+        # Feasible channels (by position) and view of the graph of each payment amount
+        self.feasible = OrderedDict()
+        self.views = {}
+
+    def channels(self, u, v, payment_amount: int) -> list:
+        """
+        Gets the channels of the directed pair (u, v) that can forward a payment amount
+
+        :param u: node u
+        :param v: node v
+        :param payment_amount: amount to be forwarded through the channels
+        :return: list of channel keys
+        """
+        self.refresh()
+        pos = self.pairs.get((u, v))
+        return [] if pos is None else [self.keys[slot] for slot in self.__feasible_slots(pos, payment_amount)]
+
+    def is_channel_feasible(self, key: str, payment_amount: int) -> bool:
+        """
+        Checks that a channel can forward a payment amount
+
+        :param key: key of the channel (channel_id-pubkey)
+        :param payment_amount: amount to be forwarded through the channel
+        :return: bool
+        """
+        feasible = self.feasible_channels(payment_amount)
+        slot = self.slots.get(key)
+        return slot is not None and bool(feasible[slot])
+
+    def feasible_channels(self, payment_amount: int) -> np.ndarray:
+        """
+        Gets the feasibility of every channel for a payment amount. It is computed at once on the flat arrays the first
+        time that the amount is requested, and only the channels of the pairs of nodes recorded on the journal of the
+        graph are checked again once the graph is updated
+
+        :param payment_amount: amount to be forwarded through the channels
+        :return: feasibility of each channel by position
+        """
+        self.refresh()
+        feasible = self.feasible.get(payment_amount)
+        if feasible is None:
+            feasible = self.feasible[payment_amount] = \
+                self.enabled & (self.min_htlc < payment_amount) & (self.headroom > payment_amount)
+            if len(self.feasible) > MAX_FEASIBLE_AMOUNTS:
+                self.views.pop(self.feasible.popitem(last=False)[0], None)
+        else:
+            self.feasible.move_to_end(payment_amount)
+        return feasible
+
+    def view(self, payment_amount: int) -> nx:
+        """
+        Gets a read-only view of the graph without the channels that can not forward a payment amount, so the searches
+        over the view never reach them. The view of an amount is kept along with its feasible channels, hence, the
+        structures compiled from the view (e.g. its cost index) are reused by the following queries of the amount
+
+        :param payment_amount: amount to be forwarded through the channels
+        :return: filtered view of the graph
+        """
+        self.feasible_channels(payment_amount)
+        view = self.views.get(payment_amount)
+        if view is None:
+            view = self.views[payment_amount] = nx.subgraph_view(
+                self.graph, filter_edge=lambda u, v, k: self.is_channel_feasible(k, payment_amount))
+        return view
+
+    def refresh(self):
+        """
+        Brings the index up to date with the version of the graph, thus, only the pairs of nodes recorded on the
+        journal of the graph since the version of the index are sorted again
+        """
+        version = utils.get_graph_version(self.graph)
+        if version == self.version:
+            return
+        updates = utils.get_graph_updates(self.graph, self.version)
+        if updates is None or self.graph.number_of_edges() != self.num_edges:
+            self.__init__(self.graph)
+            return
+        for u, v in updates:
+            for pair in ((u, v), (v, u)):
+                pos = self.pairs.get(pair)
+                if pos is not None:
+                    self.__load(*pair, pos)
+                    lo, hi = self.indptr[pos], self.indptr[pos + 1]
+                    for payment_amount, feasible in self.feasible.items():
+                        feasible[lo:hi] = False
+                        feasible[self.__feasible_slots(pos, payment_amount)] = True
+        self.version = version
+
+    def __feasible_slots(self, pos: int, payment_amount: int) -> list:
+        """
+        Gets the positions of the channels of a directed pair of nodes that can forward a payment amount, the channels
+        with enough balance are found by a binary search
+
+        :param pos: position of the directed pair
+        :param payment_amount: amount to be forwarded through the channels
+        :return: list of positions of the channels
+        """
+        lo, hi = self.indptr[pos], self.indptr[pos + 1]
+        start = lo + bisect_right(self.headroom[lo:hi].tolist(), payment_amount)
+        return [slot for slot in range(start, hi) if self.enabled[slot] and self.min_htlc[slot] < payment_amount]
+
+    def __load(self, u, v, pos: int):
+        """
+        Loads the channels of the directed pair (u, v) on its bounds of the flat arrays sorted by balance available
+
+        :param u: node u
+        :param v: node v
+        :param pos: position of the directed pair
+        """
+        rows = []
+        for key, channel in self.graph.adj[u][v].items():
+            policies = [channel.get('policy_source'), channel.get('policy_dest')]
+            balance = float(channel.get('balance', channel.get('capacity', 0)))
+            if any(policy is None for policy in policies):
+                rows.append((-np.inf, key, False, 0))
+            else:
+                rows.append((balance - max(policy['fee_base_msat'] for policy in policies), key,
+                             not any(policy['disabled'] for policy in policies),
+                             max(policy['min_htlc'] for policy in policies)))
+        rows.sort(key=lambda row: row[0])
+        for slot, (headroom, key, enabled, min_htlc) in enumerate(rows, self.indptr[pos]):
+            self.keys[slot] = key
+            self.headroom[slot] = headroom
+            self.enabled[slot] = enabled
+            self.min_htlc[slot] = min_htlc
+            self.slots[key] = slot
+
+
+def get_channel_index(graph: nx) -> ChannelIndex:
+    """
+    Gets the channel index of a graph, it is built once per graph
+
+    :param graph: structure that contains the whole data about the network
+    :return: ChannelIndex
+    """
+    channel_index = channel_indexes.get(graph)
+    if channel_index is None:
+        channel_index = channel_indexes[graph] = ChannelIndex(graph)
+    return channel_index
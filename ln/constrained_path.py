@@ -0,0 +1,123 @@
+import time
+import heapq
+import itertools
+import networkx as nx
+from typing import Tuple
+from ln import route_payment as route_pay, shortest_path_yen as spy, landmarks as lm, utils as utils
+
+# Max number of labels kept per node, i.e. the paths to a node that are not dominated by any other path
+MAX_LABELS = 16
+
+
+def constrained_shortest_path(graph: nx, source: str, target: str, payment_amount: int, fee_limit: int = None,
+                              cltv_limit: int = None, cost_index: spy.CostIndex = None, landmarks: lm.Landmarks = None,
+                              channel_index=None, max_labels: int = MAX_LABELS) -> Tuple[int, list]:
+    """
+    Gets the cheapest path between a source node and a target node whose fees and time lock do not exceed the given
+    limits (as fee_limit and cltv_limit of the QueryRoutesRequest of lnd) by means of a label-setting search. A label is
+    a path to a node with its cost, its fees and the total time lock (time_lock_delta of every hop). The fees are the
+    ones added to the total fees of the payment by create_payment (only the hops given by get_charged_hops of
+    shortest_path_yen), hence, a label keeps the fees of all its hops and the fees charged once the path takes one more
+    hop, which are the least fees of any path that goes on from the label. The labels that exceed a limit are dropped,
+    and a label is dominated by another label of the same node with lower or equal cost, fees and time lock. The labels
+    are settled in order of cost, hence, the first label settled at the target node is the cheapest path within both
+    limits. The labels of a node are bounded by max_labels, so the search keeps polynomial at the risk of missing a path
+    within the limits when the fees and the time locks of the paths are very diverse. When the landmarks are given, the
+    labels are settled in order of cost plus the lower bound of the cost to the target node (A*). When the channel index
+    is given, the search runs on the view of the graph without the channels that can not forward the payment amount
+    (shortest_path_yen.search_graph), whose cost index must be given if any
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param fee_limit: max total fees (msat) of the payment, None for no limit
+    :param cltv_limit: max total time lock of the path, None for no limit
+    :param cost_index: compiled costs of the graph for the payment amount
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search
+    :param channel_index: channels of the graph that can forward each payment amount (channel_index.ChannelIndex)
+    :param max_labels: max number of labels settled per node
+    :return: cost of the path and the path
+    """
+    if source not in graph or target not in graph:
+        raise nx.NodeNotFound("Either source {} or target {} is not in G".format(source, target))
+    graph = spy.search_graph(graph, payment_amount, channel_index)
+    cost_index = spy.get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    heuristic = (lambda node: 0) if landmarks is None else landmarks.heuristic(target)
+    fee_limit = float('inf') if fee_limit is None else fee_limit
+    cltv_limit = float('inf') if cltv_limit is None else cltv_limit
+
+    # Label: (cost + heuristic, cost, fees charged with one more hop, time lock, counter, node, previous label, fees of
+    # all the hops, number of hops), the counter keeps the order of the labels with the same values
+    counter = itertools.count()
+    heap = [(heuristic(source), 0, 0, 0, next(counter), source, None, 0, 0)]
+    # Fees charged with one more hop, fees of all the hops and time locks of the labels settled at each node
+    settled = {}
+    while heap:
+        label = heapq.heappop(heap)
+        _, cost, fees, time_lock, _, node, _, total_fees, hops = label
+        labels = settled.setdefault(node, [])
+        if len(labels) >= max_labels or any(f <= fees and a <= total_fees and t <= time_lock
+                                            for f, a, t in labels):
+            continue
+        labels.append((fees, total_fees, time_lock))
+        if node == target:
+            path = []
+            while label is not None:
+                path.append(label[5])
+                label = label[6]
+            return cost, path[::-1]
+
+        for successor in graph.succ[node]:
+            pos = cost_index.position(node, successor)
+            if pos is None or cost_index.weights[pos] is None:
+                continue
+            # The fees of the path that ends at the successor are the fees charged with one more hop of the label
+            successor_total_fees = total_fees + max(int(cost_index.fee_array[pos]), 1000)
+            successor_fees = successor_total_fees if spy.get_charged_hops(hops + 2) == hops + 1 else total_fees
+            successor_time_lock = time_lock + int(cost_index.time_lock_array[pos])
+            if (fees if successor == target else successor_fees) > fee_limit or successor_time_lock > cltv_limit:
+                continue
+            if any(f <= successor_fees and a <= successor_total_fees and t <= successor_time_lock
+                   for f, a, t in settled.get(successor, ())):
+                continue
+            successor_cost = cost + cost_index.weights[pos]
+            heapq.heappush(heap, (successor_cost + heuristic(successor), successor_cost, successor_fees,
+                                  successor_time_lock, next(counter), successor, label, successor_total_fees,
+                                  hops + 1))
+
+    raise nx.NetworkXNoPath("No path between %s and %s within the limits." % (source, target))
+
+
+def query_route_constrained(graph1: nx, graph2: nx, node_origin: str, node_destiny: str, payment_amount: int,
+                            fee_limit: int = None, cltv_limit: int = None, landmarks: lm.Landmarks = None,
+                            channel_index=None) -> route_pay.Payment:
+    """
+    Creates the structure that contains the payment of the cheapest route whose fees and time lock do not exceed the
+    given limits
+
+    :param graph1: contains detailed data about the network
+    :param graph2: contains specific data about the network
+    :param node_origin: pub key of the node origin
+    :param node_destiny: pub key of the node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param fee_limit: max total fees (msat) of the payment, None for no limit
+    :param cltv_limit: max total time lock of the route, None for no limit
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+    :param channel_index: channels of the graph that can forward each payment amount (channel_index.ChannelIndex)
+    :return: Payment that contains data about both nodes and route, totals (amt, fee, time lock and success
+    probability)
+    """
+    cost_index = spy.get_cost_index(spy.search_graph(graph2, payment_amount, channel_index), payment_amount)
+    try:
+        cost, path = constrained_shortest_path(graph2, node_origin, node_destiny, payment_amount, fee_limit, cltv_limit,
+                                               cost_index, landmarks, channel_index)
+    except nx.NodeNotFound as e:
+        print('%s%s*** ERROR ON CONSTRAINED SHORTEST PATH: %s' % (utils.spaces, utils.spaces, e))
+        return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                 error="Nodes not found - CONSTRAINED - either node is not in graph")
+    except nx.NetworkXNoPath:
+        return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                 error="Route not found - CONSTRAINED - no path within fee_limit and cltv_limit")
+    return spy.create_payment(graph1, graph2, node_origin, node_destiny, payment_amount, path,
+                              spy.evaluate_paths(graph2, [path], payment_amount, cost_index)[0])
@@ -0,0 +1,350 @@
+import os
+import heapq
+import numpy as np
+import networkx as nx
+from typing import Tuple, Optional
+from ln import utils as utils, intern_table as intern_table
+
+# Version of the layout of the hierarchy stored on disk
+HIERARCHY_VERSION = 1
+# Max number of nodes settled by a witness search while a node is contracted
+MAX_WITNESS_SETTLED = 64
+# Max number of pairs of neighbours (in x out) of a node to be contracted, the remaining nodes are left as the core
+MAX_CONTRACTION_PAIRS = 256
+# Max number of shortcuts added per edge removed by the contraction of a node
+MAX_SHORTCUTS_RATIO = 2
+
+
+def static_weight(channels: dict) -> Optional[int]:
+    """
+    Gets the cost of a directed edge that holds for any payment amount and balance. The cost of a pair of nodes with a
+    single channel does not depend on them, so it is the same cost given by the cost index, whereas the cost of a pair
+    of nodes with parallel channels is bounded by the lowest fee_base_msat + min_htlc among the policies of its channels
+
+    :param channels: all channels between a pair of nodes
+    :return: cost of the directed edge, None if the edge can not be used
+    """
+    if 0 in channels or 1 in channels:
+        return None
+    if len(channels) == 1:
+        channel = next(iter(channels.values()))
+        policy_source = channel['policy_source']
+        policy_dest = channel['policy_dest']
+        if policy_source is not None:
+            if policy_dest is not None:
+                min_htlc_source = 1 if 'min_htlc' not in policy_source else policy_source['min_htlc']
+                min_htlc_dest = 1 if 'min_htlc' not in policy_dest else policy_dest['min_htlc']
+                if policy_source['fee_base_msat'] <= policy_dest['fee_base_msat'] \
+                        and min_htlc_source <= min_htlc_dest:
+                    return policy_source['fee_base_msat'] + min_htlc_source
+                return policy_dest['fee_base_msat'] + min_htlc_dest
+            return policy_source['fee_base_msat'] + policy_source['min_htlc']
+        if policy_dest is not None:
+            return policy_dest['fee_base_msat'] + policy_dest['min_htlc']
+        return None
+
+    weight = None
+    for channel in channels.values():
+        for name in ('policy_source', 'policy_dest'):
+            policy = channel.get(name)
+            if policy is not None:
+                min_htlc = 1 if 'min_htlc' not in policy else policy['min_htlc']
+                cost = policy['fee_base_msat'] + min_htlc
+                weight = cost if weight is None else min(weight, cost)
+    return weight
+
+
+class ContractionHierarchy:
+    """
+        Class used to gather the contraction hierarchy of a network. The nodes are contracted one by one, and the
+        shortcuts needed to keep the shortest paths among the remaining nodes are added, thus, a query is a
+        bidirectional Dijkstra that only goes upward on the order of contraction. The hubs of the network, whose
+        contraction would add too many shortcuts, are left as a core on the top of the hierarchy in which the query is a
+        plain bidirectional Dijkstra. The hierarchy is built on the static
+        costs of the channels, which are the actual costs of the pairs of nodes with a single channel and a lower bound
+        of the costs of the pairs of nodes with parallel channels. Hence, a path found on the hierarchy is a shortest
+        path for a payment amount whenever its actual cost equals its static cost, otherwise the query falls back to
+        Dijkstra
+    """
+
+    def __init__(self, nodes: list, ranks: np.ndarray, tails: np.ndarray, heads: np.ndarray, weights: np.ndarray,
+                 middles: np.ndarray):
+        """
+
+        :param nodes: nodes of the network
+        :param ranks: order in which each node was contracted, the nodes of the core share the highest rank
+        :param tails: position of the tail node of each edge of the hierarchy
+        :param heads: position of the head node of each edge of the hierarchy
+        :param weights: static cost of each edge of the hierarchy
+        :param middles: position of the node contracted by each shortcut, -1 for the channels of the network
+        """
+        self.nodes = list(nodes)
+        self.ranks = ranks
+        self.tails = tails
+        self.heads = heads
+        self.weights = weights
+        self.middles = middles
+        self.positions = {node: pos for pos, node in enumerate(self.nodes)}
+        # Edges going upward from each node (forward search) and reaching each node from upward (backward search)
+        self.upward = [[] for _ in self.nodes]
+        self.downward = [[] for _ in self.nodes]
+        self.middle = {}
+        for tail, head, weight, middle in zip(tails.tolist(), heads.tolist(), weights.tolist(), middles.tolist()):
+            if ranks[tail] <= ranks[head]:
+                self.upward[tail].append((head, weight))
+            if ranks[tail] >= ranks[head]:
+                self.downward[head].append((tail, weight))
+            if middle >= 0:
+                self.middle[(tail, head)] = middle
+
+    @classmethod
+    def build(cls, graph: nx):
+        """
+        Contracts the nodes of the network ordered by edge difference (shortcuts added minus edges removed) plus the
+        number of neighbours already contracted. A shortcut u -> v -> x is only added when a witness search from u that
+        skips v does not reach x with a lower or equal cost. The nodes with more than MAX_CONTRACTION_PAIRS pairs of
+        neighbours, or whose contraction adds more than MAX_SHORTCUTS_RATIO shortcuts per edge removed, are left on
+        the core
+
+        :param graph: structure that contains the whole data about the network
+        :return: ContractionHierarchy
+        """
+        table = intern_table.get_intern_table(graph)
+        nodes, positions = table.nodes, table.node_ids
+        out_edges = [{} for _ in nodes]
+        in_edges = [{} for _ in nodes]
+        for u, nbrs in graph.adj.items():
+            for v, channels in nbrs.items():
+                weight = static_weight(channels)
+                if weight is not None and u != v:
+                    out_edges[positions[u]][positions[v]] = weight
+                    in_edges[positions[v]][positions[u]] = weight
+
+        middles = {}
+        ranks = np.full(len(nodes), -1, dtype=np.int64)
+        contracted_nbrs = [0] * len(nodes)
+        tails, heads, weights = [], [], []
+
+        def witness(u: int, v: int, targets: dict, max_cost: int) -> dict:
+            distances = {u: 0}
+            heap = [(0, u)]
+            settled = 0
+            while heap and settled < MAX_WITNESS_SETTLED:
+                cost, node = heapq.heappop(heap)
+                if cost > max_cost:
+                    break
+                if cost > distances[node]:
+                    continue
+                settled += 1
+                for x, w in out_edges[node].items():
+                    if x != v and cost + w < distances.get(x, cost + w + 1):
+                        distances[x] = cost + w
+                        heapq.heappush(heap, (cost + w, x))
+            return {x: distances[x] for x in targets if x in distances}
+
+        def shortcuts(v: int) -> list:
+            found = []
+            for u, w_in in in_edges[v].items():
+                targets = {x: w_in + w_out for x, w_out in out_edges[v].items() if x != u}
+                if not targets:
+                    continue
+                distances = witness(u, v, targets, max(targets.values()))
+                for x, cost in targets.items():
+                    if distances.get(x, cost + 1) > cost:
+                        found.append((u, x, cost))
+            return found
+
+        def priority(v: int, found: list) -> int:
+            return len(found) - len(in_edges[v]) - len(out_edges[v]) + contracted_nbrs[v]
+
+        def is_core(v: int) -> bool:
+            return len(in_edges[v]) * len(out_edges[v]) > MAX_CONTRACTION_PAIRS
+
+        heap = [(len(in_edges[v]) + len(out_edges[v]) if is_core(v) else priority(v, shortcuts(v)), v)
+                for v in range(len(nodes))]
+        heapq.heapify(heap)
+        core = []
+        rank = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if is_core(v):
+                core.append(v)
+                continue
+            # The priorities are updated lazily, the node is contracted only if it is still the lowest one
+            found = shortcuts(v)
+            current = priority(v, found)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+            if len(found) > MAX_SHORTCUTS_RATIO * (len(in_edges[v]) + len(out_edges[v])):
+                # The contraction would add too many shortcuts
+                core.append(v)
+                continue
+
+            for u, x, cost in found:
+                if cost < out_edges[u].get(x, cost + 1):
+                    out_edges[u][x] = cost
+                    in_edges[x][u] = cost
+                    middles[(u, x)] = v
+            for x, w in out_edges[v].items():
+                tails.append(v)
+                heads.append(x)
+                weights.append(w)
+                del in_edges[x][v]
+                contracted_nbrs[x] += 1
+            for u, w in in_edges[v].items():
+                tails.append(u)
+                heads.append(v)
+                weights.append(w)
+                del out_edges[u][v]
+                contracted_nbrs[u] += 1
+            out_edges[v] = {}
+            in_edges[v] = {}
+            ranks[v] = rank
+            rank += 1
+
+        # The edges among the nodes of the core are kept as they are
+        for v in core:
+            ranks[v] = rank
+            for x, w in out_edges[v].items():
+                tails.append(v)
+                heads.append(x)
+                weights.append(w)
+
+        return cls(nodes, ranks, np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64),
+                   np.array(weights, dtype=np.int64),
+                   np.array([middles.get(pair, -1) for pair in zip(tails, heads)], dtype=np.int64))
+
+    def query(self, source: str, target: str) -> Tuple[int, list]:
+        """
+        Gets the shortest path between a source node and a target node on the static costs by means of a bidirectional
+        Dijkstra that only goes upward on the hierarchy (and across the core), and unpacks the shortcuts of the path
+
+        :param source: node origin
+        :param target: node destiny
+        :return: static cost of the path and the path
+        """
+        s = self.positions.get(source)
+        t = self.positions.get(target)
+        if s is None or t is None:
+            raise nx.NodeNotFound("Either source {} or target {} is not in G".format(source, target))
+        if s == t:
+            return 0, [source]
+
+        distances = ({s: 0}, {t: 0})
+        parents = ({s: None}, {t: None})
+        heaps = ([(0, s)], [(0, t)])
+        edges = (self.upward, self.downward)
+        best, meeting = None, None
+        while heaps[0] or heaps[1]:
+            for i in (0, 1):
+                heap = heaps[i]
+                if not heap or (best is not None and heap[0][0] >= best):
+                    heaps[i].clear()
+                    continue
+                cost, node = heapq.heappop(heap)
+                if cost > distances[i][node]:
+                    continue
+                if node in distances[1 - i] and (best is None or cost + distances[1 - i][node] < best):
+                    best, meeting = cost + distances[1 - i][node], node
+                for x, w in edges[i][node]:
+                    if cost + w < distances[i].get(x, cost + w + 1):
+                        distances[i][x] = cost + w
+                        parents[i][x] = node
+                        heapq.heappush(heap, (cost + w, x))
+        if meeting is None:
+            raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+        forward = [meeting]
+        while parents[0][forward[-1]] is not None:
+            forward.append(parents[0][forward[-1]])
+        forward.reverse()
+        backward = [meeting]
+        while parents[1][backward[-1]] is not None:
+            backward.append(parents[1][backward[-1]])
+        path = forward + backward[1:]
+
+        nodes = [path[0]]
+        for i in range(len(path) - 1):
+            stack = [(path[i], path[i + 1])]
+            while stack:
+                u, x = stack.pop()
+                middle = self.middle.get((u, x))
+                if middle is None:
+                    nodes.append(x)
+                else:
+                    stack.append((middle, x))
+                    stack.append((u, middle))
+        return best, [self.nodes[pos] for pos in nodes]
+
+    def shortest_path(self, source: str, target: str, weight) -> Optional[Tuple[int, list]]:
+        """
+        Gets the shortest path between a source node and a target node for the actual costs. The path found on the
+        hierarchy is a shortest path when its actual cost equals its static cost, since the static costs are lower
+        bounds of the actual costs of any other path
+
+        :param source: node origin
+        :param target: node destiny
+        :param weight: function that returns the actual cost of a directed edge, None if the edge can not be used
+        :return: cost of the path and the path, None if the path must be found by Dijkstra
+        """
+        cost, path = self.query(source, target)
+        actual = 0
+        for i in range(len(path) - 1):
+            w = weight(path[i], path[i + 1], None)
+            if w is None:
+                return None
+            actual += w
+        return (actual, path) if actual == cost else None
+
+    def save(self, path: str, signature: list):
+        """
+        Stores the hierarchy on a compressed numpy file
+
+        :param path: path of the file
+        :param signature: values of the snapshot from which the hierarchy was built (size and modification time)
+        """
+        np.savez_compressed(path, version=np.array([HIERARCHY_VERSION] + list(signature), dtype=np.float64),
+                            nodes=np.array(self.nodes, dtype=str), ranks=self.ranks, tails=self.tails,
+                            heads=self.heads, weights=self.weights, middles=self.middles)
+
+    @classmethod
+    def load(cls, path: str, signature: list):
+        """
+        Loads the hierarchy from a compressed numpy file
+
+        :param path: path of the file
+        :param signature: values of the snapshot expected on the hierarchy (size and modification time)
+        :return: ContractionHierarchy, None if the file does not exist or was built from another snapshot
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if data['version'].tolist() != [HIERARCHY_VERSION] + list(signature):
+                    return None
+                return cls(data['nodes'].tolist(), data['ranks'], data['tails'], data['heads'], data['weights'],
+                           data['middles'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def get_contraction_hierarchy(graph: nx, location: str, file_name: str) -> ContractionHierarchy:
+    """
+    Gets the contraction hierarchy of a snapshot, the hierarchy is reloaded from the file stored next to the snapshot,
+    and it is built again (and stored) only when the snapshot changed
+
+    :param graph: structure that contains the whole data about the network
+    :param location: directory in which the snapshot is located
+    :param file_name: name of the snapshot
+    :return: ContractionHierarchy
+    """
+    signature = utils.get_file_signature(location, file_name)
+    path = os.path.join(location, os.path.splitext(file_name)[0] + '_hierarchy.npz')
+    hierarchy = ContractionHierarchy.load(path, signature)
+    if hierarchy is None or set(hierarchy.nodes) != set(graph.nodes):
+        print('%sINFO: building contraction hierarchy of %s' % (utils.spaces, file_name))
+        hierarchy = ContractionHierarchy.build(graph)
+        hierarchy.save(path, signature)
+    else:
+        print('%sINFO: contraction hierarchy of %s loaded from %s' % (utils.spaces, file_name, path))
+
+    return hierarchy
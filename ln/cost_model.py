@@ -0,0 +1,276 @@
+import abc
+import time
+import weakref
+import numpy as np
+import networkx as nx
+from typing import Tuple
+from ln import route_payment as route_pay, shortest_path_yen as spy, utils as utils
+
+# LND: time lock penalty of the edge weight, a priori probability of a hop and cost of a payment attempt (lnd 0.15),
+# the probability of a hop decreases as the amount goes beyond the cutoff fraction of the capacity of the channel
+LND_RISK_FACTOR_BILLIONTHS = 15
+LND_APRIORI_HOP_PROBABILITY = 0.6
+LND_ATTEMPT_COST_MSAT = 100000
+LND_ATTEMPT_COST_PPM = 1000
+LND_CAPACITY_CUTOFF_FRACTION = 0.75
+LND_CAPACITY_SMEARING_FRACTION = 0.1
+# C-LIGHTNING: risk factor of getroute (the same given by clightning_client.query_routes) as annual percentage
+CLIGHTNING_RISK_FACTOR = 0
+CLIGHTNING_BLOCKS_PER_YEAR = 52596
+# ECLAIR: weight ratios of the fees and cost of a hop (eclair 0.6), the factors are normalized between these bounds
+ECLAIR_BASE_RATIO = 0.0
+ECLAIR_CLTV_RATIO = 0.05
+ECLAIR_AGE_RATIO = 0.4
+ECLAIR_CAPACITY_RATIO = 0.55
+ECLAIR_HOP_COST_BASE_MSAT = 500
+ECLAIR_HOP_COST_PPM = 200
+ECLAIR_CLTV_LOW, ECLAIR_CLTV_HIGH = 9, 2016
+ECLAIR_CAPACITY_LOW_MSAT, ECLAIR_CAPACITY_HIGH_MSAT = 1000 * 1000, 16777215 * 1000
+ECLAIR_BLOCK_TIME_TWO_MONTHS = 8640
+# Channel arrays of each graph, they are released along with the graph
+channel_arrays = weakref.WeakKeyDictionary()
+
+
+class ChannelArrays:
+    """
+        Class used to lay out the source policy (the policy of the node that forwards the payment) and the capacity of
+        the channels of each directed pair of nodes (u, v) on flat arrays, in the order of the positions of the cost
+        index, thus, the costs of a model are computed for every channel at once and reduced to the cheapest channel
+        of each pair of nodes
+    """
+
+    def __init__(self, graph: nx, positions: dict):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        :param positions: position of each directed pair (u, v) on the arrays of the cost index
+        """
+        self.graph = graph
+        self.positions = positions
+        self.version = utils.get_graph_version(graph)
+        self.num_edges = graph.number_of_edges()
+        self.num_pairs = len(positions)
+        # Bounds of the channels of each directed pair on the flat arrays
+        self.indptr = np.zeros(len(positions) + 1, dtype=np.int64)
+        for (u, v), pos in positions.items():
+            self.indptr[pos + 1] = len(graph.adj[u][v]) if graph.has_edge(u, v) else 0
+        self.indptr = np.cumsum(self.indptr)
+        # Key, disabled flag, fees, time lock, min and max htlc (msat), capacity (sat) and block height of each channel
+        self.keys = [None] * int(self.indptr[-1])
+        self.disabled = np.ones(len(self.keys), dtype=bool)
+        self.fee_base = np.zeros(len(self.keys), dtype=np.int64)
+        self.fee_rate = np.zeros(len(self.keys), dtype=np.int64)
+        self.time_lock = np.zeros(len(self.keys), dtype=np.int64)
+        self.min_htlc = np.zeros(len(self.keys), dtype=np.int64)
+        self.max_htlc = np.zeros(len(self.keys), dtype=np.float64)
+        self.capacity = np.zeros(len(self.keys), dtype=np.int64)
+        self.height = np.zeros(len(self.keys), dtype=np.int64)
+        for (u, v), pos in positions.items():
+            self.__load(u, v, pos)
+
+    def refresh(self):
+        """
+        Brings the arrays up to date with the version of the graph, thus, only the pairs of nodes recorded on the
+        journal of the graph since the version of the arrays are loaded again
+        """
+        version = utils.get_graph_version(self.graph)
+        if version == self.version and len(self.positions) == self.num_pairs:
+            return
+        updates = utils.get_graph_updates(self.graph, self.version)
+        if updates is None or self.graph.number_of_edges() != self.num_edges or \
+                len(self.positions) != self.num_pairs:
+            self.__init__(self.graph, self.positions)
+            return
+        for u, v in updates:
+            for pair in ((u, v), (v, u)):
+                pos = self.positions.get(pair)
+                if pos is not None:
+                    self.__load(*pair, pos)
+        self.version = version
+
+    def __load(self, u, v, pos: int):
+        """
+        Loads the channels of the directed pair (u, v) on its bounds of the flat arrays
+
+        :param u: node u
+        :param v: node v
+        :param pos: position of the directed pair
+        """
+        channels = self.graph.adj[u][v] if self.graph.has_edge(u, v) else {}
+        for slot, (key, channel) in enumerate(channels.items(), int(self.indptr[pos])):
+            policy = channel.get('policy_source')
+            self.keys[slot] = key
+            self.capacity[slot] = int(channel.get('capacity', 0))
+            self.height[slot] = int(channel.get('channel_id', 0)) >> 40
+            self.disabled[slot] = policy is None or bool(policy['disabled'])
+            if policy is not None:
+                self.fee_base[slot] = policy['fee_base_msat']
+                self.fee_rate[slot] = policy['fee_rate_milli_msat']
+                self.time_lock[slot] = policy['time_lock_delta']
+                self.min_htlc[slot] = policy['min_htlc']
+                self.max_htlc[slot] = policy.get('max_htlc_msat', 0) or np.inf
+
+
+def get_channel_arrays(graph: nx, positions: dict) -> ChannelArrays:
+    """
+    Gets the channel arrays of a graph laid out by the positions of its cost indexes, they are built once per graph
+
+    :param graph: structure that contains the whole data about the network
+    :param positions: position of each directed pair (u, v) on the arrays of the cost indexes
+    :return: ChannelArrays
+    """
+    arrays = channel_arrays.get(graph)
+    if arrays is None or arrays.positions is not positions:
+        arrays = channel_arrays[graph] = ChannelArrays(graph, positions)
+    else:
+        arrays.refresh()
+    return arrays
+
+
+class CostModel(abc.ABC):
+    """
+        Class used to approximate offline the pathfinding of a LN implementation on the loaded snapshot. A model gives
+        the cost of every channel for a payment amount as an array, the channels that the implementation would not use
+        (disabled, out of the htlc limits or beyond the capacity) are dropped, and the cost of each directed pair of
+        nodes is the cost of its cheapest channel, so the searches of shortest_path_yen run on the costs of the model
+        through its cost index (shortest_path_yen.get_cost_index)
+    """
+    name = None
+
+    def compile(self, graph: nx, payment_amount: int, positions: dict) -> Tuple[np.ndarray, list, np.ndarray,
+                                                                                np.ndarray]:
+        """
+        Compiles the costs of every directed pair of nodes at once
+
+        :param graph: structure that contains the whole data about the network
+        :param payment_amount: amount to be paid to node destiny
+        :param positions: position of each directed pair (u, v) on the arrays
+        :return: cost, key of the cheapest channel (None if no channel can be used), fee_base_msat and time lock delta
+        of each directed pair by position
+        """
+        arrays = get_channel_arrays(graph, positions)
+        amount_msat = payment_amount * 1000
+        fees = arrays.fee_base + amount_msat * arrays.fee_rate / 1000000
+        with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+            costs = np.where(~arrays.disabled & (arrays.min_htlc <= amount_msat) & (amount_msat <= arrays.max_htlc) &
+                             (payment_amount <= arrays.capacity), self.costs(arrays, amount_msat, fees), np.inf)
+        costs = np.where(np.isnan(costs), np.inf, costs)
+
+        num_pairs = len(arrays.indptr) - 1
+        pair_of = np.repeat(np.arange(num_pairs), np.diff(arrays.indptr))
+        # Cheapest channel of each pair of nodes: the first one of its bounds once sorted by pair and cost
+        order = np.lexsort((costs, pair_of))
+        has_channels = np.diff(arrays.indptr) > 0
+        slots = np.full(num_pairs, -1, dtype=np.int64)
+        slots[has_channels] = order[arrays.indptr[:-1][has_channels]]
+        weights = np.where(slots >= 0, costs[np.maximum(slots, 0)], np.inf)
+        keys = [None if slot < 0 or weight == np.inf else arrays.keys[slot]
+                for slot, weight in zip(slots.tolist(), weights.tolist())]
+        return weights, keys, np.where(slots >= 0, arrays.fee_base[np.maximum(slots, 0)], 0), \
+            np.where(slots >= 0, arrays.time_lock[np.maximum(slots, 0)], 0)
+
+    @abc.abstractmethod
+    def costs(self, arrays: ChannelArrays, amount_msat: int, fees: np.ndarray) -> np.ndarray:
+        """
+        Gets the cost of every channel for a payment amount
+
+        :param arrays: channel arrays of the graph
+        :param amount_msat: amount (msat) to be forwarded through the channels
+        :param fees: fee (msat) charged by each channel for the amount
+        :return: cost of each channel
+        """
+
+
+class LndCostModel(CostModel):
+    """
+        Class used to approximate the probability-weighted cost of lnd, i.e. the fee and time lock penalty of the
+        channel plus the cost of a payment attempt divided by the a priori probability of the hop, which falls as the
+        amount comes close to the capacity of the channel. The probability is taken per hop instead of over the whole
+        route as lnd does
+    """
+    name = 'lnd'
+
+    def costs(self, arrays: ChannelArrays, amount_msat: int, fees: np.ndarray) -> np.ndarray:
+        capacity_msat = arrays.capacity * 1000.
+        smearing = np.maximum(capacity_msat * LND_CAPACITY_SMEARING_FRACTION, 1.)
+        exponent = np.clip(-(amount_msat - capacity_msat * LND_CAPACITY_CUTOFF_FRACTION) / smearing, -700, 700)
+        probability = LND_APRIORI_HOP_PROBABILITY * np.where(arrays.capacity > 0, 1 - 1 / (1 + np.exp(exponent)), 1)
+        penalty = LND_ATTEMPT_COST_MSAT + amount_msat * LND_ATTEMPT_COST_PPM / 1000000
+        return fees + amount_msat * arrays.time_lock * LND_RISK_FACTOR_BILLIONTHS / 1000000000 + \
+            penalty / probability
+
+
+class CLightningCostModel(CostModel):
+    """
+        Class used to approximate the getroute of c-lightning, i.e. the fee of the channel plus the risk of locking the
+        amount during the time lock of the channel given by the risk factor, and 1 msat per hop that favors the
+        shortest routes. The random fuzz of the fees is not applied, so the routes are repeatable
+    """
+    name = 'c-lightning'
+
+    def __init__(self, risk_factor: float = CLIGHTNING_RISK_FACTOR):
+        """
+
+        :param risk_factor: annual percentage charged for locking the amount
+        """
+        self.risk_factor = risk_factor
+
+    def costs(self, arrays: ChannelArrays, amount_msat: int, fees: np.ndarray) -> np.ndarray:
+        return fees + 1 + amount_msat * arrays.time_lock * self.risk_factor / CLIGHTNING_BLOCKS_PER_YEAR / 100
+
+
+class EclairCostModel(CostModel):
+    """
+        Class used to approximate the weight ratios of eclair, i.e. the fee and the cost of the hop weighted by the
+        time lock, the age (block height of the channel id) and the capacity of the channel normalized between their
+        bounds, where the newest channel of the snapshot sets the current block height
+    """
+    name = 'eclair'
+
+    def costs(self, arrays: ChannelArrays, amount_msat: int, fees: np.ndarray) -> np.ndarray:
+        def normalize(values, low, high):
+            return np.clip((values - low) / (high - low), 0.00001, 0.99999)
+
+        current_height = int(arrays.height.max()) if len(arrays.height) else 0
+        factor = ECLAIR_BASE_RATIO + \
+            ECLAIR_CLTV_RATIO * normalize(arrays.time_lock, ECLAIR_CLTV_LOW, ECLAIR_CLTV_HIGH) + \
+            ECLAIR_AGE_RATIO * normalize(arrays.height, current_height - ECLAIR_BLOCK_TIME_TWO_MONTHS,
+                                         current_height) + \
+            ECLAIR_CAPACITY_RATIO * (1 - normalize(arrays.capacity * 1000., ECLAIR_CAPACITY_LOW_MSAT,
+                                                   ECLAIR_CAPACITY_HIGH_MSAT))
+        return (fees + ECLAIR_HOP_COST_BASE_MSAT + amount_msat * ECLAIR_HOP_COST_PPM / 1000000) * factor
+
+
+# Cost models by implementation, as the keys of the test file
+MODELS = {'lnd': LndCostModel(), 'c-lightning': CLightningCostModel(), 'eclair': EclairCostModel()}
+
+
+def query_route_model(graph1: nx, graph2: nx, node_origin: str, node_destiny: str, payment_amount: int,
+                      implementation: str) -> route_pay.Payment:
+    """
+    Creates the structure that contains the payment of the route that the cost model of an implementation finds on the
+    snapshot, instead of querying a node of the implementation
+
+    :param graph1: contains detailed data about the network
+    :param graph2: contains specific data about the network
+    :param node_origin: pub key of the node origin
+    :param node_destiny: pub key of the node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param implementation: name of the implementation (lnd, c-lightning or eclair)
+    :return: Payment that contains data about both nodes and route, totals (amt, fee, time lock and success
+    probability)
+    """
+    cost_index = spy.get_cost_index(graph2, payment_amount, MODELS[implementation])
+    try:
+        path = next(spy.yen_paths(graph2, node_origin, node_destiny, payment_amount, cost_index))
+    except nx.NodeNotFound as e:
+        print('%s%s*** ERROR ON %s COST MODEL: %s' % (utils.spaces, utils.spaces, implementation.upper(), e))
+        return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                 error="Nodes not found - %s MODEL - either node is not in graph" %
+                                       implementation.upper())
+    except nx.NetworkXNoPath:
+        return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                 error="Route not found - %s MODEL - no path between both nodes" %
+                                       implementation.upper())
+    return spy.create_payment(graph1, graph2, node_origin, node_destiny, payment_amount, path,
+                              spy.evaluate_paths(graph2, [path], payment_amount, cost_index)[0])
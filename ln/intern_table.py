@@ -0,0 +1,84 @@
+import weakref
+import networkx as nx
+
+# Intern tables of each graph, they are released along with the graph
+intern_tables = weakref.WeakKeyDictionary()
+
+
+class InternTable:
+    """
+        Class used to intern the nodes (pub keys) of a graph, i.e. to map them to dense integers in the order in which
+        they were added to the graph, thus, the modules that lay out the graph on arrays share the same positions
+        instead of numbering the nodes on their own. The table also keeps a single copy of each pub key, so the
+        dictionaries of the graph and the edges that refer to a node share its string. The ids are only used by the
+        array indexes (sparse_graph, landmarks and contraction_hierarchy), whereas g1, g2, nodeDict, edgeDict, the
+        balances and the pending htlcs stay keyed by the pub keys, as the connectors, the test files and the results
+    """
+
+    def __init__(self):
+        """
+        Sets the empty table
+        """
+        # Pub key by id and id by pub key
+        self.nodes = []
+        self.node_ids = {}
+
+    def add_node(self, pub_key: str) -> str:
+        """
+        Adds a node to the table if it is not there yet
+
+        :param pub_key: pub key of the node
+        :return: copy of the pub key kept by the table
+        """
+        node_id = self.node_ids.get(pub_key)
+        if node_id is None:
+            self.node_ids[pub_key] = len(self.nodes)
+            self.nodes.append(pub_key)
+            return pub_key
+        return self.nodes[node_id]
+
+    def get_node(self, pub_key: str) -> str:
+        """
+        Gets the copy of a pub key kept by the table
+
+        :param pub_key: pub key of the node
+        :return: pub key kept by the table, the given one if the node is not on the table
+        """
+        node_id = self.node_ids.get(pub_key)
+        return pub_key if node_id is None else self.nodes[node_id]
+
+    @classmethod
+    def build(cls, graph: nx):
+        """
+        Builds the table of a graph that was not loaded by means of the graph builder
+
+        :param graph: structure that contains the whole data about the network
+        :return: InternTable
+        """
+        table = cls()
+        for node in graph.nodes:
+            table.add_node(node)
+        return table
+
+
+def get_intern_table(graph: nx) -> InternTable:
+    """
+    Gets the intern table of a graph, it is set when the graph is loaded and built again if nodes were added since
+
+    :param graph: structure that contains the whole data about the network
+    :return: InternTable
+    """
+    table = intern_tables.get(graph)
+    if table is None or len(table.nodes) != graph.number_of_nodes():
+        table = intern_tables[graph] = InternTable.build(graph)
+    return table
+
+
+def set_intern_table(graph: nx, table: InternTable):
+    """
+    Sets the intern table of a graph that was filled while the graph was built
+
+    :param graph: structure that contains the whole data about the network
+    :param table: table of the nodes of the graph
+    """
+    intern_tables[graph] = table
@@ -0,0 +1,172 @@
+import os
+import math
+import numpy as np
+import networkx as nx
+from ln import utils as utils, intern_table as intern_table
+
+# Version of the layout of the landmark tables stored on disk
+TABLES_VERSION = 1
+
+
+def lower_bound_graph(graph: nx) -> nx.DiGraph:
+    """
+    Creates a directed graph with the lowest cost that the channels between each pair of nodes may have. The cost of a
+    pair of nodes is given by the fee_base_msat and min_htlc of one of the policies of its channels, thus, the lowest
+    value among all the policies does not depend on the payment amount nor on the balances
+
+    :param graph: structure that contains the whole data about the network
+    :return: directed graph with the lower bound of the cost as weight
+    """
+    bounds = nx.DiGraph()
+    bounds.add_nodes_from(graph)
+    for u, nbrs in graph.adj.items():
+        for v, channels in nbrs.items():
+            weight = math.inf
+            for channel in channels.values():
+                for name in ('policy_source', 'policy_dest'):
+                    policy = channel.get(name)
+                    if policy is not None:
+                        min_htlc = 1 if 'min_htlc' not in policy else policy['min_htlc']
+                        weight = min(weight, policy['fee_base_msat'] + min_htlc)
+            if weight < math.inf:
+                bounds.add_edge(u, v, weight=weight)
+
+    return bounds
+
+
+class Landmarks:
+    """
+        Class used to gather the lower bounds of the costs from each landmark to every node and from every node to each
+        landmark. By means of the triangle inequality those bounds give an admissible and consistent heuristic for the
+        A* search (ALT), so the paths found are the ones found by Dijkstra (shortest_path_yen.shortest_path)
+    """
+
+    def __init__(self, nodes: list, landmarks: list, from_landmarks: np.ndarray, to_landmarks: np.ndarray):
+        """
+
+        :param nodes: nodes of the network
+        :param landmarks: nodes chosen as landmarks
+        :param from_landmarks: matrix landmarks x nodes with the lower bound of the cost from each landmark
+        :param to_landmarks: matrix landmarks x nodes with the lower bound of the cost to each landmark
+        """
+        self.nodes = list(nodes)
+        self.landmarks = list(landmarks)
+        self.from_landmarks = from_landmarks
+        self.to_landmarks = to_landmarks
+        self.positions = {node: pos for pos, node in enumerate(self.nodes)}
+        # Bounds of each node as a tuple (from each landmark, to each landmark) to evaluate the heuristic on lists
+        self.bounds = dict(zip(self.nodes, zip(*from_landmarks.tolist(), *to_landmarks.tolist())))
+
+    @classmethod
+    def build(cls, graph: nx, num_landmarks: int):
+        """
+        Chooses the landmarks and computes their lower bounds. The first landmark is the node with the highest degree
+        and the following ones are the farthest nodes from the landmarks already chosen
+
+        :param graph: structure that contains the whole data about the network
+        :param num_landmarks: number of landmarks to choose
+        :return: Landmarks
+        """
+        bounds = lower_bound_graph(graph)
+        reverse = bounds.reverse(copy=False)
+        nodes = intern_table.get_intern_table(graph).nodes
+        landmarks = []
+        from_landmarks = np.full((num_landmarks, len(nodes)), np.inf)
+        to_landmarks = np.full((num_landmarks, len(nodes)), np.inf)
+        nearest = dict.fromkeys(nodes, math.inf)
+        landmark = max(nodes, key=lambda n: graph.degree(n)) if nodes else None
+        while landmark is not None and len(landmarks) < num_landmarks:
+            i = len(landmarks)
+            landmarks.append(landmark)
+            distances_from = nx.single_source_dijkstra_path_length(bounds, landmark)
+            distances_to = nx.single_source_dijkstra_path_length(reverse, landmark)
+            for pos, node in enumerate(nodes):
+                from_landmarks[i, pos] = distances_from.get(node, np.inf)
+                to_landmarks[i, pos] = distances_to.get(node, np.inf)
+                nearest[node] = min(nearest[node], distances_from.get(node, math.inf))
+            candidates = [n for n in nodes if n not in landmarks and nearest[n] < math.inf]
+            landmark = max(candidates, key=lambda n: nearest[n]) if candidates else None
+
+        return cls(nodes, landmarks, from_landmarks[:len(landmarks)], to_landmarks[:len(landmarks)])
+
+    def heuristic(self, target: str):
+        """
+        Creates the heuristic of the A* search towards a target node, i.e. the highest lower bound given by the
+        landmarks of the cost between a node and the target node
+
+        :param target: node destiny
+        :return: function that returns the estimated cost from a node to the target node
+        """
+        num = len(self.landmarks)
+        target_bounds = self.bounds.get(target)
+        if target_bounds is None:
+            return lambda u, v: 0
+        # Only the finite bounds of the target node are useful: d(L, t) - d(L, u) and d(u, L) - d(t, L)
+        terms = [(i, target_bounds[i], 1) for i in range(num) if target_bounds[i] < math.inf] + \
+                [(num + i, target_bounds[num + i], -1) for i in range(num) if target_bounds[num + i] < math.inf]
+
+        def estimate(u, v):
+            node_bounds = self.bounds.get(u)
+            if node_bounds is None:
+                return 0
+            h = 0
+            for i, target_bound, sign in terms:
+                bound = node_bounds[i]
+                if bound < math.inf:
+                    h = max(h, sign * (target_bound - bound))
+            return h
+
+        return estimate
+
+    def save(self, path: str, signature: list):
+        """
+        Stores the landmark tables on a compressed numpy file
+
+        :param path: path of the file
+        :param signature: values of the snapshot from which the tables were built (size and modification time)
+        """
+        np.savez_compressed(path, version=np.array([TABLES_VERSION] + list(signature), dtype=np.float64),
+                            nodes=np.array(self.nodes, dtype=str), landmarks=np.array(self.landmarks, dtype=str),
+                            from_landmarks=self.from_landmarks, to_landmarks=self.to_landmarks)
+
+    @classmethod
+    def load(cls, path: str, signature: list):
+        """
+        Loads the landmark tables from a compressed numpy file
+
+        :param path: path of the file
+        :param signature: values of the snapshot expected on the tables (size and modification time)
+        :return: Landmarks, None if the file does not exist or was built from another snapshot
+        """
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if data['version'].tolist() != [TABLES_VERSION] + list(signature):
+                    return None
+                return cls(data['nodes'].tolist(), data['landmarks'].tolist(), data['from_landmarks'],
+                           data['to_landmarks'])
+        except (OSError, KeyError, ValueError):
+            return None
+
+
+def get_landmarks(graph: nx, location: str, file_name: str, num_landmarks: int) -> Landmarks:
+    """
+    Gets the landmarks of a snapshot, the tables are reloaded from the file stored next to the snapshot, and they are
+    built again (and stored) only when the snapshot or the number of landmarks changed
+
+    :param graph: structure that contains the whole data about the network
+    :param location: directory in which the snapshot is located
+    :param file_name: name of the snapshot
+    :param num_landmarks: number of landmarks to choose
+    :return: Landmarks
+    """
+    signature = utils.get_file_signature(location, file_name) + [num_landmarks]
+    path = os.path.join(location, os.path.splitext(file_name)[0] + '_landmarks.npz')
+    landmarks = Landmarks.load(path, signature)
+    if landmarks is None or set(landmarks.nodes) != set(graph.nodes):
+        print('%sINFO: building %s landmarks of %s' % (utils.spaces, num_landmarks, file_name))
+        landmarks = Landmarks.build(graph, num_landmarks)
+        landmarks.save(path, signature)
+    else:
+        print('%sINFO: landmarks of %s loaded from %s' % (utils.spaces, file_name, path))
+
+    return landmarks
@@ -10,6 +10,17 @@ import ln.lightning_pb2 as ln
 import ln.utils as utils
 from datetime import datetime
 import ln.shortest_path_yen as spy
+import ln.shortest_path_tree as spt
+import ln.landmarks as lm
+import ln.contraction_hierarchy as ch
+import ln.route_cache as rc
+import ln.route_pool as rpool
+import ln.sparse_graph as sg
+import ln.channel_index as ci
+import ln.constrained_path as cp
+import ln.cost_model as cm
+import ln.multi_path as mp
+import ln.snapshot as snapshot
 import ln.route_payment as route_pay
 from ln.connector import lnd_client as lnd, clightning_client as clight, eclair_client as eclair
 
@@ -23,10 +34,10 @@ IMPL_COLLIDING = "colliding"
 IMPL_NODE = "IMPLEMENTATION/NODE_NAME"
 
 IMPLEMENTATION_PARAMS = {
-    IMPL_C_LIGHTNING: {'time_lock_delta': 14, 'fee_base_msat': '1000', 'fee_rate_milli_msat': '10'},
-    IMPL_LND: {'time_lock_delta': 144, 'fee_base_msat': '1000', 'fee_rate_milli_msat': '1'},
-    IMPL_LND_0_6: {'time_lock_delta': 40, 'fee_base_msat': '1000', 'fee_rate_milli_msat': '1'},
-    IMPL_ECLAIR: {'time_lock_delta': 144, 'fee_base_msat': '1000', 'fee_rate_milli_msat': '100'}
+    IMPL_C_LIGHTNING: {'time_lock_delta': 14, 'fee_base_msat': 1000, 'fee_rate_milli_msat': 10},
+    IMPL_LND: {'time_lock_delta': 144, 'fee_base_msat': 1000, 'fee_rate_milli_msat': 1},
+    IMPL_LND_0_6: {'time_lock_delta': 40, 'fee_base_msat': 1000, 'fee_rate_milli_msat': 1},
+    IMPL_ECLAIR: {'time_lock_delta': 144, 'fee_base_msat': 1000, 'fee_rate_milli_msat': 100}
 }
 
 
@@ -49,6 +60,17 @@ def get_key_hops_block_make_payment(payment: route_pay.Payment, is_block: bool):
     return key_hops
 
 
+def get_payment_parts(payment: route_pay.Payment) -> list:
+    """
+    Delivers the payments of a single route that make up a payment, i.e. the parts of a multi path payment or the
+    payment itself
+
+    :param payment: structure for the payment with the hops
+    :return: list of route_payment.Payment
+    """
+    return payment.parts if isinstance(payment, route_pay.MultiPathPayment) else [payment]
+
+
 class LNPayment:
     """
         Structure used as main body of the simulation, it handles either the initial configuration to connect to a node
@@ -67,6 +89,14 @@ class LNPayment:
         self.port = 0
         self.macaroon = self.cert = self.secure_channel = None
         self.payments = None
+        self.route_batch = None
+        self.landmarks = None
+        self.hierarchy = None
+        self.route_cache = None
+        self.route_pool = None
+        self.spur_pool = None
+        self.sparse_graph = None
+        self.channel_index = None
         self.implementation = implementation
         self.balance = balance
         self.htlc = htlc
@@ -110,14 +140,17 @@ class LNPayment:
         # The user has the option to get data from either the network or a snapshot
         self.is_snapshot = True if input('Load from Snapshot? (y/n):') == 'y' else False
         data = None
+        graphs = None
         while True:
             try:
                 # Function to set the initial params to get data from the network: mainnet, testnet or regtest
                 self.__set_param_node(is_snapshot=self.is_snapshot)
 
                 if self.is_snapshot:
-                    # Function to load data from a json file and set its initial values
-                    data = utils.load_file(self.location, self.name, True)
+                    # Function to stream the nodes and edges of a json file into g1 and g2 setting their initial values
+                    graphs = snapshot.load_graphs(self.location, self.name, True,
+                                                  is_cache=self.parameters["snapshot_cache"],
+                                                  is_stats=self.parameters["build_stats"])
                 else:
                     # Function to load g1 and g2 based on the network connected
                     data = lnd.describe_graph(self.macaroon, self.secure_channel, True, self.parameters)
@@ -133,16 +166,43 @@ class LNPayment:
                 break
 
         # Gets the aim values for the simulations, specifically the dictionaries for the node and edge
-        if 'nodes' in data and 'edges' in data:
-            self.g1, self.g2, self.nodeDict, self.edgeDict = utils.populate_graphs(data)
+        if data is not None and 'nodes' in data and 'edges' in data:
+            graphs = utils.populate_graphs(data, self.parameters["build_stats"])
+        if graphs is not None:
+            self.g1, self.g2, self.nodeDict, self.edgeDict = graphs
+            # The payments print their hops by means of the same dictionaries instead of building them per route
+            spy.set_hop_index(self.g2, self.nodeDict, self.edgeDict)
+            if self.parameters["alt_landmarks"] > 0:
+                # Lower bounds of the landmarks used by the A* search (ALT) of the Yen's algorithm
+                self.landmarks = lm.get_landmarks(self.g2, self.location, self.name,
+                                                  self.parameters["alt_landmarks"]) if self.is_snapshot else \
+                    lm.Landmarks.build(self.g2, self.parameters["alt_landmarks"])
+            if self.parameters["sparse_routing"]:
+                # CSR arrays of g2 used to find the routes by means of scipy
+                self.sparse_graph = sg.get_sparse_graph(self.g2)
+            if self.parameters["feasibility_prefilter"]:
+                # Channels of g2 sorted by balance used to skip the pairs of nodes that can not forward the payments
+                self.channel_index = ci.get_channel_index(self.g2)
+            if self.parameters["contraction_hierarchy"]:
+                # Contraction hierarchy used to find the seed path of the Yen's algorithm
+                self.hierarchy = ch.get_contraction_hierarchy(self.g2, self.location, self.name) \
+                    if self.is_snapshot else ch.ContractionHierarchy.build(self.g2)
+            if self.is_snapshot and self.parameters["spur_processes"] > 0 and rpool.is_available():
+                # Pool of processes that runs the spur searches of each round of the Yen's algorithm
+                self.spur_pool = rpool.SpurPool(self.g2, self.parameters["spur_processes"], self.landmarks,
+                                                self.sparse_graph, self.channel_index)
 
             self.__infer_implementation(self.implementation)
             self.__assign_rand_balances(self.balance)
             self.__assign_rand_htlc(self.htlc)
 
-            self.__start_payment()
+            try:
+                self.__start_payment()
 
-            self.__check_correctness()
+                self.__check_correctness()
+            finally:
+                if self.spur_pool is not None:
+                    self.spur_pool.close()
 
         if self.payments is not None:
             utils.save_file(self.location, self.parameters["results_file"], jsonpickle.encode(self.payments))
@@ -338,6 +398,7 @@ class LNPayment:
                 assigned_channels[e[2]["channel_id"]] = e[2]["capacity"] - e[2]["balance"]
             else:
                 e[2]["balance"] = assigned_channels[e[2]["channel_id"]]
+        utils.update_graph_version(self.g2)
 
     @staticmethod
     def __check_htlc_config(config):
@@ -390,6 +451,7 @@ class LNPayment:
             htlc_dict, amounts = rand_func(e)
             e[2]["pending_htlc"] = htlc_dict
             e[2]["balance"] = e[2]["balance"] - amounts
+        utils.update_graph_version(self.g2)
 
     def __check_correctness(self):
         """
@@ -665,7 +727,8 @@ class LNPayment:
 
     def block_payment(self, payment: route_pay.Payment, is_node_policy: bool):
         """
-        Sets the structure for htlcs with the blocked amount and decreases/increases balances
+        Sets the structure for htlcs with the blocked amount and decreases/increases balances. The parts of a multi
+        path payment share the payment hash, and they are only blocked when the balances can carry all of them
 
         :param payment: as returned by queryroute
         :param is_node_policy: as check of a node policy
@@ -674,12 +737,21 @@ class LNPayment:
             the payment status at this time is IN_FLIGHT
         """
         if payment.error is None:
+            if isinstance(payment, route_pay.MultiPathPayment) and \
+                    mp.get_excess_balances(self.g2, self.edgeDict, payment.parts):
+                # The parts of a multi path payment are blocked together or none of them is blocked
+                payment.error = "Balance not available - MPP - the parts exceed the balance of a channel"
+                print("%sERROR ON BLOCK PAYMENT: %s" % (utils.spaces, payment.error))
+                return
             print('%s***** BEGIN OF BLOCK PAYMENT *****' % utils.spaces)
             payment_hash, preimage = utils.request_payment_hash_destiny(payment.pubkey_destiny)
             payment.payment_hash = payment_hash
             payment.creation_time_ns = time.time_ns()
+            for part in get_payment_parts(payment):
+                part.payment_hash = payment_hash
+                part.creation_time_ns = payment.creation_time_ns
 
-            for h in payment.routes[0].hops:
+            for h in [h for part in get_payment_parts(payment) for h in part.routes[0].hops]:
                 label_edge = "{}-{}".format(h.channel_id, h.pub_key)
                 if label_edge in self.edgeDict:
                     edge = self.edgeDict[label_edge]
@@ -729,11 +801,14 @@ class LNPayment:
 
                     e[label_edge]['capacity'] = e[label_edge]['capacity'] - (htlc.htlc_payment.hop.amt_2_fwrd +
                                                                              htlc.htlc_payment.hop.fee)
+                    utils.update_graph_version(self.g2, edge[0], edge[1])
             print('%s***** END OF BLOCK PAYMENT *****' % utils.spaces)
 
     def make_payment(self, payment: route_pay.Payment):
         """
-        Unblocks htlcs and make payment (increases balances to the receiving party)
+        Unblocks htlcs and make payment (increases balances to the receiving party), the parts of a multi path payment
+        are either paid or reversed together. A multi path payment is only simulated on g2, it is not sent through the
+        implementations (make_payment_implementation), since their connectors send a payment along a single route
 
         :param payment:
         :return:
@@ -754,7 +829,7 @@ class LNPayment:
             if diff_time_ns < timeout:
                 print('{}***** BEGIN OF PAYMENT *****'.format(utils.spaces))
 
-                for h in reversed(payment.routes[0].hops):
+                for h in [h for part in get_payment_parts(payment) for h in reversed(part.routes[0].hops)]:
                     label_edge = "{}-{}".format(h.channel_id, h.pub_key)
                     if label_edge in self.edgeDict:
                         edge = self.edgeDict[label_edge]
@@ -764,7 +839,9 @@ class LNPayment:
                         # Update the channel data with the payment and unblock htlc
                         for pvt in e[label_edge]['htlc']:
                             htlc = e[label_edge]['htlc'][pvt]
+                            # The parts of a multi path payment share the hash, so each htlc is matched to its hop
                             if htlc['payment_preimage'] is not None and htlc['payment_hash'] == payment.payment_hash \
+                                    and htlc['htlc_payment'].hop is h \
                                     and utils.check_preimage_hash(htlc['payment_preimage'], htlc['payment_hash']):
                                 print('%s%sUNBLOCK ON THE CHANNEL_ID: %s FROM %s TO %s' % (utils.spaces, utils.spaces,
                                                                                            label_edge,
@@ -800,8 +877,11 @@ class LNPayment:
                                                                      4), 4)
                                 payment_party['capacity'] = payment_party['capacity'] + float(h.amt_2_fwrd if h.fee == 0
                                                                                               else h.fee)
+                                utils.update_graph_version(self.g2, edge[1], edge[0])
 
-                if not self.is_snapshot and self.is_manual_test != 'y':
+                # The connectors send a payment along a single route, so the parts of a multi path payment are not sent
+                if not self.is_snapshot and self.is_manual_test != 'y' and \
+                        not isinstance(payment, route_pay.MultiPathPayment):
                     print('%s==============================================' % utils.spaces)
                     self.make_payment_implementation(payment)
 
@@ -865,13 +945,13 @@ class LNPayment:
     def reverse_payment(self, payment: route_pay.Payment):
         """
         Reverse a payment established through the block and pay functions that calculate the balances in the forward
-        and backward channels for each hop in a route
+        and backward channels for each hop in a route (of every part of a multi path payment)
 
         :param payment: payment sent from an origin node to a destiny node
         :return:
         """
         if payment.error is None:
-            for h in payment.routes[0].hops:
+            for h in [h for part in get_payment_parts(payment) for h in part.routes[0].hops]:
                 label_edge = "{}-{}".format(h.channel_id, h.pub_key)
                 if label_edge in self.edgeDict:
                     edge = self.edgeDict[label_edge]
@@ -879,7 +959,8 @@ class LNPayment:
 
                     for pvt in e[label_edge]['htlc']:
                         htlc = e[label_edge]['htlc'][pvt]
-                        if htlc['payment_preimage'] is not None and htlc['payment_hash'] == payment.payment_hash:
+                        if htlc['payment_preimage'] is not None and htlc['payment_hash'] == payment.payment_hash \
+                                and htlc['htlc_payment'].hop is h:
                             print('%s REVERSE PAYMENT ON THE CHANNEL_ID: %s FROM %s TO %s' % (utils.spaces, label_edge,
                                                                                               self.nodeDict[edge[1]][
                                                                                                   'alias'],
@@ -901,6 +982,7 @@ class LNPayment:
                             e[label_edge]['capacity'] = e[label_edge]['capacity'] + (
                                     htlc['htlc_payment'].hop.amt_2_fwrd +
                                     htlc['htlc_payment'].hop.fee)
+                            utils.update_graph_version(self.g2, edge[0], edge[1])
 
     def __start_payment(self):
         """
@@ -930,8 +1012,24 @@ class LNPayment:
                                                    payment_amount, is_manual_test=True)
                     else:
                         print("{}{}***** YEN'S ALGORITHM *****".format(utils.spaces, utils.spaces))
-                        payment = spy.query_route_yen(self.g1, self.g2, node_origin, node_destiny, payment_amount,
-                                                      self.parameters["num_k"], is_manual_test=True)
+                        if self.parameters["multi_path_parts"] > 0:
+                            payment = mp.query_route_multi_path(self.g1, self.g2,
+                                                                utils.get_pubkey_alias(node_origin, self.g1),
+                                                                utils.get_pubkey_alias(node_destiny, self.g1),
+                                                                payment_amount, self.parameters["multi_path_parts"])
+                        elif self.__has_route_limits():
+                            payment = cp.query_route_constrained(self.g1, self.g2,
+                                                                 utils.get_pubkey_alias(node_origin, self.g1),
+                                                                 utils.get_pubkey_alias(node_destiny, self.g1),
+                                                                 payment_amount, self.parameters["fee_limit"] or None,
+                                                                 self.parameters["cltv_limit"] or None,
+                                                                 self.landmarks, self.channel_index)
+                        else:
+                            payment = spy.query_route_yen(self.g1, self.g2, node_origin, node_destiny,
+                                                          payment_amount, self.parameters["num_k"],
+                                                          is_manual_test=True, landmarks=self.landmarks,
+                                                          hierarchy=self.hierarchy, sparse_graph=self.sparse_graph,
+                                                          channel_index=self.channel_index, spur_pool=self.spur_pool)
 
                 if payment is not None:
                     self.block_payment(payment, True if is_node_policy == 'y' else False)
@@ -947,12 +1045,12 @@ class LNPayment:
             if self.is_snapshot:
                 utils.create_test_file(self.g1, self.parameters['connector'], self.parameters["num_routes"],
                                        self.parameters["max_amount"], self.location, self.parameters["test_file"],
-                                       self.is_snapshot)
+                                       self.is_snapshot, self.__get_route_baselines())
             else:
                 if input("DO YOU WANT TO CREATE A TEST FILE? (y/n): ") == "y":
                     utils.create_test_file(self.g1, self.parameters['connector'], self.parameters["num_routes"],
                                            self.parameters["max_amount"], self.location, self.parameters["test_file"],
-                                           self.is_snapshot)
+                                           self.is_snapshot, self.__get_route_baselines())
 
             message = input("DESCRIBE THE TYPE OF TEST?\n")
             message = datetime.now().strftime("%m/%d/%Y, %H:%M:%S") + '---' + message
@@ -965,18 +1063,123 @@ class LNPayment:
             self.payments = {"0": message}
             self.payments.update(payments)
 
+    def query_route_yen(self, node_origin: str, node_destiny: str, payment_amount: int, is_reverse: bool = False):
+        """
+        Gets the route of a payment through the Yen's algorithm, or through the shortest path trees of the batch of
+        routes when route_batch is set on parameters.json, in which case the routes are grouped by node origin (or by
+        node destiny for reverse routes). When route_cache is set on parameters.json, the routes found are kept and
+        reused by the following payments between the same pair of nodes. When route_processes is set on
+        parameters.json, the routes found in advance by the pool of processes are used while they are still valid. When
+        fee_limit or cltv_limit is set on parameters.json, the route is the cheapest one within both limits. When
+        multi_path_parts is set on parameters.json, the amount is split into several routes by a min cost flow over
+        the balances of g2 (multi_path.query_route_multi_path) instead. When spur_processes is set on parameters.json,
+        the spur searches of each round of the Yen's algorithm run on a pool of processes
+
+        :param node_origin: pub key of the node origin
+        :param node_destiny: pub key of the node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the route goes back from the destiny of a route in the test file to its origin
+        :return: route_payment.Payment
+        """
+        def query():
+            if self.__has_route_limits():
+                return cp.query_route_constrained(self.g1, self.g2, node_origin, node_destiny, payment_amount,
+                                                  self.parameters["fee_limit"] or None,
+                                                  self.parameters["cltv_limit"] or None, self.landmarks,
+                                                  self.channel_index)
+            if self.route_pool is not None:
+                payment = self.route_pool.query_route(node_origin, node_destiny, payment_amount, is_reverse)
+                if payment is not None:
+                    return payment
+            if self.route_batch is not None:
+                return self.route_batch.query_route(node_origin, node_destiny, payment_amount, is_reverse)
+            return spy.query_route_yen(self.g1, self.g2, node_origin, node_destiny, payment_amount,
+                                       self.parameters["num_k"], landmarks=self.landmarks, hierarchy=self.hierarchy,
+                                       sparse_graph=self.sparse_graph, channel_index=self.channel_index,
+                                       spur_pool=self.spur_pool)
+
+        if self.parameters["multi_path_parts"] > 0:
+            # The parts depend on the balances at the time of the payment, so they are neither cached nor found ahead
+            return mp.query_route_multi_path(self.g1, self.g2, node_origin, node_destiny, payment_amount,
+                                             self.parameters["multi_path_parts"])
+        if self.route_cache is not None:
+            return self.route_cache.query_route(node_origin, node_destiny, payment_amount, query)
+        return query()
+
+    def __get_route_baselines(self):
+        """
+        Gets the function that computes at once the cost of the shortest path within the max number of hops of a batch
+        of routes when route_baselines is set on parameters.json
+
+        :return: function of a list of routes (origin, destiny, amount), None if route_baselines is not set
+        """
+        if not self.parameters["route_baselines"]:
+            return None
+        return sg.get_sparse_graph(self.g2).route_baselines
+
+    def __has_route_limits(self) -> bool:
+        """
+        Checks whether the routes must keep their fees and time lock within the fee_limit and cltv_limit of
+        parameters.json
+
+        :return: bool
+        """
+        return self.parameters["fee_limit"] > 0 or self.parameters["cltv_limit"] > 0
+
+    def __get_payments_model(self, implementation: str, route: dict, payments: dict, index: utils.Counter):
+        """
+        Gets the payments of a route of the test file (and its inverse route) found by the offline cost model of an
+        implementation on the snapshot instead of querying its node, and blocks them as the payments of the connectors
+
+        :param implementation: name of the implementation (lnd, c-lightning or eclair)
+        :param route: route of the test file (origin, destiny and amount)
+        :param payments: payments gathered so far
+        :param index: counter of the payments
+        """
+        for node_origin, node_destiny in ((route["origin"], route["destiny"]), (route["destiny"], route["origin"])):
+            payments[str(index.preinc())] = cm.query_route_model(self.g1, self.g2, node_origin, node_destiny,
+                                                                 route["amount"], implementation)
+            self.block_payment(payments[index.__str__()], True)
+
     def get_payments_queryroute(self):
         """
         Invokes the connectors as well as the Yen's algorithm to get the query routes from source to destiny and its
         inverse route creates. Additionally, it the payment structures to perform the block payment and its
         corresponding payment. For each connector, the simulation reads the values from the test.json file to get
         the data about the different types of nodes (lnd, eclair and c-lightning.). That data is used to set the
-        parameter's nodes
+        parameter's nodes. When offline_models is set on parameters.json, the connectors are emulated on snapshot mode
+        by the cost model of each implementation (cost_model.MODELS)
 
         :return: list of route_payment.Payment
         """
         index = utils.Counter()
         payments = {}
+        baselines = self.__get_route_baselines()
+        if baselines is not None:
+            # Reachability of the routes of the test file (both ways) within the max number of hops in a single pass
+            routes = [r for key, value in self.tests.items() if value["flag"] for route in value["routes"]
+                      for r in ((route["origin"], route["destiny"], route["amount"]),
+                                (route["destiny"], route["origin"], route["amount"]))]
+            costs = baselines(routes)
+            print("INFO: {} of {} routes reached within {} hops".format(int(np.isfinite(costs).sum()), len(routes),
+                                                                      sg.MAX_HOPS))
+        # The shortest path trees do not depend on the balances, thus, they are not used along with the channel index,
+        # nor along with the limits of the routes
+        self.route_batch = spt.RouteBatch(self.g1, self.g2, self.sparse_graph) \
+            if self.parameters["route_batch"] and self.channel_index is None and not self.__has_route_limits() \
+            else None
+        if self.route_cache is None and self.parameters["route_cache"] > 0:
+            self.route_cache = rc.RouteCache(self.g1, self.g2, self.parameters["route_cache"], self.channel_index)
+        if self.is_snapshot and self.parameters["route_processes"] > 0 and rpool.is_available() \
+                and not self.__has_route_limits() and self.parameters["multi_path_parts"] == 0:
+            # The routes are found in advance on a pool of processes, whereas the payments are blocked on this process
+            self.route_pool = rpool.RoutePool(self.g1, self.g2, self.parameters["num_k"],
+                                              self.parameters["route_processes"], self.route_batch is not None,
+                                              self.landmarks, self.hierarchy, self.sparse_graph, self.channel_index)
+            self.route_pool.submit([r for key, value in self.tests.items() if value["flag"]
+                                    for route in value["routes"]
+                                    for r in ((route["origin"], route["destiny"], route["amount"], False),
+                                              (route["destiny"], route["origin"], route["amount"], True))])
         for key, value in self.tests.items():
             if key == "lnd" and value["flag"]:
                 print("********** LND **********")
@@ -999,14 +1202,15 @@ class LNPayment:
                                                                          route["amount"])
                         self.block_payment(payments[index.__str__()], True)
 
-                    payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["origin"],
-                                                                        route["destiny"], route["amount"],
-                                                                        self.parameters["num_k"])
+                    if self.is_snapshot and self.parameters["offline_models"]:
+                        self.__get_payments_model(key, route, payments, index)
+
+                    payments[str(index.preinc())] = self.query_route_yen(route["origin"], route["destiny"],
+                                                                         route["amount"])
                     self.block_payment(payments[index.__str__()], True)
 
-                    payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["destiny"],
-                                                                        route["origin"], route["amount"],
-                                                                        self.parameters["num_k"])
+                    payments[str(index.preinc())] = self.query_route_yen(route["destiny"], route["origin"],
+                                                                         route["amount"], is_reverse=True)
                     self.block_payment(payments[index.__str__()], True)
             else:
                 if key == "eclair" and value["flag"]:
@@ -1022,14 +1226,15 @@ class LNPayment:
                                                                                     value["node"]["passwd"])
                                 self.block_payment(payments[index.__str__()], True)
 
-                        payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["origin"],
-                                                                            route["destiny"], route["amount"],
-                                                                            self.parameters["num_k"])
+                        if self.is_snapshot and self.parameters["offline_models"]:
+                            self.__get_payments_model(key, route, payments, index)
+
+                        payments[str(index.preinc())] = self.query_route_yen(route["origin"], route["destiny"],
+                                                                             route["amount"])
                         self.block_payment(payments[index.__str__()], True)
 
-                        payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["destiny"],
-                                                                            route["origin"], route["amount"],
-                                                                            self.parameters["num_k"])
+                        payments[str(index.preinc())] = self.query_route_yen(route["destiny"], route["origin"],
+                                                                             route["amount"], is_reverse=True)
                         self.block_payment(payments[index.__str__()], True)
                 else:
                     if key == "c-lightning" and value["flag"]:
@@ -1052,14 +1257,15 @@ class LNPayment:
                                                                                     route["amount"])
                                 self.block_payment(payments[index.__str__()], True)
 
-                            payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["origin"],
-                                                                                route["destiny"], route["amount"],
-                                                                                self.parameters["num_k"])
+                            if self.is_snapshot and self.parameters["offline_models"]:
+                                self.__get_payments_model(key, route, payments, index)
+
+                            payments[str(index.preinc())] = self.query_route_yen(route["origin"], route["destiny"],
+                                                                                 route["amount"])
                             self.block_payment(payments[index.__str__()], True)
 
-                            payments[str(index.preinc())] = spy.query_route_yen(self.g1, self.g2, route["destiny"],
-                                                                                route["origin"], route["amount"],
-                                                                                self.parameters["num_k"])
+                            payments[str(index.preinc())] = self.query_route_yen(route["destiny"], route["origin"],
+                                                                                 route["amount"], is_reverse=True)
                             self.block_payment(payments[index.__str__()], True)
         return payments
 
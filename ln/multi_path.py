@@ -0,0 +1,347 @@
+import math
+import time
+import heapq
+import weakref
+import itertools
+import networkx as nx
+from typing import Tuple
+from ln import route_payment as route_pay, shortest_path_yen as spy, utils as utils
+
+# Max number of parts of a payment, i.e. max number of augmenting paths of the min cost flow
+MAX_PARTS = 8
+# Cost per hop added to the proportional fees, so the parts favor the shortest routes
+HOP_COST = 1
+# Max number of times that the flow is solved again once the fees of the parts exceed the balance of a channel, or once
+# a part does not reach the min_htlc of one of its channels
+MAX_ATTEMPTS = 3
+# Satoshis of the balance of each channel kept for the fees of the parts (1 sat per hop of a route of 20 hops)
+FEE_HEADROOM = 20
+# Arc indexes of each graph, they are released along with the graph
+arc_indexes = weakref.WeakKeyDictionary()
+
+
+def get_channel_label(graph: nx, u, v, key: str):
+    """
+    Gets the key of the channel whose balance is blocked by block_payment when the payment goes from node u to node v
+    through a channel, i.e. the key of the channel id along with the pub key of node v
+
+    :param graph: structure that contains the whole data about the network
+    :param u: node u
+    :param v: node v
+    :param key: key of the channel from node u to node v (channel_id-pubkey)
+    :return: key of the channel blocked
+    """
+    return "{}-{}".format(graph[u][v][key]['channel_id'], v)
+
+
+class ArcIndex:
+    """
+        Class used to keep the channels that can carry a flow from node u to node v as tuples of the key of the
+        channel, the fees and min_htlc of its source policy, the key of the channel blocked by block_payment and its
+        data, thus, a search reads the balances straight from the data of the channels instead of parsing the policies
+    """
+
+    def __init__(self, graph: nx):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        """
+        self.graph = graph
+        self.version = utils.get_graph_version(graph)
+        # Arcs by node u and node v
+        self.arcs = {u: self.__load(u) for u in graph}
+
+    def refresh(self):
+        """
+        Brings the index up to date with the version of the graph, thus, only the arcs of the nodes recorded on the
+        journal of the graph since the version of the index are loaded again
+        """
+        version = utils.get_graph_version(self.graph)
+        if version == self.version:
+            return
+        updates = utils.get_graph_updates(self.graph, self.version)
+        if updates is None:
+            self.__init__(self.graph)
+            return
+        for node in {node for pair in updates for node in pair if node in self.graph}:
+            self.arcs[node] = self.__load(node)
+        self.version = version
+
+    def __load(self, u) -> dict:
+        """
+        Loads the arcs out of node u
+
+        :param u: node u
+        :return: list of arcs by node v
+        """
+        arcs = {}
+        for v, channels in self.graph.succ[u].items():
+            for key, channel in channels.items():
+                policy = channel.get('policy_source')
+                label = get_channel_label(self.graph, u, v, key)
+                opposite = self.graph[v][u].get(label) if self.graph.has_edge(v, u) else None
+                if policy is not None and not policy['disabled'] and opposite is not None:
+                    arcs.setdefault(v, []).append((key, policy['fee_rate_milli_msat'],
+                                                   policy['fee_base_msat'], policy['min_htlc'], label,
+                                                   opposite))
+        return arcs
+
+
+def get_arc_index(graph: nx) -> ArcIndex:
+    """
+    Gets the arc index of a graph, it is built once per graph
+
+    :param graph: structure that contains the whole data about the network
+    :return: ArcIndex
+    """
+    arc_index = arc_indexes.get(graph)
+    if arc_index is None:
+        arc_index = arc_indexes[graph] = ArcIndex(graph)
+    else:
+        arc_index.refresh()
+    return arc_index
+
+
+def min_cost_flow(graph: nx, source: str, target: str, payment_amount: int, max_parts: int = MAX_PARTS,
+                  reserves: dict = None) -> list:
+    """
+    Splits a payment amount among the channels of the graph by a min cost flow (solve_min_cost_flow) whose parts reach
+    the min_htlc of every channel of their routes. The min_htlc of a channel applies to the amount of each part that
+    goes through it, which is only known once the flow is decomposed into parts, thus, the channels that carry a part
+    below their min_htlc are left out and the flow is solved again
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param max_parts: max number of augmenting paths
+    :param reserves: amount of each channel (by key) that is not carried by the flow
+    :return: list of parts, i.e. the amount, the path of nodes and the key of the channel of each hop
+    """
+    excluded = set()
+    for _ in range(MAX_ATTEMPTS):
+        parts = solve_min_cost_flow(graph, source, target, payment_amount, max_parts, reserves, excluded)
+        below = {key for amount, nodes, keys in parts for u, v, key in zip(nodes, nodes[1:], keys)
+                 if graph[u][v][key]['policy_source']['min_htlc'] >= amount}
+        if not below:
+            return parts
+        excluded |= below
+    raise nx.NetworkXNoPath("Payment between %s and %s can not be split into parts above the min_htlc of their "
+                            "channels." % (source, target))
+
+
+def solve_min_cost_flow(graph: nx, source: str, target: str, payment_amount: int, max_parts: int = MAX_PARTS,
+                        reserves: dict = None, excluded: set = None) -> list:
+    """
+    Splits a payment amount among the channels of the graph by a min cost flow from a source node to a target node,
+    where each channel carries up to its balance (the balance blocked by block_payment, less the headroom for the fees
+    and its reserve) at a cost per satoshi given by its proportional fee (fee_rate_milli_msat) plus its base fee
+    (fee_base_msat) spread over the whole payment amount and the cost of a hop. The flow is found by successive shortest
+    paths: each path is a Dijkstra search on the residual graph of the flow found so far, with the costs reduced by the
+    distances of the previous searches (Johnson's potentials), so the search stops as soon as the target node is
+    settled, and the path carries as much as its bottleneck allows. The first path is the cheapest path of the graph,
+    thus, it is found by a bidirectional Dijkstra, and when it carries the whole amount the flow is that path (the
+    search with potentials only runs for the payments that are split). Hence, the flow is split among at most max_parts
+    paths. A channel only carries the parts above its min_htlc, and a part never exceeds the amount that remains to be
+    carried, so the channels whose min_htlc is not below that amount are not searched (the first path carries the whole
+    amount)
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param max_parts: max number of augmenting paths
+    :param reserves: amount of each channel (by key) that is not carried by the flow
+    :param excluded: keys of the channels that do not carry the flow
+    :return: list of parts, i.e. the amount, the path of nodes and the key of the channel of each hop
+    """
+    if source not in graph or target not in graph:
+        raise nx.NodeNotFound("Either source {} or target {} is not in G".format(source, target))
+    reserves = {} if reserves is None else reserves
+    excluded = set() if excluded is None else excluded
+    out_arcs = get_arc_index(graph).arcs
+    # Flow and arc (u, v) of each channel by key, and the channels with flow that get into each node
+    flows, arcs, flow_in = {}, {}, {}
+    # Cost and capacity of the channels reached by the searches
+    costs, capacities = {}, {}
+
+    def channel(key: str, fee_rate: int, fee_base: int, label: str, opposite: dict) -> Tuple[int, int]:
+        if key not in costs:
+            costs[key] = fee_rate - (-fee_base * 1000 // payment_amount) + HOP_COST
+            capacities[key] = max(int(opposite.get('balance', 0)) - FEE_HEADROOM - reserves.get(label, 0), 0)
+        return costs[key], capacities[key]
+
+    def cheapest_channel(u, v, d=None):
+        cheapest = None
+        for key, fee_rate, fee_base, min_htlc, label, opposite in out_arcs[u].get(v, ()):
+            if min_htlc < payment_amount and key not in excluded:
+                cost, capacity = channel(key, fee_rate, fee_base, label, opposite)
+                if capacity > 0 and (cheapest is None or cost < cheapest[0]):
+                    cheapest = (cost, key, capacity)
+        return cheapest
+
+    def weight(u, v, d):
+        cheapest = cheapest_channel(u, v)
+        return None if cheapest is None else cheapest[0]
+
+    try:
+        _, nodes = nx.bidirectional_dijkstra(graph, source, target, weight=weight)
+    except nx.NetworkXNoPath:
+        raise nx.NetworkXNoPath("Not enough balance between %s and %s." % (source, target))
+    hops = [cheapest_channel(nodes[i], nodes[i + 1]) for i in range(len(nodes) - 1)]
+    if min(capacity for _, _, capacity in hops) >= payment_amount:
+        return [(payment_amount, nodes, [key for _, key, _ in hops])]
+
+    # Potential of each node less the sum of the distances to the target node of the searches, thus, only the nodes
+    # settled by a search (closer than the target node) are adjusted
+    adjustments = {}
+    remaining = payment_amount
+    for _ in range(max(max_parts, 1)):
+        distances, parents = {source: 0}, {source: None}
+        heap, settled, counter = [(0, 0, source)], set(), itertools.count(1)
+        while heap:
+            distance, _, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u == target:
+                break
+            potential = adjustments.get(u, 0)
+            for v, channels in out_arcs[u].items():
+                if v in settled:
+                    continue
+                for key, fee_rate, fee_base, min_htlc, label, opposite in channels:
+                    if min_htlc >= remaining or key in excluded:
+                        continue
+                    cost, capacity = channel(key, fee_rate, fee_base, label, opposite)
+                    if capacity - flows.get(key, 0) > 0:
+                        reduced = distance + cost + potential - adjustments.get(v, 0)
+                        if reduced < distances.get(v, float('inf')):
+                            distances[v], parents[v] = reduced, (u, key, 1)
+                            heapq.heappush(heap, (reduced, next(counter), v))
+            for key, v in flow_in.get(u, {}).items():
+                if v in settled:
+                    continue
+                reduced = distance - costs[key] + potential - adjustments.get(v, 0)
+                if reduced < distances.get(v, float('inf')):
+                    distances[v], parents[v] = reduced, (u, key, -1)
+                    heapq.heappush(heap, (reduced, next(counter), v))
+        if target not in settled:
+            raise nx.NetworkXNoPath("Not enough balance between %s and %s." % (source, target))
+
+        # Potentials of the settled nodes are increased by their distances, and the others by the target distance
+        for node in settled:
+            adjustments[node] = adjustments.get(node, 0) + distances[node] - distances[target]
+
+        steps, node = [], target
+        while parents[node] is not None:
+            u, key, direction = parents[node]
+            steps.append((u, node, key, direction))
+            node = u
+        bottleneck = min([remaining] + [capacities[key] - flows.get(key, 0) if direction > 0 else flows[key]
+                                        for _, _, key, direction in steps])
+        for u, v, key, direction in steps:
+            flows[key] = flows.get(key, 0) + direction * bottleneck
+            if direction > 0:
+                arcs[key] = (u, v)
+            if flows[key] > 0:
+                flow_in.setdefault(arcs[key][1], {})[key] = arcs[key][0]
+            else:
+                del flows[key]
+                del flow_in[arcs[key][1]][key]
+        remaining -= bottleneck
+        if remaining == 0:
+            break
+    if remaining > 0:
+        raise nx.NetworkXNoPath("Payment between %s and %s can not be split into %d parts." % (source, target,
+                                                                                              max_parts))
+
+    # The flow is decomposed into paths, each one carries the min flow of its channels
+    flow_out = {}
+    for key, (u, v) in arcs.items():
+        if flows.get(key, 0) > 0:
+            flow_out.setdefault(u, {})[key] = v
+    parts = []
+    while flow_out.get(source):
+        nodes, keys = [source], []
+        while nodes[-1] != target:
+            key, v = next(iter(flow_out[nodes[-1]].items()))
+            nodes.append(v)
+            keys.append(key)
+        amount = min(flows[key] for key in keys)
+        for u, key in zip(nodes, keys):
+            flows[key] -= amount
+            if flows[key] == 0:
+                del flow_out[u][key]
+        parts.append((amount, nodes, keys))
+    return parts
+
+
+def get_excess_balances(graph: nx, edge_dict: dict, payments: list) -> dict:
+    """
+    Gets the amount by which the payments exceed the balance of each channel that they block together, as blocked by
+    block_payment (amount to forward and fee of each hop)
+
+    :param graph: structure that contains the whole data about the network
+    :param edge_dict: dictionary with all the edges (channels)
+    :param payments: payments of a single route each
+    :return: excess by key of the channel blocked, empty if every channel can block the payments
+    """
+    amounts = {}
+    for payment in payments:
+        for h in payment.routes[0].hops:
+            label_edge = "{}-{}".format(h.channel_id, h.pub_key)
+            if label_edge in edge_dict:
+                amounts[label_edge] = amounts.get(label_edge, 0) + h.amt_2_fwrd + h.fee
+    excess = {}
+    for label_edge, amount in amounts.items():
+        edge = edge_dict[label_edge]
+        balance = graph[edge[0]][edge[1]][label_edge]['balance']
+        if amount > balance:
+            excess[label_edge] = amount - balance
+    return excess
+
+
+def query_route_multi_path(graph1: nx, graph2: nx, node_origin: str, node_destiny: str, payment_amount: int,
+                           max_parts: int = MAX_PARTS) -> route_pay.Payment:
+    """
+    Creates the structure that contains the payment of an amount split into several routes by a min cost flow over the
+    balances of the graph, each part is the payment of a single route. The fees of the parts are only known once their
+    routes are created, thus, when they exceed the balance of a channel, the flow is solved again with that excess
+    reserved on the channel
+
+    :param graph1: contains detailed data about the network
+    :param graph2: contains specific data about the network
+    :param node_origin: pub key of the node origin
+    :param node_destiny: pub key of the node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param max_parts: max number of parts of the payment
+    :return: Payment of a single route when the amount is not split, MultiPathPayment otherwise
+    """
+    _, edge_dict = spy.get_hop_index(graph1, graph2)
+    reserves = {}
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            flow = min_cost_flow(graph2, node_origin, node_destiny, payment_amount, max_parts, reserves)
+        except nx.NodeNotFound as e:
+            print('%s%s*** ERROR ON MULTI PATH PAYMENT: %s' % (utils.spaces, utils.spaces, e))
+            return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                     error="Nodes not found - MPP - either node is not in graph")
+        except nx.NetworkXNoPath:
+            return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                     error="Route not found - MPP - not enough balance to split the payment")
+
+        parts = []
+        for amount, nodes, keys in flow:
+            hops = [(key, graph2[nodes[i]][nodes[i + 1]][key]['policy_source']['fee_base_msat'])
+                    for i, key in enumerate(keys)]
+            parts.append(spy.create_payment(graph1, graph2, node_origin, node_destiny, amount, nodes,
+                                            (sum(fee for _, fee in hops), hops)))
+        excess = get_excess_balances(graph2, edge_dict, parts)
+        if not excess:
+            return parts[0] if len(parts) == 1 else \
+                route_pay.MultiPathPayment(node_origin, node_destiny, payment_amount, parts, time.time_ns())
+        for label_edge, amount in excess.items():
+            reserves[label_edge] = reserves.get(label_edge, 0) + math.ceil(amount)
+    return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                             error="Route not found - MPP - the fees of the parts exceed the balances")
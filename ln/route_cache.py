@@ -0,0 +1,102 @@
+import networkx as nx
+from collections import OrderedDict
+from ln import route_payment as route_pay, shortest_path_yen as spy, shortest_path_tree as spt, utils as utils
+
+
+class RouteCache:
+    """
+        Class used to keep the latest routes found between pairs of nodes. The routes are keyed by node origin, node
+        destiny, class of payment amount (the payment amounts of the same class get the same costs on the graph) and
+        epoch of the graph, and the least recently used ones are evicted once the cache is full. The updates of the
+        graph only invalidate the routes that use the updated channels, unless they update a pair of nodes with
+        parallel channels, whose costs may change the routes between any pair of nodes, in which case the epoch of the
+        graph is increased. When the channel index is given, the updates of any pair of nodes may change whether it can
+        forward a payment amount, so any update increases the epoch of the graph, and the routes are keyed by the
+        payment amount itself, since the channels that can forward it do not follow the classes of payment amounts
+    """
+
+    def __init__(self, graph1: nx, graph2: nx, max_size: int, channel_index=None):
+        """
+
+        :param graph1: contains detailed data about the network
+        :param graph2: contains specific data about the network
+        :param max_size: max number of routes kept by the cache
+        :param channel_index: channels of the graph that can forward each payment amount
+        """
+        self.graph1 = graph1
+        self.graph2 = graph2
+        self.max_size = max_size
+        self.channel_index = channel_index
+        self.version = utils.get_graph_version(graph2)
+        self.epoch = 0
+        self.routes = OrderedDict()
+        # Keys of the routes that go through each pair of nodes
+        self.routes_by_pair = {}
+        self.hits = self.misses = 0
+
+    def query_route(self, node_origin: str, node_destiny: str, payment_amount: int, query) -> route_pay.Payment:
+        """
+        Gets the payment of a route from the cache, or from the query when the route is not in the cache, in which case
+        the route found is kept by the cache. The payment is always created again, since the amounts and fees of the
+        hops depend on the payment amount
+
+        :param node_origin: pub key of the node origin
+        :param node_destiny: pub key of the node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param query: function that finds the payment of the route
+        :return: route_payment.Payment
+        """
+        self.__refresh()
+        key = (node_origin, node_destiny, payment_amount if self.channel_index is not None else
+               spt.get_amount_class(self.graph2, payment_amount), self.epoch)
+        path = self.routes.get(key)
+        if path is not None:
+            self.hits += 1
+            self.routes.move_to_end(key)
+            return spy.create_payment(self.graph1, self.graph2, node_origin, node_destiny, payment_amount, list(path),
+                                      spy.path_cost(spy.search_graph(self.graph2, payment_amount, self.channel_index),
+                                                    path, payment_amount))
+
+        self.misses += 1
+        payment = query()
+        if payment is not None and payment.error is None and payment.routes:
+            path = tuple([node_origin] + [hop.pub_key for hop in payment.routes[0].hops])
+            self.routes[key] = path
+            for pair in zip(path, path[1:]):
+                self.routes_by_pair.setdefault(pair, set()).add(key)
+            if len(self.routes) > self.max_size:
+                self.__remove(next(iter(self.routes)))
+        return payment
+
+    def __refresh(self):
+        """
+        Brings the cache up to date with the version of the graph by means of the journal of the graph
+        """
+        version = utils.get_graph_version(self.graph2)
+        if version == self.version:
+            return
+        updates = utils.get_graph_updates(self.graph2, self.version)
+        if updates is None or (self.channel_index is not None and updates) or \
+                any(spt.is_parallel(self.graph2, u, v) for u, v in updates):
+            # The routes of the previous epochs are never reached again, they are evicted as the least recently used
+            self.epoch += 1
+        else:
+            for u, v in updates:
+                for pair in ((u, v), (v, u)):
+                    for key in list(self.routes_by_pair.get(pair, ())):
+                        self.__remove(key)
+        self.version = version
+
+    def __remove(self, key: tuple):
+        """
+        Removes a route from the cache along with its references on the pairs of nodes of the route
+
+        :param key: key of the route
+        """
+        path = self.routes.pop(key)
+        for pair in zip(path, path[1:]):
+            keys = self.routes_by_pair.get(pair)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.routes_by_pair[pair]
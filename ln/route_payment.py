@@ -82,6 +82,25 @@ class Payment:
         self.error = error
 
 
+class MultiPathPayment(Payment):
+    """
+        Class used to handle a payment split into several parts, each part is the payment of a single route, and all of
+        them share the payment hash, so they are blocked, paid or reversed together
+    """
+
+    def __init__(self, pubkey_origin, pubkey_destiny, payment_amount: int, parts: list,
+                 creation_time_ns: int, payment_hash=None, error=None):
+        """
+
+        :param pubkey_origin:
+        :param pubkey_destiny:
+        :param payment_amount:
+        :param parts:
+        """
+        super().__init__(pubkey_origin, pubkey_destiny, payment_amount, None, creation_time_ns, payment_hash, error)
+        self.parts: [Payment] = parts
+
+
 class HTLCPayment:
     """
         Class used to represent the payment status and its possible failure codes
@@ -0,0 +1,282 @@
+import multiprocessing
+import networkx as nx
+from concurrent.futures import ProcessPoolExecutor
+from ln import route_payment as route_pay, shortest_path_yen as spy, shortest_path_tree as spt, utils as utils
+
+# Data of the network loaded once per worker process
+worker = {}
+
+
+def is_available() -> bool:
+    """
+    Checks that the worker processes can be forked, since the main script of the simulator can not be imported again
+    by a spawned process
+
+    :return: bool
+    """
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def init_worker(graph: nx, num_k: int, is_batch: bool, landmarks=None, hierarchy=None, sparse_graph=None,
+                channel_index=None):
+    """
+    Loads the data of the network on a worker process of the pool
+
+    :param graph: structure that contains specific data about the network (g2)
+    :param num_k: number of the shortest paths found by the Yen's algorithm
+    :param is_batch: indicates that the paths are taken from shortest path trees instead of the Yen's algorithm
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+    :param hierarchy: contraction hierarchy of the graph used to find the seed path
+    :param sparse_graph: CSR arrays of the graph used to find the paths
+    :param channel_index: channels of the graph that can forward each payment amount
+    """
+    worker['graph'] = graph
+    worker['num_k'] = num_k
+    worker['route_batch'] = spt.RouteBatch(None, graph, sparse_graph) if is_batch else None
+    worker['landmarks'] = landmarks
+    worker['hierarchy'] = hierarchy
+    worker['sparse_graph'] = sparse_graph
+    worker['channel_index'] = channel_index
+
+
+def find_paths(routes: list) -> list:
+    """
+    Finds the paths of a group of routes on a worker process of the pool, the routes of a group share the node origin
+    (or the node destiny for reverse routes), so a single shortest path tree is computed per group
+
+    :param routes: list of routes as tuples (node origin, node destiny, payment amount, is reverse)
+    :return: list of tuples (route, path), the path is None when the route must be found on the main process
+    """
+    paths = []
+    for route in routes:
+        node_origin, node_destiny, payment_amount, is_reverse = route
+        try:
+            if worker['route_batch'] is not None:
+                path = worker['route_batch'].find_path(node_origin, node_destiny, payment_amount, is_reverse)
+            else:
+                # Only the first path of the Yen's algorithm is used as route
+                path = next(spy.yen_paths(worker['graph'], node_origin, node_destiny, payment_amount,
+                                          landmarks=worker['landmarks'], hierarchy=worker['hierarchy'],
+                                          sparse_graph=worker['sparse_graph'], channel_index=worker['channel_index']))
+        except (nx.NetworkXNoPath, nx.NodeNotFound):
+            # The errors are reported by the main process
+            path = None
+        paths.append((route, path))
+    return paths
+
+
+class RoutePool:
+    """
+        Class used to find the routes of a test on a pool of processes. The routes are found on the state of the graph
+        at the time they are submitted, whereas the payments blocked meanwhile by the main process update the balances
+        of the graph. The updates of the pairs of nodes with a single channel do not change the costs, thus, a route of
+        the pool is used as long as the costs of the updated pairs of nodes with parallel channels are the same for its
+        payment amount as when it was submitted, otherwise the route is found again on the main process in the same
+        order as a test without pool. When the channel index is given, the updates of any pair of nodes may change
+        which of its channels can forward a payment amount, so the channels of the updated pairs of nodes that can
+        forward the amount must also be the same as when the routes were submitted
+    """
+
+    def __init__(self, graph1: nx, graph2: nx, num_k: int, processes: int, is_batch: bool, landmarks=None,
+                 hierarchy=None, sparse_graph=None, channel_index=None):
+        """
+
+        :param graph1: contains detailed data about the network
+        :param graph2: contains specific data about the network
+        :param num_k: number of the shortest paths found by the Yen's algorithm
+        :param processes: number of processes of the pool
+        :param is_batch: indicates that the paths are taken from shortest path trees instead of the Yen's algorithm
+        :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+        :param hierarchy: contraction hierarchy of the graph used to find the seed path
+        :param sparse_graph: CSR arrays of the graph used to find the paths
+        :param channel_index: channels of the graph that can forward each payment amount
+        """
+        self.graph1 = graph1
+        self.graph2 = graph2
+        self.processes = processes
+        self.channel_index = channel_index
+        self.initargs = (graph2, num_k, is_batch, landmarks, hierarchy, sparse_graph, channel_index)
+        self.version = None
+        self.paths = {}
+        # Costs of the pairs of nodes with parallel channels for each payment amount at the time of the submission
+        self.weights = {}
+        # Feasibility of the channels for each payment amount at the time of the submission
+        self.feasible = {}
+        # Pairs of nodes with parallel channels updated since the submission
+        self.updates = set()
+
+    def submit(self, routes: list):
+        """
+        Finds the paths of a batch of routes on the pool, the routes are grouped by node origin (or by node destiny for
+        reverse routes) and the groups are spread among the processes
+
+        :param routes: list of routes as tuples (node origin, node destiny, payment amount, is reverse)
+        """
+        groups = {}
+        for route in dict.fromkeys(routes):
+            groups.setdefault((route[1] if route[3] else route[0], route[3]), []).append(route)
+
+        self.version = utils.get_graph_version(self.graph2)
+        self.paths = {}
+        self.updates = set()
+        pairs = [(u, v) for u, nbrs in self.graph2.adj.items() for v in nbrs if spt.is_parallel(self.graph2, u, v)]
+        self.weights = {}
+        for payment_amount in {route[2] for route in routes}:
+            cost_index = spy.get_cost_index(self.graph2, payment_amount)
+            self.weights[payment_amount] = {pair: cost_index.weight(*pair) for pair in pairs}
+        if self.channel_index is not None:
+            self.feasible = {payment_amount: dict(zip(self.channel_index.keys,
+                                                      self.channel_index.feasible_channels(payment_amount).tolist()))
+                             for payment_amount in {route[2] for route in routes}}
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context('fork'),
+                                 initializer=init_worker, initargs=self.initargs) as executor:
+            for paths in executor.map(find_paths, groups.values()):
+                self.paths.update(paths)
+
+    def query_route(self, node_origin: str, node_destiny: str, payment_amount: int,
+                    is_reverse: bool = False) -> route_pay.Payment:
+        """
+        Creates the structure that contains the payment of a route found by the pool
+
+        :param node_origin: pub key of the node origin
+        :param node_destiny: pub key of the node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the route is grouped by node destiny instead of node origin
+        :return: Payment that contains data about both nodes and route, None if the route must be found on the main
+        process
+        """
+        path = self.paths.get((node_origin, node_destiny, payment_amount, is_reverse))
+        if path is None or not self.is_valid(payment_amount):
+            return None
+        return spy.create_payment(self.graph1, self.graph2, node_origin, node_destiny, payment_amount, path,
+                                  spy.path_cost(spy.search_graph(self.graph2, payment_amount, self.channel_index),
+                                                path, payment_amount))
+
+    def is_valid(self, payment_amount: int) -> bool:
+        """
+        Checks that the routes found by the pool for a payment amount are still the shortest ones after the updates of
+        the graph
+
+        :param payment_amount: amount to be paid to node destiny
+        :return: bool
+        """
+        if self.version is None:
+            return False
+        version = utils.get_graph_version(self.graph2)
+        if version != self.version:
+            updates = utils.get_graph_updates(self.graph2, self.version)
+            if updates is None:
+                self.paths = {}
+                self.version = None
+                return False
+            for u, v in updates:
+                for pair in ((u, v), (v, u)):
+                    if (self.channel_index is not None or spt.is_parallel(self.graph2, *pair)) \
+                            and self.graph2.has_edge(*pair):
+                        self.updates.add(pair)
+            self.version = version
+
+        weights = self.weights.get(payment_amount, {})
+        cost_index = spy.get_cost_index(self.graph2, payment_amount) if self.updates else None
+        if self.channel_index is not None:
+            feasible = self.feasible.get(payment_amount)
+            if feasible is None or any(set(self.channel_index.channels(*pair, payment_amount)) !=
+                                       {key for key in self.graph2[pair[0]][pair[1]] if feasible.get(key)}
+                                       for pair in self.updates):
+                return False
+            return True
+        return all(cost_index.weight(*pair) == weights[pair] if pair in weights else
+                   not spt.is_parallel(self.graph2, *pair) for pair in self.updates)
+
+
+def find_spur_paths(spurs: tuple) -> list:
+    """
+    Finds a chunk of the spur paths of a round of the Yen's algorithm on a worker process of the pool
+
+    :param spurs: tuple (node destiny, payment amount, list of spur searches as tuples (spur node, hidden nodes, hidden
+    edges))
+    :return: list with the cost and the path of each spur search, None when there is no path
+    """
+    target, payment_amount, searches = spurs
+    channel_index = worker['channel_index']
+    graph = spy.search_graph(worker['graph'], payment_amount, channel_index)
+    weight = spy.get_cost_index(graph, payment_amount).weight
+    heuristic = None if worker['landmarks'] is None else worker['landmarks'].heuristic(target)
+    sparse_graph = worker['sparse_graph'] if channel_index is None else None
+    paths = []
+    for spur_node, hidden_nodes, hidden_edges in searches:
+        try:
+            paths.append(spy.spur_path(graph, spur_node, target, payment_amount, hidden_nodes, hidden_edges, weight,
+                                       heuristic, sparse_graph))
+        except nx.NetworkXNoPath:
+            paths.append(None)
+    return paths
+
+
+class SpurPool:
+    """
+        Class used to run the spur searches of each round of the Yen's algorithm on a pool of processes, since the spur
+        searches of a path only depend on the paths already found. The processes are forked with the graph, thus, the
+        pool is forked again once the updates of the graph changed the costs seen by the processes, i.e. the updates of
+        pairs of nodes with parallel channels, or any update when the channel index is given
+    """
+
+    def __init__(self, graph: nx, processes: int, landmarks=None, sparse_graph=None, channel_index=None):
+        """
+
+        :param graph: structure that contains specific data about the network (g2)
+        :param processes: number of processes of the pool
+        :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+        :param sparse_graph: CSR arrays of the graph used to find the paths
+        :param channel_index: channels of the graph that can forward each payment amount
+        """
+        self.graph = graph
+        self.processes = processes
+        self.channel_index = channel_index
+        self.initargs = (graph, 0, False, landmarks, None, sparse_graph, channel_index)
+        self.version = None
+        self.executor = None
+
+    def map(self, target: str, payment_amount: int, spurs: list) -> list:
+        """
+        Runs the spur searches of a round of the Yen's algorithm, the searches are spread in chunks among the processes
+
+        :param target: node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param spurs: list of spur searches as tuples (spur node, hidden nodes, hidden edges)
+        :return: list with the cost and the path of each spur search in the same order, None when there is no path
+        """
+        self.__refresh()
+        num_chunks = min(self.processes, len(spurs))
+        paths = [None] * len(spurs)
+        chunks = self.executor.map(find_spur_paths, [(target, payment_amount, spurs[i::num_chunks])
+                                                     for i in range(num_chunks)])
+        for i, chunk in enumerate(chunks):
+            paths[i::num_chunks] = chunk
+        return paths
+
+    def close(self):
+        """
+        Shuts down the processes of the pool
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __refresh(self):
+        """
+        Forks the pool again when the costs of the graph changed since the processes were forked
+        """
+        version = utils.get_graph_version(self.graph)
+        if self.executor is not None and version != self.version:
+            updates = utils.get_graph_updates(self.graph, self.version)
+            if updates is None or (self.channel_index is not None and updates) or \
+                    any(spt.is_parallel(self.graph, u, v) for u, v in updates):
+                self.close()
+            else:
+                self.version = version
+        if self.executor is None:
+            self.version = version
+            self.executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                mp_context=multiprocessing.get_context('fork'),
+                                                initializer=init_worker, initargs=self.initargs)
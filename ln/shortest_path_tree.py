@@ -0,0 +1,348 @@
+import math
+import time
+import heapq
+import bisect
+import weakref
+import networkx as nx
+from collections import OrderedDict
+from typing import Tuple, Optional
+from ln import route_payment as route_pay, shortest_path_yen as spy, utils as utils
+
+# Max number of shortest path trees kept by a batch of routes
+MAX_TREES = 64
+# Amount breakpoints of each graph, they are released along with the graph
+amount_breakpoints = weakref.WeakKeyDictionary()
+
+
+def get_amount_breakpoints(graph: nx) -> list:
+    """
+    Gets the payment amounts at which the channel chosen between a pair of nodes may change. The costs of a pair of
+    nodes with a single channel do not depend on the payment amount, whereas the costs of a pair of nodes with parallel
+    channels depend on whether each channel can forward the payment (min_htlc < payment_amount and
+    balance > fee_base_msat + payment_amount). Hence, two payment amounts with no breakpoint between them get the same
+    costs on the whole graph. The balances are rounded up, since a fractional balance can still forward the payment
+    amount right below it
+
+    :param graph: structure that contains the whole data about the network
+    :return: sorted list of breakpoints
+    """
+    version = utils.get_graph_version(graph)
+    cache = amount_breakpoints.get(graph)
+    if cache is not None and cache[0] != version:
+        updates = utils.get_graph_updates(graph, cache[0])
+        if updates is None or any(is_parallel(graph, u, v) for u, v in updates):
+            cache = None
+        else:
+            cache = amount_breakpoints[graph] = (version, cache[1])
+    if cache is None:
+        breakpoints = set()
+        for u, nbrs in graph.adj.items():
+            for v, channels in nbrs.items():
+                if len(channels) > 1:
+                    for channel in channels.values():
+                        for name in ('policy_source', 'policy_dest'):
+                            policy = channel.get(name)
+                            if policy is not None and not policy['disabled']:
+                                breakpoints.add(policy['min_htlc'] + 1)
+                                if 'balance' in channel:
+                                    breakpoints.add(math.ceil(channel['balance']) - policy['fee_base_msat'])
+        cache = amount_breakpoints[graph] = (version, sorted(breakpoints))
+
+    return cache[1]
+
+
+def get_amount_class(graph: nx, payment_amount: int) -> int:
+    """
+    Gets the class of a payment amount, i.e. the payment amounts of the same class get the same costs on the graph
+
+    :param graph: structure that contains the whole data about the network
+    :param payment_amount: amount to be paid to node destiny
+    :return: class of the payment amount
+    """
+    return bisect.bisect_right(get_amount_breakpoints(graph), payment_amount)
+
+
+def get_amount_bounds(graph: nx, payment_amount: int) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Gets the breakpoints that bound the class of a payment amount. Unlike the class, the bounds do not shift when the
+    updates of the balances add or remove breakpoints, so they identify the same payment amounts over time
+
+    :param graph: structure that contains the whole data about the network
+    :param payment_amount: amount to be paid to node destiny
+    :return: lowest breakpoint not greater than the payment amount and lowest breakpoint greater than it, None if
+    there is no such breakpoint
+    """
+    breakpoints = get_amount_breakpoints(graph)
+    i = bisect.bisect_right(breakpoints, payment_amount)
+    return breakpoints[i - 1] if i > 0 else None, breakpoints[i] if i < len(breakpoints) else None
+
+
+def is_parallel(graph: nx, u, v) -> bool:
+    """
+    Checks whether there are parallel channels between a pair of nodes in either direction
+
+    :param graph: structure that contains the whole data about the network
+    :param u: node u
+    :param v: node v
+    :return: bool
+    """
+    return (graph.has_edge(u, v) and len(graph[u][v]) > 1) or (graph.has_edge(v, u) and len(graph[v][u]) > 1)
+
+
+class ShortestPathTree:
+    """
+        Class used to gather the shortest paths from a root node to every node of the network (or from every node to the
+        root node in case of a reverse tree) for a class of payment amounts. The tree found by networkx keeps the
+        distance and the parent of each node, so it is repaired after the updates of the graph instead of being computed
+        again: a pair of nodes whose cost decreased relaxes the nodes reached through it, whereas a pair of nodes of the
+        tree whose cost increased finds again the paths of its subtree from the rest of the tree, which are not
+        affected by the increase (dynamic single source shortest paths as Ramalingam and Reps)
+    """
+
+    def __init__(self, graph: nx, root: str, payment_amount: int, is_reverse: bool = False, sparse_graph=None):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        :param root: node from which (or to which on a reverse tree) the paths are found
+        :param payment_amount: amount to be paid, any amount of the same class gets the same tree
+        :param is_reverse: indicates that the paths go from every node to the root node
+        :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the tree
+        """
+        self.graph = graph
+        self.root = root
+        self.payment_amount = payment_amount
+        self.is_reverse = is_reverse
+        self.amount_class = get_amount_class(graph, payment_amount)
+        self.version = utils.get_graph_version(graph)
+        self.sparse_graph = sparse_graph
+        cost_index = spy.get_cost_index(graph, payment_amount)
+        if sparse_graph is not None:
+            # The paths are taken from the predecessors found by scipy
+            self.distances, self.predecessors = sparse_graph.shortest_paths(root, payment_amount, is_reverse)
+            self.parents = self.children = None
+            return
+        if is_reverse:
+            self.distances, paths = nx.single_source_dijkstra(graph.reverse(copy=False), root,
+                                                              weight=lambda u, v, d: cost_index.weight(v, u))
+        else:
+            self.distances, paths = nx.single_source_dijkstra(graph, root, weight=cost_index.weight)
+        # Parent of each node on the tree and nodes whose parent is each node
+        self.parents = {node: path[-2] if len(path) > 1 else None for node, path in paths.items()}
+        self.children = {}
+        for node, parent in self.parents.items():
+            if parent is not None:
+                self.children.setdefault(parent, set()).add(node)
+
+    def path(self, node: str) -> list:
+        """
+        Gets the path between the root node and a node, following the direction of the tree
+
+        :param node: node destiny (node origin on a reverse tree)
+        :return: path of nodes from node origin to node destiny, None if there is no path
+        """
+        if self.sparse_graph is not None:
+            return self.sparse_graph.path(self.predecessors, self.root, node, self.is_reverse)
+        if node not in self.parents:
+            return None
+        path = [node]
+        while self.parents[path[-1]] is not None:
+            path.append(self.parents[path[-1]])
+        if not self.is_reverse:
+            path.reverse()
+        return path
+
+    def is_valid(self) -> bool:
+        """
+        Checks that the tree is still the shortest one after the updates of the graph. The updates of pairs of nodes
+        with a single channel do not change their costs, whereas the updates of pairs of nodes with parallel channels
+        are repaired on the tree found by networkx. The tree found by scipy is only invalid once a pair of nodes with
+        parallel channels was updated
+
+        :return: bool
+        """
+        version = utils.get_graph_version(self.graph)
+        if version != self.version:
+            updates = utils.get_graph_updates(self.graph, self.version)
+            if updates is None:
+                return False
+            updates = [pair for u, v in updates if is_parallel(self.graph, u, v) for pair in ((u, v), (v, u))]
+            if updates:
+                if self.sparse_graph is not None:
+                    return False
+                self.__repair(updates)
+            self.version = version
+        return True
+
+    def __repair(self, updates: list):
+        """
+        Repairs the distances and the parents of the nodes reached through the updated pairs of nodes, first the
+        subtrees below the pairs of nodes whose cost increased and then the nodes reached through the pairs of nodes
+        whose cost decreased
+
+        :param updates: directed pairs of nodes (u, v) of the graph whose cost may have changed
+        """
+        cost_index = spy.get_cost_index(self.graph, self.payment_amount)
+        if self.is_reverse:
+            # The tree goes through the edges of the reverse graph
+            weight, successors, predecessors = lambda x, y: cost_index.weight(y, x), self.graph.pred, self.graph.succ
+        else:
+            weight, successors, predecessors = cost_index.weight, self.graph.succ, self.graph.pred
+
+        decreased = []
+        for u, v in updates:
+            x, y = (v, u) if self.is_reverse else (u, v)
+            if x not in self.distances:
+                continue
+            w = weight(x, y)
+            if self.parents.get(y) == x and (w is None or self.distances[x] + w > self.distances[y]):
+                self.__repair_subtree(y, weight, predecessors, successors)
+            elif w is not None:
+                decreased.append((x, y))
+
+        for x, y in decreased:
+            w = weight(x, y) if x in self.distances else None
+            if w is None or self.distances[x] + w >= self.distances.get(y, math.inf):
+                continue
+            heap = [(self.distances[x] + w, y, x)]
+            while heap:
+                cost, node, parent = heapq.heappop(heap)
+                if cost >= self.distances.get(node, math.inf):
+                    continue
+                self.__set_parent(node, parent, cost)
+                for successor in successors[node]:
+                    w = weight(node, successor)
+                    if w is not None and cost + w < self.distances.get(successor, math.inf):
+                        heapq.heappush(heap, (cost + w, successor, node))
+
+    def __repair_subtree(self, node: str, weight, predecessors, successors):
+        """
+        Finds again the paths of the subtree below a node from the nodes out of the subtree, whose distances do not
+        depend on the subtree. The nodes of the subtree that are no longer reached are removed from the tree
+
+        :param node: node whose pair of nodes with its parent increased its cost
+        :param weight: function that returns the cost of a directed edge of the tree
+        :param predecessors: adjacency of the nodes that reach each node on the tree
+        :param successors: adjacency of the nodes reached by each node on the tree
+        """
+        subtree = [node]
+        for n in subtree:
+            subtree.extend(self.children.get(n, ()))
+        subtree = set(subtree)
+        for n in subtree:
+            self.__set_parent(n, None, None)
+
+        heap = []
+        for n in subtree:
+            for predecessor in predecessors[n]:
+                if predecessor not in subtree and predecessor in self.distances:
+                    w = weight(predecessor, n)
+                    if w is not None:
+                        heap.append((self.distances[predecessor] + w, n, predecessor))
+        heapq.heapify(heap)
+        while heap:
+            cost, n, parent = heapq.heappop(heap)
+            if n in self.distances:
+                continue
+            self.__set_parent(n, parent, cost)
+            for successor in successors[n]:
+                if successor in subtree and successor not in self.distances:
+                    w = weight(n, successor)
+                    if w is not None:
+                        heapq.heappush(heap, (cost + w, successor, n))
+
+    def __set_parent(self, node: str, parent, cost):
+        """
+        Sets the parent and the distance of a node on the tree, the node is removed from the tree when its distance is
+        None
+
+        :param node: node of the tree
+        :param parent: new parent of the node
+        :param cost: new distance of the node from the root node
+        """
+        previous = self.parents.pop(node, None)
+        if previous is not None:
+            self.children[previous].discard(node)
+        if cost is None:
+            self.distances.pop(node, None)
+            return
+        self.parents[node] = parent
+        self.distances[node] = cost
+        self.children.setdefault(parent, set()).add(node)
+
+
+class RouteBatch:
+    """
+        Class used to find the routes of a batch of payments by means of shortest path trees. The routes are grouped by
+        node origin (or by node destiny for reverse trees) and class of payment amount, so a single tree is computed
+        per group and all its routes are taken from that tree
+    """
+
+    def __init__(self, graph1: nx, graph2: nx, sparse_graph=None):
+        """
+
+        :param graph1: contains detailed data about the network
+        :param graph2: contains specific data about the network
+        :param sparse_graph: CSR arrays of graph2 (sparse_graph.SparseGraph) used to find the trees
+        """
+        self.graph1 = graph1
+        self.graph2 = graph2
+        self.sparse_graph = sparse_graph
+        self.trees = OrderedDict()
+
+    def get_tree(self, root: str, payment_amount: int, is_reverse: bool = False) -> ShortestPathTree:
+        """
+        Gets the shortest path tree of a group of routes, it is repaired when the updates of the graph changed the costs
+        of its paths
+
+        :param root: node origin of the group (node destiny for reverse trees)
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the group is made by node destiny
+        :return: shortest path tree of the group
+        """
+        key = (root, is_reverse, get_amount_class(self.graph2, payment_amount))
+        tree = self.trees.get(key)
+        # The class of the amount of the tree is checked again, since the breakpoints change along with the balances
+        if tree is None or not tree.is_valid() or get_amount_class(self.graph2, tree.payment_amount) != key[2]:
+            tree = self.trees[key] = ShortestPathTree(self.graph2, root, payment_amount, is_reverse, self.sparse_graph)
+            if len(self.trees) > MAX_TREES:
+                self.trees.popitem(last=False)
+        self.trees.move_to_end(key)
+        return tree
+
+    def find_path(self, node_origin: str, node_destiny: str, payment_amount: int, is_reverse: bool = False) -> list:
+        """
+        Gets the path of a route from the shortest path tree of its group
+
+        :param node_origin: pub key of the node origin
+        :param node_destiny: pub key of the node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the route is grouped by node destiny instead of node origin
+        :return: path of nodes from node origin to node destiny, None if there is no path
+        """
+        tree = self.get_tree(node_destiny if is_reverse else node_origin, payment_amount, is_reverse)
+        return tree.path(node_origin if is_reverse else node_destiny)
+
+    def query_route(self, node_origin: str, node_destiny: str, payment_amount: int,
+                    is_reverse: bool = False) -> route_pay.Payment:
+        """
+        Creates the structure that contains the payment of a route taken from the shortest path tree of its group
+
+        :param node_origin: pub key of the node origin
+        :param node_destiny: pub key of the node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the route is grouped by node destiny instead of node origin
+        :return: Payment that contains data about both nodes and route, totals (amt, fee, time lock and success
+        probability)
+        """
+        try:
+            path = self.find_path(node_origin, node_destiny, payment_amount, is_reverse)
+        except nx.NodeNotFound as e:
+            print('%s%s*** ERROR ON SHORTEST PATH TREE: %s' % (utils.spaces, utils.spaces, e))
+            return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                     error="Nodes not found - TREE - either node is not in graph")
+
+        if path is None:
+            return route_pay.Payment(node_origin, node_destiny, payment_amount, None, time.time_ns(),
+                                     error="Route not found - TREE - no path between nodes")
+        return spy.create_payment(self.graph1, self.graph2, node_origin, node_destiny, payment_amount, path,
+                                  spy.path_cost(self.graph2, path, payment_amount))
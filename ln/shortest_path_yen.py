@@ -1,92 +1,327 @@
+import math
 import time
-import queue
+import heapq
+import itertools
+import weakref
+import numpy as np
 import networkx as nx
-from typing import Tuple
-from ln import route_payment as route_pay, utils as utils
+from collections import OrderedDict
+from typing import Tuple, Optional
+from ln import route_payment as route_pay, landmarks as lm, contraction_hierarchy as ch, channel_index as ci, \
+    utils as utils
+
+# Marker of a directed edge whose cost has not been compiled yet
+UNSET = object()
+# Max number of payment amounts whose cost index is kept per graph
+MAX_COST_INDEXES = 16
+# Cost indexes of each graph, they are released along with the graph
+cost_indexes = weakref.WeakKeyDictionary()
+# Dictionaries of nodes and edges used to print the hops of the routes of each graph, they are released along with the
+# graph
+hop_indexes = weakref.WeakKeyDictionary()
+
+
+class CostIndex:
+    """
+        Class used to compile the costs of the channels between each pair of nodes (directed edge) of the network for a
+        given payment amount. The costs are stored on flat arrays keyed by the position of the directed edge, and they
+        are compiled the first time that the edge is reached, thus, a relaxation on the shortest path is an array lookup
+        instead of parsing the policies of the channels. When a cost model is given (cost_model.CostModel), the costs of
+        every edge are compiled at once by the model instead, and compiled again at once when the graph is updated
+    """
+
+    def __init__(self, graph: nx, payment_amount: int, positions: dict, cost_model=None):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        :param payment_amount: amount to be paid to node destiny
+        :param positions: position of each directed edge (u, v) on the arrays
+        :param cost_model: cost model of an implementation (cost_model.CostModel), None for the costs of the fees
+        """
+        self.graph = graph
+        self.payment_amount = payment_amount
+        self.cost_model = cost_model
+        self.version = utils.get_graph_version(graph)
+        # Position of each directed edge (u, v) on the arrays
+        self.positions = positions
+        # Cost of the directed edge used as weight on the shortest path, None if the edge can not be used
+        self.weights = [UNSET] * len(positions)
+        # Key of the channel chosen to forward the payment, None if the edge does not count on the path cost
+        self.keys = [UNSET] * len(positions)
+        # Fee charged by the channel chosen to forward the payment
+        self.fees = [UNSET] * len(positions)
+        # Fee (0 if the edge does not count on the path cost) and time lock delta of the channel chosen as numpy arrays,
+        # so the costs of many paths are evaluated at once
+        self.fee_array = np.zeros(len(positions), dtype=np.int64)
+        self.time_lock_array = np.zeros(len(positions), dtype=np.int64)
+        if cost_model is not None:
+            self.__compile_model()
+
+    def weight(self, u, v, d=None):
+        """
+        Gets the cost of the directed edge (u, v) used as weight to find the shortest path
+
+        :param u: node u
+        :param v: node v
+        :param d: channels between both nodes, unused but given by the shortest path functions of networkx
+        :return: cost of the directed edge
+        """
+        pos = self.positions.get((u, v))
+        if pos is None or pos >= len(self.weights):
+            pos = self.__position(u, v)
+            if pos is None:
+                return None
+        weight = self.weights[pos]
+        if weight is UNSET:
+            self.__compile(u, v, pos)
+            weight = self.weights[pos]
+        return weight
+
+    def hop(self, u, v) -> Tuple[Optional[str], Optional[int]]:
+        """
+        Gets the key and the fee of the channel chosen to forward the payment on the directed edge (u, v)
+
+        :param u: node u
+        :param v: node v
+        :return: key and fee of the channel
+        """
+        pos = self.positions.get((u, v))
+        if pos is None or pos >= len(self.keys):
+            pos = self.__position(u, v)
+            if pos is None:
+                return None, None
+        if self.keys[pos] is UNSET:
+            self.__compile(u, v, pos)
+        return self.keys[pos], self.fees[pos]
+
+    def position(self, u, v) -> Optional[int]:
+        """
+        Gets the position of the directed edge (u, v) on the arrays, and compiles its cost if it was not compiled yet
+
+        :param u: node u
+        :param v: node v
+        :return: position of the directed edge, None if the edge is not in the graph
+        """
+        pos = self.positions.get((u, v))
+        if pos is None or pos >= len(self.keys):
+            pos = self.__position(u, v)
+            if pos is None:
+                return None
+        if self.keys[pos] is UNSET:
+            self.__compile(u, v, pos)
+        return pos
+
+    def refresh(self):
+        """
+        Brings the index up to date with the version of the graph, thus, only the directed edges recorded on the
+        journal of the graph since the version of the index are compiled again
+        """
+        version = utils.get_graph_version(self.graph)
+        if version == self.version:
+            return
+        if self.cost_model is not None:
+            self.version = version
+            self.__compile_model()
+            return
+        updates = utils.get_graph_updates(self.graph, self.version)
+        if updates is None:
+            self.weights = [UNSET] * len(self.positions)
+            self.keys = [UNSET] * len(self.positions)
+            self.fees = [UNSET] * len(self.positions)
+        else:
+            for u, v in updates:
+                for pair in ((u, v), (v, u)):
+                    pos = self.positions.get(pair)
+                    if pos is not None and pos < len(self.weights):
+                        self.weights[pos] = self.keys[pos] = self.fees[pos] = UNSET
+        self.version = version
+
+    def __position(self, u, v) -> Optional[int]:
+        """
+        Gets the position of a directed edge added to the graph after the positions were set, and extends the arrays up
+        to that position
+
+        :param u: node u
+        :param v: node v
+        :return: position of the directed edge, None if the edge is not in the graph
+        """
+        if not self.graph.has_edge(u, v):
+            return None
+        pos = self.positions.setdefault((u, v), len(self.positions))
+        missing = len(self.positions) - len(self.weights)
+        self.weights.extend([UNSET] * missing)
+        self.keys.extend([UNSET] * missing)
+        self.fees.extend([UNSET] * missing)
+        self.fee_array = np.concatenate((self.fee_array, np.zeros(missing, dtype=np.int64)))
+        self.time_lock_array = np.concatenate((self.time_lock_array, np.zeros(missing, dtype=np.int64)))
+        return pos
+
+    def __compile(self, u, v, pos: int):
+        """
+        Compiles the cost of the directed edge (u, v) by comparing the lowest fees of the source and destiny policies
+        among all the channels between both nodes
+
+        :param u: node u
+        :param v: node v
+        :param pos: position of the directed edge on the arrays
+        """
+        if self.cost_model is not None:
+            self.__compile_model()
+            return
+        weight = key = fee = None
+        channels = self.graph.get_edge_data(u, v)
+        if channels is not None and 0 not in channels and 1 not in channels:
+            val_dest, val_source = get_min_source_dest_channels(channels, self.payment_amount)
+            policy_source = val_source[1]['policy_source']
+            policy_dest = val_dest[1]['policy_dest']
+            if policy_source is not None:
+                if policy_dest is not None:
+                    min_htlc_source = 1 if 'min_htlc' not in policy_source else policy_source['min_htlc']
+                    min_htlc_dest = 1 if 'min_htlc' not in policy_dest else policy_dest['min_htlc']
+                    if policy_source['fee_base_msat'] <= policy_dest['fee_base_msat'] \
+                            and min_htlc_source <= min_htlc_dest:
+                        key, fee = val_source[0], policy_source['fee_base_msat']
+                        weight = fee + min_htlc_source
+                    else:
+                        key, fee = val_dest[0], policy_dest['fee_base_msat']
+                        weight = fee + min_htlc_dest
+                else:
+                    key, fee = val_source[0], policy_source['fee_base_msat']
+                    weight = fee + policy_source['min_htlc']
+            else:
+                if policy_dest is not None:
+                    key, fee = val_dest[0], policy_dest['fee_base_msat']
+                    weight = fee + policy_dest['min_htlc']
+
+        self.weights[pos] = weight
+        self.keys[pos] = key
+        self.fees[pos] = fee
+        self.fee_array[pos] = 0 if fee is None else fee
+        policy = None if key is None else channels[key]['policy_source']
+        self.time_lock_array[pos] = 0 if policy is None else policy['time_lock_delta']
+
+    def __compile_model(self):
+        """
+        Compiles the costs of every directed edge at once by means of the cost model, the channel chosen on each edge is
+        the cheapest one for the model, and its fee is the fee_base_msat of its source policy
+        """
+        weights, keys, fees, time_locks = self.cost_model.compile(self.graph, self.payment_amount, self.positions)
+        self.weights = [None if key is None else weight for weight, key in zip(weights.tolist(), keys)]
+        self.keys = keys
+        self.fees = [None if key is None else fee for fee, key in zip(fees.tolist(), keys)]
+        self.fee_array = np.where([key is not None for key in keys], fees, 0).astype(np.int64)
+        self.time_lock_array = time_locks.astype(np.int64)
+
+
+def get_cost_index(graph: nx, payment_amount: int, cost_model=None) -> CostIndex:
+    """
+    Gets the cost index of a graph for a given payment amount. The index is built once per version of the graph and
+    payment amount (and cost model), and the latest indexes are kept to be reused by the following queries. Any change
+    on the channels of the graph must be recorded through utils.update_graph_version to be seen by the indexes
 
+    :param graph: structure that contains the whole data about the network
+    :param payment_amount: amount to be paid to node destiny
+    :param cost_model: cost model of an implementation (cost_model.CostModel), None for the costs of the fees
+    :return: cost index of the graph
+    """
+    cache = cost_indexes.get(graph)
+    if cache is None:
+        # The directed edges are enumerated once per graph, the edges added later are appended on demand
+        positions = {pair: pos for pos, pair in enumerate((u, v) for u, nbrs in graph.adj.items() for v in nbrs)}
+        cache = cost_indexes[graph] = {'positions': positions, 'indexes': OrderedDict()}
+
+    indexes = cache['indexes']
+    name = payment_amount if cost_model is None else (cost_model.name, payment_amount)
+    index = indexes.get(name)
+    if index is None:
+        index = indexes[name] = CostIndex(graph, payment_amount, cache['positions'], cost_model)
+        if len(indexes) > MAX_COST_INDEXES:
+            indexes.popitem(last=False)
+    else:
+        indexes.move_to_end(name)
+        index.refresh()
 
-def path_cost(graph: nx, path: [], payment_amount: int = 0) -> Tuple[int, list]:
+    return index
+
+
+def path_cost(graph: nx, path: [], payment_amount: int = 0, cost_index: CostIndex = None) -> Tuple[int, list]:
     """
     Traverses the given path to determine its total path cost and the value for each hop, thus, the function gathers
-    the channels from each pair of nodes on the path, then it calculates the lowest fees for policy_source and
-    policy_destiny and finally determines the lowest fee between both policies
+    from the cost index the channel of each pair of nodes on the path with the lowest fee between policy_source and
+    policy_destiny
 
     :param payment_amount: amount to be paid to destiny node
     :param graph: structure that contains the whole data about the network
     :param path: route to transverse to get its path cost
+    :param cost_index: compiled costs of the graph for the payment amount
     :return: cost of the given path, and the fee charged on each hop
     """
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
     path_costs = 0
     key_values = []
-    val = None
-    fee = None
-    for i in range(len(path)):
-        if i > 0:
-            edge = (path[i - 1], path[i])
-            channels = graph.get_edge_data(*edge)
-            if 0 not in channels and 1 not in channels:
-                val_dest, val_source = get_min_source_dest_channels(channels, payment_amount)
-                if val_source[1]['policy_source'] is not None:
-                    if val_dest[1]['policy_dest'] is not None:
-                        min_htlc_source = 1 if 'min_htlc' not in val_source[1]['policy_source'] else \
-                            int(val_source[1]['policy_source']['min_htlc'])
-                        min_htlc_dest = 1 if 'min_htlc' not in val_dest[1]['policy_dest'] else \
-                            int(val_dest[1]['policy_dest']['min_htlc'])
-                        if int(val_source[1]['policy_source']['fee_base_msat']) <= int(
-                                val_dest[1]['policy_dest']['fee_base_msat']) \
-                                and min_htlc_source <= min_htlc_dest:
-                            fee = int(val_source[1]['policy_source']['fee_base_msat'])
-                            val = val_source[0]
-                        else:
-                            fee = int(val_dest[1]['policy_dest']['fee_base_msat'])
-                            val = val_dest[0]
-                    else:
-                        fee = int(val_source[1]['policy_source']['fee_base_msat'])
-                        val = val_source[0]
-                else:
-                    if val_dest[1]['policy_dest'] is not None:
-                        fee = int(val_dest[1]['policy_dest']['fee_base_msat'])
-                        val = val_dest[0]
-                key_values.append((val, fee))
-                path_costs += fee
+    for i in range(1, len(path)):
+        key, fee = cost_index.hop(path[i - 1], path[i])
+        if fee is not None:
+            key_values.append((key, fee))
+            path_costs += fee
     return path_costs, key_values
 
 
-def calculate_weight(graph: nx, u, v, payment_amount: int = 0) -> int:
+def encode_paths(cost_index: CostIndex, paths: list) -> np.ndarray:
+    """
+    Encodes a list of paths of nodes as an array of positions of their directed edges on the cost index, the paths are
+    padded with -1 up to the length of the longest path
+
+    :param cost_index: compiled costs of the graph for the payment amount
+    :param paths: list of paths of nodes
+    :return: array paths x hops with the position of each directed edge, -1 for the padding and the missing edges
+    """
+    edges = np.full((len(paths), max((len(path) - 1 for path in paths), default=0)), -1, dtype=np.int64)
+    for i, path in enumerate(paths):
+        for j in range(len(path) - 1):
+            pos = cost_index.position(path[j], path[j + 1])
+            if pos is not None:
+                edges[i, j] = pos
+    return edges
+
+
+def path_costs(graph: nx, paths: list, payment_amount: int = 0,
+               cost_index: CostIndex = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Evaluates the costs of many paths at once, i.e. the same costs given by path_cost, from the arrays of the cost index
+    gathered by the positions of the directed edges of the paths
+
+    :param graph: structure that contains the whole data about the network
+    :param paths: list of paths of nodes
+    :param payment_amount: amount to be paid to destiny node
+    :param cost_index: compiled costs of the graph for the payment amount
+    :return: total fees of each path, and fee, time lock delta and position of each hop (paths x hops, the fee and time
+    lock delta are 0 on the padding)
+    """
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    edges = encode_paths(cost_index, paths)
+    is_hop = edges >= 0
+    fees = np.where(is_hop, cost_index.fee_array[np.where(is_hop, edges, 0)], 0)
+    time_locks = np.where(is_hop, cost_index.time_lock_array[np.where(is_hop, edges, 0)], 0)
+    return fees.sum(axis=1), fees, time_locks, edges
+
+
+def calculate_weight(graph: nx, u, v, payment_amount: int = 0, cost_index: CostIndex = None) -> int:
     """
     Calculates the weight (cost given by the fee) for each pair of nodes (u, v) by comparing that either value between
     the fees of the source policy and destiny policy is the lowest, therefore, this method is used to determine the
     shortest past between node origin and node destiny. Hence, the cost of the path is essential to get this path.
+    The weight is read from the cost index of the graph for the payment amount
 
     :param payment_amount: amount to be paid to node destiny
     :param graph: structure that contains the whole data about the network
     :param u: node u
     :param v: node v
+    :param cost_index: compiled costs of the graph for the payment amount
     :return: cost of channel
     """
-    cost = None
-    channels = graph.get_edge_data(*(u, v))
-    if 0 not in channels and 1 not in channels:
-        val_dest, val_source = get_min_source_dest_channels(channels, payment_amount)
-        if val_source[1]['policy_source'] is not None:
-            if val_dest[1]['policy_dest'] is not None:
-                min_htlc_source = 1 if 'min_htlc' not in val_source[1]['policy_source'] else \
-                    int(val_source[1]['policy_source']['min_htlc'])
-                min_htlc_dest = 1 if 'min_htlc' not in val_dest[1]['policy_dest'] else \
-                    int(val_dest[1]['policy_dest']['min_htlc'])
-                if int(val_source[1]['policy_source']['fee_base_msat']) <= int(val_dest[1]['policy_dest']['fee_base_msat']) \
-                        and min_htlc_source <= min_htlc_dest:
-                    cost = int(val_source[1]['policy_source']['fee_base_msat']) + min_htlc_source
-                else:
-                    cost = int(val_dest[1]['policy_dest']['fee_base_msat']) + min_htlc_dest
-            else:
-                cost = int(val_source[1]['policy_source']['fee_base_msat']) + \
-                       int(val_source[1]['policy_source']['min_htlc'])
-        else:
-            if val_dest[1]['policy_dest'] is not None:
-                cost = int(val_dest[1]['policy_dest']['fee_base_msat']) + int(val_dest[1]['policy_dest']['min_htlc'])
-
-    return cost
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    return cost_index.weight(u, v)
 
 
 def get_min_source_dest_channels(channels, payment_amount: int):
@@ -104,17 +339,19 @@ def get_min_source_dest_channels(channels, payment_amount: int):
     val_source = min(channels.items(), key=lambda val_channels: 'policy_source' in val_channels[1]
                                                                 and val_channels[1]['policy_source'] is not None
                                                                 and not val_channels[1]['policy_source']['disabled']
-                                                                and int(
-        val_channels[1]['policy_source']['min_htlc']) < payment_amount
-                                                                and int(val_channels[1]['balance']) > int(
-        val_channels[1]['policy_source']['fee_base_msat']) + payment_amount)
+                                                                and val_channels[1]['policy_source']['min_htlc']
+                                                                < payment_amount
+                                                                and val_channels[1]['balance'] >
+                                                                val_channels[1]['policy_source']['fee_base_msat']
+                                                                + payment_amount)
     val_dest = min(channels.items(), key=lambda val_channels: 'policy_dest' in val_channels[1]
                                                               and val_channels[1]['policy_dest'] is not None
                                                               and not val_channels[1]['policy_dest']['disabled']
-                                                              and int(
-        val_channels[1]['policy_dest']['min_htlc']) < payment_amount
-                                                              and int(val_channels[1]['balance']) > int(
-        val_channels[1]['policy_dest']['fee_base_msat']) + payment_amount)
+                                                              and val_channels[1]['policy_dest']['min_htlc']
+                                                              < payment_amount
+                                                              and val_channels[1]['balance'] >
+                                                              val_channels[1]['policy_dest']['fee_base_msat']
+                                                              + payment_amount)
     return val_dest, val_source
 
 
@@ -129,108 +366,439 @@ def validate_policies(source, dest) -> Tuple[int, int, int]:
     """
     if source is not None:
         if dest is not None:
-            if int(source['min_htlc']) <= int(dest['min_htlc']) and int(source['fee_base_msat']) < int(
-                    dest['fee_base_msat']):
-                min_htlc = int(source['min_htlc'])
-                fee = int(source['fee_base_msat'])
-                fee_rate = int(source['fee_rate_milli_msat'])
+            if source['min_htlc'] <= dest['min_htlc'] and source['fee_base_msat'] < dest['fee_base_msat']:
+                min_htlc = source['min_htlc']
+                fee = source['fee_base_msat']
+                fee_rate = source['fee_rate_milli_msat']
             else:
-                min_htlc = int(dest['min_htlc'])
-                fee = int(dest['fee_base_msat'])
-                fee_rate = int(dest['fee_rate_milli_msat'])
+                min_htlc = dest['min_htlc']
+                fee = dest['fee_base_msat']
+                fee_rate = dest['fee_rate_milli_msat']
         else:
-            min_htlc = int(source['min_htlc'])
-            fee = int(source['fee_base_msat'])
-            fee_rate = int(source['fee_rate_milli_msat'])
+            min_htlc = source['min_htlc']
+            fee = source['fee_base_msat']
+            fee_rate = source['fee_rate_milli_msat']
     else:
-        min_htlc = int(dest['min_htlc'])
-        fee = int(dest['fee_base_msat'])
-        fee_rate = int(dest['fee_rate_milli_msat'])
+        min_htlc = dest['min_htlc']
+        fee = dest['fee_base_msat']
+        fee_rate = dest['fee_rate_milli_msat']
 
     return min_htlc, fee, fee_rate
 
 
-def spy(graph: nx, source: str, target: str, num_k: int, payment_amount: int) -> Tuple[list, list]:
+def shortest_path(graph: nx, source: str, target: str, weight, heuristic=None) -> Tuple[int, list]:
+    """
+    Gets the shortest path between a source node and a target node, by means of a Dijkstra or, when a heuristic is
+    given, by means of an A* search. Both searches are the same search (the heuristic of the Dijkstra is 0), whose ties
+    are broken in the same way, so both find the same path: among the paths with the least cost, the one with the
+    fewest hops, and among them, the predecessor of each node is the least node (pub key) from which it is reached.
+    The heuristic must be consistent, as the lower bounds of the landmarks are
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param weight: function that returns the cost of a directed edge, None if the edge can not be used
+    :param heuristic: function that returns the estimated cost from a node to the target node
+    :return: cost of the path and the path
+    """
+    if source not in graph or target not in graph:
+        raise nx.NodeNotFound("Either source {} or target {} is not in G".format(source, target))
+    # Cost and number of hops of the paths found to each node, and the predecessor of each node on them
+    distances = {source: (0, 0)}
+    predecessors = {source: None}
+    settled = set()
+    # Entry: (cost + heuristic, cost, hops, node), the nodes with the same estimate are settled in order of cost and
+    # hops, so the predecessors of a node on its shortest paths are settled before it
+    heap = [(0 if heuristic is None else heuristic(source, target), 0, 0, source)]
+    while heap:
+        _, cost, hops, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        if node == target:
+            path = [target]
+            while predecessors[path[-1]] is not None:
+                path.append(predecessors[path[-1]])
+            return cost, path[::-1]
+        settled.add(node)
+        for successor in graph.adj[node]:
+            if successor in settled:
+                continue
+            cost_edge = weight(node, successor, None)
+            if cost_edge is None:
+                continue
+            distance = (cost + cost_edge, hops + 1)
+            known = distances.get(successor)
+            if known is None or distance < known:
+                distances[successor] = distance
+                predecessors[successor] = node
+                heapq.heappush(heap, (distance[0] + (0 if heuristic is None else heuristic(successor, target)),
+                                      distance[0], distance[1], successor))
+            elif distance == known and node < predecessors[successor]:
+                predecessors[successor] = node
+    raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+
+def search_graph(graph: nx, payment_amount: int, channel_index: ci.ChannelIndex = None) -> nx:
+    """
+    Gets the graph on which the paths of a payment amount are searched, i.e. the graph itself, or the view of the graph
+    without the channels that can not forward the payment amount when the channel index is given. The costs of the
+    searches and of the paths found must be taken from the cost index of the same graph, so the channel charged on each
+    hop is one of the channels of the view
+
+    :param graph: structure that contains the whole data about the network
+    :param payment_amount: amount to be paid to node destiny
+    :param channel_index: channels of the graph that can forward each payment amount
+    :return: graph or view of the graph
+    """
+    return graph if channel_index is None else channel_index.view(payment_amount)
+
+
+def spur_path(graph: nx, spur_node: str, target: str, payment_amount: int, hidden_nodes: set, hidden_edges: set,
+              weight, heuristic=None, sparse_graph=None) -> Tuple[int, list]:
+    """
+    Gets the spur path of the Yen's algorithm between a spur node and the target node. The edges and nodes of the root
+    path are hidden by the weight of the spur path, so the graph shared among the queries is not modified
+
+    :param graph: structure that contains the whole data about the network
+    :param spur_node: node from which the spur path deviates
+    :param target: node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param hidden_nodes: nodes that the path can not go through
+    :param hidden_edges: directed pairs of nodes that the path can not go through
+    :param weight: function that returns the cost of a directed edge, None if the edge can not be used
+    :param heuristic: function that returns the estimated cost from a node to the target node
+    :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the path
+    :return: cost of the path and the path
+    """
+    if sparse_graph is not None:
+        return sparse_graph.shortest_path(spur_node, target, payment_amount, hidden_nodes, hidden_edges)
+    if not hidden_nodes and not hidden_edges:
+        return shortest_path(graph, spur_node, target, weight, heuristic)
+    return shortest_path(graph, spur_node, target,
+                         lambda u, v, d: None if u in hidden_nodes or v in hidden_nodes or (u, v) in hidden_edges
+                         else weight(u, v), heuristic)
+
+
+def yen_paths(graph: nx, source: str, target: str, payment_amount: int, cost_index: CostIndex = None,
+              landmarks: lm.Landmarks = None, hierarchy: ch.ContractionHierarchy = None, sparse_graph=None,
+              channel_index: ci.ChannelIndex = None, spur_pool=None):
+    """
+    Yields the shortest paths between a source node and a target node in order of cost by means of the Yen's algorithm,
+    the paths are found on demand, thus, the first path costs a single search and the spur paths of a path are only
+    searched when the following path is requested. Initially the method calculates the shortest path, which becomes
+    the seed path. From there the algorithm uses a heap with the possible candidates to be yielded, along with a set of
+    the paths already found to discard duplicates. Additionally, the algorithm uses a root path which is the deviation
+    of the last path, and the spur node which is the node from which it finds the alternative routes. Both the seed
+    path and the spur paths are weighted by the cost index, and as Lawler's variant, the spur nodes of a path previous
+    to its deviation are not expanded again since they were expanded on the path from which it derives. Hence, the cost
+    of each path is at most L searches, where L is the length of the previous path. When the landmarks are given, the
+    searches are A* searches guided by the lower bounds of the landmarks (ALT), which find the same paths (see
+    shortest_path) while exploring fewer nodes. When the contraction hierarchy is given, the seed path is taken from the
+    hierarchy as long as its cost is the actual cost for the payment amount, otherwise it is found by Dijkstra. When the
+    sparse graph is given, the searches are run by the Dijkstra of scipy on its CSR arrays instead of networkx. When the
+    channel index is given, the searches run on the view of the graph without the channels that can not forward the
+    payment amount (search_graph), whose cost index must be given if any (the CSR arrays are not used, since they do
+    not depend on the balances). When the spur pool is given, the spur searches of each path are spread among its
+    processes.
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param cost_index: compiled costs of the graph for the payment amount
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search
+    :param hierarchy: contraction hierarchy of the graph used to find the seed path
+    :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the paths
+    :param channel_index: channels of the graph that can forward each payment amount
+    :param spur_pool: pool of processes (route_pool.SpurPool) that runs the spur searches of each path
+    :return: generator of paths of nodes from source to target
+    """
+    graph = search_graph(graph, payment_amount, channel_index)
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    heuristic = None if landmarks is None else landmarks.heuristic(target)
+    weight = cost_index.weight
+    if channel_index is not None:
+        sparse_graph = None
+
+    def search(spur_node: str, hidden_nodes: set, hidden_edges: set) -> Tuple[int, list]:
+        return spur_path(graph, spur_node, target, payment_amount, hidden_nodes, hidden_edges, weight, heuristic,
+                         sparse_graph)
+
+    seed = None if hierarchy is None else hierarchy.shortest_path(source, target, weight)
+    if seed is None:
+        seed = search(source, set(), set())
+    short_path = [seed[1]]
+    deviations = [0]
+    yield list(seed[1])
+
+    sub_short_path = []
+    found_paths = {tuple(short_path[0])}
+
+    while True:
+        last_path = short_path[-1]
+        # The root paths end at the first pair of nodes that is hidden or cannot forward the amount anymore, since
+        # there is no cost for the deviations past it
+        root_costs = [0]
+        for i in range(len(last_path) - 1):
+            cost = weight(last_path[i], last_path[i + 1])
+            if cost is None:
+                break
+            root_costs.append(root_costs[i] + cost)
+        deviation_end = min(len(last_path) - 1, len(root_costs))
+
+        # The spur searches of a round only depend on the paths already found, thus, they may run on a pool
+        spurs = [(last_path[i], set(last_path[:i]), {(path[i], path[i + 1]) for path in short_path
+                                                     if len(path) - 1 > i and path[:i + 1] == last_path[:i + 1]})
+                 for i in range(deviations[-1], deviation_end)]
+        if spur_pool is not None and len(spurs) > 1:
+            found = spur_pool.map(target, payment_amount, spurs)
+        else:
+            found = []
+            for spur in spurs:
+                try:
+                    found.append(search(*spur))
+                except nx.NetworkXNoPath:
+                    found.append(None)
+
+        for i, spur in zip(range(deviations[-1], deviation_end), found):
+            if spur is None:
+                continue
+            spur_cost, spur_nodes = spur
+            total_path = tuple(last_path[:i] + spur_nodes)
+            if total_path not in found_paths:
+                found_paths.add(total_path)
+                heapq.heappush(sub_short_path, (root_costs[i] + spur_cost, total_path, i))
+
+        if not sub_short_path:
+            return
+        cost_, path_, deviation = heapq.heappop(sub_short_path)
+        short_path.append(list(path_))
+        deviations.append(deviation)
+        yield list(path_)
+
+
+def spy(graph: nx, source: str, target: str, num_k: int, payment_amount: int,
+        cost_index: CostIndex = None, landmarks: lm.Landmarks = None,
+        hierarchy: ch.ContractionHierarchy = None, sparse_graph=None,
+        channel_index: ci.ChannelIndex = None, spur_pool=None) -> Tuple[list, list]:
     """
     Gets the shortest paths according to a given num_k between a source node, and a target node which forward a certain
-    payment amount and fees through a path of nodes. Initially the method calculates the shortest path, which becomes
-    the seed path. From there this implementation of Yen's algorithm find out the num_k the shortest paths which path
-    costs are similar or slightly greater than the cost of seed path. To achieve those paths, the algorithm makes use of
-    a couple of queues (A y B), the first one is on charge of gather the final shortest paths, and the other one has the
-    possible candidates to be passed to the first queue. Additionally, the algorithm uses a root path which is the
-    deviation of the seed path, and the spur node which is the node from which it finds the alternative routes.
+    payment amount and fees through a path of nodes. The paths are taken from the generator of the Yen's algorithm
+    (yen_paths), which finds the num_k the shortest paths which path costs are similar or slightly greater than the
+    cost of seed path, and the costs of the paths found are evaluated at once
 
     :param graph: structure that contains the whole data about the network
     :param source: node origin
     :param target: node destiny
     :param num_k: number of the shortest path found from the seed path
     :param payment_amount: amount to be paid to node destiny
+    :param cost_index: compiled costs of the graph for the payment amount
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search
+    :param hierarchy: contraction hierarchy of the graph used to find the seed path
+    :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the paths
+    :param channel_index: channels of the graph that can forward each payment amount
+    :param spur_pool: pool of processes (route_pool.SpurPool) that runs the spur searches of each path
     :return: list of the shortest paths and the cost of each one
     """
+    graph = search_graph(graph, payment_amount, channel_index)
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
     try:
-        short_path = [nx.shortest_path(graph, source, target,
-                                       weight=lambda u, v, d: calculate_weight(graph, u, v, payment_amount))]
-        short_path_costs = [path_cost(graph, short_path[0], payment_amount)]
-
-        sub_short_path = queue.PriorityQueue()
-
-        for k in range(1, num_k):
-            try:
-                for i in range(len(short_path[k - 1]) - 1):
-                    spur_node = short_path[k - 1][i]
-                    root_path = short_path[k - 1][:i]
-
-                    removed_edges = []
-                    for path in short_path:
-                        if len(path) - 1 > i and root_path == path[:i]:
-                            edge = (path[i], path[i + i])
-                            if not graph.has_edge(*edge):
-                                continue
-                            removed_edges.append((edge, graph.get_edge_data(*edge)))
-                            graph.remove_edge(*edge)
-                    try:
-                        spur_path = nx.shortest_path(graph, spur_node, target)
-                        total_path = root_path + spur_path
-                        total_path_cost = path_cost(graph, total_path)
-                        sub_short_path.put((total_path_cost, total_path))
-                    except nx.NetworkXNoPath:
-                        pass
-                    for removedEdge in removed_edges:
-                        graph.add_edge(*removedEdge[0], **removedEdge[1])
-                while True:
-                    try:
-                        cost_, path_ = sub_short_path.get(False)
-                        if path_ not in short_path:
-                            short_path.append(path_)
-                            short_path_costs.append(cost_)
-                            break
-                    except queue.Empty:
-                        break
-            except IndexError:
-                pass
-        return short_path, short_path_costs
+        short_path = list(itertools.islice(yen_paths(graph, source, target, payment_amount, cost_index, landmarks,
+                                                     hierarchy, sparse_graph, channel_index, spur_pool),
+                                           max(num_k, 1)))
+        return short_path, evaluate_paths(graph, short_path, payment_amount, cost_index)
     except nx.NodeNotFound as e:
         print('%s%s*** ERROR ON SHORTEST PATH YEN: %s' % (utils.spaces, utils.spaces, e))
         return None
 
 
+def disjoint_paths(graph: nx, source: str, target: str, num_k: int, payment_amount: int,
+                   cost_index: CostIndex = None, is_node_disjoint: bool = False,
+                   channel_index: ci.ChannelIndex = None) -> Tuple[list, list]:
+    """
+    Gets up to num_k paths between a source node and a target node that do not share any directed pair of nodes (nor any
+    intermediate node when is_node_disjoint), with the min total cost, by means of the Suurballe's algorithm as
+    Bhandari's successive shortest paths. Each path is a Dijkstra search on the residual graph of the paths found so
+    far, where the pairs of nodes used by a path can only be crossed backwards at the negative of their cost, and the
+    costs are reduced by the distances of the previous search (Johnson's potentials) to keep them non-negative. The
+    pairs of nodes crossed backwards are dropped from both paths, hence, num_k paths cost num_k searches and the paths
+    are diverse fallbacks unlike the paths of the Yen's algorithm, which often share most of their hops. When a node
+    must not be shared, each intermediate node is split into an entry and an exit joined by a pair of nodes of cost 0
+
+    :param graph: structure that contains the whole data about the network
+    :param source: node origin
+    :param target: node destiny
+    :param num_k: max number of disjoint paths
+    :param payment_amount: amount to be paid to node destiny
+    :param cost_index: compiled costs of the graph for the payment amount
+    :param is_node_disjoint: indicates that the paths do not share intermediate nodes either
+    :param channel_index: channels of the graph that can forward each payment amount
+    :return: list of the disjoint paths sorted by cost and the cost of each one
+    """
+    graph = search_graph(graph, payment_amount, channel_index)
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    weight = cost_index.weight
+    if source not in graph or target not in graph:
+        print('%s%s*** ERROR ON DISJOINT PATHS: Either source %s or target %s is not in G' % (utils.spaces,
+                                                                                            utils.spaces, source,
+                                                                                            target))
+        return None
+
+    # Directed pairs of nodes used by the paths, by node u and by node v (as dictionaries to keep the order)
+    flow_out, flow_in = {}, {}
+    # A state is a node (node, 0) or, when is_node_disjoint, the entry (node, 0) or the exit (node, 1) of a node
+    exit_side = 1 if is_node_disjoint else 0
+
+    def is_split(node) -> bool:
+        return is_node_disjoint and node != source and node != target
+
+    def residual(state):
+        node, side = state
+        if side == exit_side:
+            for v in graph.succ[node]:
+                if v not in flow_out.get(node, ()):
+                    w = weight(node, v)
+                    if w is not None:
+                        yield (v, 0), w
+            if is_split(node) and node in flow_out:
+                yield (node, 0), 0
+        if side == 0:
+            for u in flow_in.get(node, ()):
+                yield (u, exit_side), -weight(u, node)
+            if exit_side == 1 and (not is_split(node) or node not in flow_out):
+                yield (node, 1), 0
+
+    potentials = {}
+    for _ in range(max(num_k, 1)):
+        # Dijkstra on the reduced costs of the residual graph
+        distances, parents = {(source, exit_side): 0}, {(source, exit_side): None}
+        heap, settled = [(0, 0, (source, exit_side))], set()
+        counter = itertools.count(1)
+        while heap:
+            cost, _, state = heapq.heappop(heap)
+            if state in settled:
+                continue
+            settled.add(state)
+            for successor, w in residual(state):
+                if successor in settled or (potentials and successor not in potentials):
+                    continue
+                reduced = cost + w + potentials.get(state, 0) - potentials.get(successor, 0)
+                if reduced < distances.get(successor, math.inf):
+                    distances[successor] = reduced
+                    parents[successor] = state
+                    heapq.heappush(heap, (reduced, next(counter), successor))
+        if (target, 0) not in settled:
+            break
+        potentials = {state: potentials.get(state, 0) + distances[state] for state in settled}
+
+        state = (target, 0)
+        while parents[state] is not None:
+            (u, _), (v, _) = parents[state], state
+            if u != v:
+                if u in flow_out.get(v, ()):
+                    del flow_out[v][u]
+                    del flow_in[u][v]
+                else:
+                    flow_out.setdefault(u, {})[v] = None
+                    flow_in.setdefault(v, {})[u] = None
+            state = parents[state]
+        for flows in (flow_out, flow_in):
+            for node in [node for node, nodes in flows.items() if not nodes]:
+                del flows[node]
+
+    # The directed pairs of nodes used are split into paths, the cycles of cost 0 are skipped
+    paths = []
+    while source in flow_out:
+        path, positions = [source], {source: 0}
+        while path[-1] != target:
+            u = path[-1]
+            v = next(iter(flow_out[u]))
+            del flow_out[u][v]
+            if not flow_out[u]:
+                del flow_out[u]
+            if v in positions:
+                del path[positions[v] + 1:]
+                positions = {node: i for i, node in enumerate(path)}
+            else:
+                positions[v] = len(path)
+                path.append(v)
+        paths.append(path)
+    if not paths:
+        raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+
+    costs = evaluate_paths(graph, paths, payment_amount, cost_index)
+    order = sorted(range(len(paths)), key=lambda i: (costs[i][0], len(paths[i])))
+    return [paths[i] for i in order], [costs[i] for i in order]
+
+
+def evaluate_paths(graph: nx, paths: list, payment_amount: int, cost_index: CostIndex = None) -> list:
+    """
+    Evaluates at once the costs of a set of paths as returned by path_cost
+
+    :param graph: structure that contains the whole data about the network
+    :param paths: list of paths of nodes
+    :param payment_amount: amount to be paid to node destiny
+    :param cost_index: compiled costs of the graph for the payment amount
+    :return: cost of each path and the channel and fee of each hop
+    """
+    cost_index = get_cost_index(graph, payment_amount) if cost_index is None else cost_index
+    totals, fees, _, edges = path_costs(graph, paths, payment_amount, cost_index)
+    return [(int(totals[i]), [(cost_index.keys[pos], fee) for pos, fee in zip(edges[i].tolist(), fees[i].tolist())
+                              if pos >= 0 and cost_index.keys[pos] is not None])
+            for i in range(len(paths))]
+
+
+def query_routes_yen(graph1: nx, graph2: nx, pubkey_origin: str, pubkey_destiny: str, payment_amount: int,
+                     num_k: int = None, landmarks: lm.Landmarks = None, hierarchy: ch.ContractionHierarchy = None,
+                     sparse_graph=None, channel_index: ci.ChannelIndex = None, spur_pool=None):
+    """
+    Yields the payments of the shortest paths between node origin and node destiny in order of cost, so a caller that
+    retries a payment with an alternative route only pays for the searches of the routes that it pulls
+
+    :param graph1: contains detailed data about the network
+    :param graph2: contains specific data about the network
+    :param pubkey_origin: pub key of the node origin
+    :param pubkey_destiny: pub key of the node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param num_k: max number of routes yielded, None to yield all of them
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+    :param hierarchy: contraction hierarchy of the graph used to find the seed path
+    :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the paths
+    :param channel_index: channels of the graph that can forward each payment amount
+    :param spur_pool: pool of processes (route_pool.SpurPool) that runs the spur searches of each path
+    :return: generator of route_payment.Payment
+    """
+    cost_index = get_cost_index(search_graph(graph2, payment_amount, channel_index), payment_amount)
+    for path in itertools.islice(yen_paths(graph2, pubkey_origin, pubkey_destiny, payment_amount, cost_index,
+                                           landmarks, hierarchy, sparse_graph, channel_index, spur_pool),
+                                 None if num_k is None else max(num_k, 1)):
+        yield create_payment(graph1, graph2, pubkey_origin, pubkey_destiny, payment_amount, path,
+                             evaluate_paths(graph2, [path], payment_amount, cost_index)[0])
+
+
 def query_route_yen(graph1: nx, graph2: nx, node_origin: str, node_destiny: str, payment_amount: int, num_k: int,
-                    is_manual_test: bool = False) -> route_pay.Payment:
+                    is_manual_test: bool = False, landmarks: lm.Landmarks = None,
+                    hierarchy: ch.ContractionHierarchy = None, sparse_graph=None,
+                    channel_index: ci.ChannelIndex = None, spur_pool=None) -> route_pay.Payment:
     """
     Creates the structure that contains the payment with relevant data such as nodes origin and destiny, route with the
     hops and its data and totals (amt, fee, time lock and success probability)
 
-    :param num_k: number of sub paths to get with the algorithm
+    :param num_k: number of sub paths to get with the algorithm, the first one is used as route
     :param graph1: contains detailed data about the network
     :param graph2: contains specific data about the network
     :param node_origin: alias of the node origin
     :param node_destiny: alias of the node destiny
     :param payment_amount: amount to be paid to node destiny
     :param is_manual_test: indicates if the test is manual, thus, the node_destiny and node_origin contain their aliases
+    :param landmarks: lower bounds of the costs used as heuristic of an A* search (ALT)
+    :param hierarchy: contraction hierarchy of the graph used to find the seed path
+    :param sparse_graph: CSR arrays of the graph (sparse_graph.SparseGraph) used to find the paths
+    :param channel_index: channels of the graph that can forward each payment amount
+    :param spur_pool: pool of processes (route_pool.SpurPool) that runs the spur searches of each path
     :return: Payment that contains data about both nodes and route, totals (amt, fee, time lock and success
     probability)
     """
-    routes = {}
     if is_manual_test:
         pubkey_origin = utils.get_pubkey_alias(node_origin, graph1)
         pubkey_destiny = utils.get_pubkey_alias(node_destiny, graph1)
@@ -238,68 +806,12 @@ def query_route_yen(graph1: nx, graph2: nx, node_origin: str, node_destiny: str,
         pubkey_origin = node_origin
         pubkey_destiny = node_destiny
 
-    hop_temp = {'chan_id': '', 'chan_capacity': '', 'amt_to_forward': 0.0, 'fee': 0.0, 'expiry': 0,
-                'amt_to_forward_msat': 0.0,
-                'fee_msat': 0.0, 'pub_key': '', 'tlv_payload': True}
-
     if pubkey_origin is not None and pubkey_destiny is not None:
-        paths = spy(graph2.copy(), pubkey_origin, pubkey_destiny, num_k, payment_amount)
+        paths = spy(graph2, pubkey_origin, pubkey_destiny, num_k, payment_amount, landmarks=landmarks,
+                    hierarchy=hierarchy, sparse_graph=sparse_graph, channel_index=channel_index, spur_pool=spur_pool)
         if paths is not None:
-            nodes = paths[0][0]
-            channels = paths[1][0]
-            routes['routes'] = [{'total_time_lock': 0, 'total_fees': 0, 'total_amt': 0, 'hops': [], 'total_fees_msat': 0,
-                                 'total_amt_msat': 0}]
-            routes['success_prob'] = 1 / len(nodes)
-
-            amt_fee_msat = 0
-            ln = 0 if len(channels[1]) == 1 else len(channels[1]) - 1 if len(channels[1]) == 2 else len(channels[1]) - 2
-            for c in channels[1][0:ln]:
-                amt_fee_msat += c[1] if c[1] >= 1000 else 1000
-
-            val_hop = int((payment_amount * 1000 + amt_fee_msat) / 1000)
-
-            routes['routes'][0]['total_fees_msat'] = amt_fee_msat
-            routes['routes'][0]['total_amt_msat'] = val_hop * 1000
-            routes['routes'][0]['total_fees'] = int(amt_fee_msat / 1000)
-            routes['routes'][0]['total_amt'] = val_hop
-
-            for i, val in enumerate(nodes):
-                if i < len(nodes) - 1:
-                    channel = graph2[val][nodes[i + 1]][channels[1][i][0]]
-                    hop = hop_temp.copy()
-                    routes['routes'][0]['total_time_lock'] += channel['policy_source']['time_lock_delta']
-
-                    hop['chan_id'] = channels[1][i][0].split('-')[0]
-                    hop['chan_capacity'] = channel['capacity']
-                    if i != 0 and i != len(nodes) - 2:
-                        # hop['fee'] = int(1 if int(channel['policy_source']['fee_base_msat']) < 1000 else int(
-                        #     channel['policy_source']['fee_base_msat']) / 1000)
-                        # hop['fee_msat'] = hop['fee'] * 1000
-                        fee_msat = channels[1][i][1]
-                        hop['fee_msat'] = fee_msat if fee_msat >= 1000 else 1000
-                        hop['fee'] = hop['fee_msat'] / 1000
-                        val_hop -= hop['fee']
-                    if i == 0:
-                        no_fee = 0
-                        if len(channels[1]) <= 2:
-                            no_fee = 0 if len(channels[1]) < 2 else (val_hop - payment_amount) * 1000 if channels[1][0][1] \
-                                                                                                         >= 1000 else 1000
-                        hop['fee_msat'] = no_fee if len(channels[1]) <= 2 else 0
-                        hop['amt_to_forward_msat'] = payment_amount * 1000 if len(channels[1]) <= 2 else \
-                            val_hop * 1000 - hop['fee_msat']
-                        hop['amt_to_forward'] = int(hop['amt_to_forward_msat'] / 1000)
-                        hop['fee'] = int(hop['fee_msat'] / 1000)
-                    hop['amt_to_forward'] = hop['amt_to_forward'] if i == 0 else payment_amount if len(channels[1]) == 2 \
-                        else val_hop
-                    hop['expiry'] = channel['policy_source']['time_lock_delta']
-                    hop['amt_to_forward_msat'] = hop['amt_to_forward'] * 1000
-                    hop['pub_key'] = nodes[i + 1]
-
-                    routes['routes'][0]['hops'].append(hop)
-
-            node_dict, edge_dict = populate_graphs(graph1, graph2)
-
-            return route_pay.create_route(routes, pubkey_origin, pubkey_destiny, payment_amount, edge_dict, node_dict)
+            return create_payment(graph1, graph2, pubkey_origin, pubkey_destiny, payment_amount, paths[0][0],
+                                  paths[1][0])
         else:
             return route_pay.Payment(pubkey_origin, pubkey_destiny, payment_amount, None, time.time_ns(),
                                      error="Nodes not found - YEN - either node is not in graph")
@@ -308,6 +820,93 @@ def query_route_yen(graph1: nx, graph2: nx, node_origin: str, node_destiny: str,
                                  error="Nodes not found - YEN - either node is None")
 
 
+def get_charged_hops(num_hops: int) -> int:
+    """
+    Gets the number of hops of a route whose fees are added to the total fees of its payment, counted from the first
+    hop, i.e. every hop but the last two ones, or the first hop of a route of two hops
+
+    :param num_hops: number of hops of the route
+    :return: number of hops charged
+    """
+    return 0 if num_hops == 1 else num_hops - 1 if num_hops == 2 else num_hops - 2
+
+
+def create_payment(graph1: nx, graph2: nx, pubkey_origin: str, pubkey_destiny: str, payment_amount: int, nodes: list,
+                   channels: Tuple[int, list]) -> route_pay.Payment:
+    """
+    Creates the payment of a path found between node origin and node destiny, i.e. it sets the route with the hops and
+    its data and totals (amt, fee, time lock and success probability)
+
+    :param graph1: contains detailed data about the network
+    :param graph2: contains specific data about the network
+    :param pubkey_origin: pub key of the node origin
+    :param pubkey_destiny: pub key of the node destiny
+    :param payment_amount: amount to be paid to node destiny
+    :param nodes: path of nodes from node origin to node destiny
+    :param channels: cost of the path and the channel and fee of each hop as returned by path_cost
+    :return: Payment that contains data about both nodes and route, totals (amt, fee, time lock and success
+    probability)
+    """
+    routes = {}
+    hop_temp = {'chan_id': '', 'chan_capacity': '', 'amt_to_forward': 0.0, 'fee': 0.0, 'expiry': 0,
+                'amt_to_forward_msat': 0.0,
+                'fee_msat': 0.0, 'pub_key': '', 'tlv_payload': True}
+
+    routes['routes'] = [{'total_time_lock': 0, 'total_fees': 0, 'total_amt': 0, 'hops': [], 'total_fees_msat': 0,
+                         'total_amt_msat': 0}]
+    routes['success_prob'] = 1 / len(nodes)
+
+    amt_fee_msat = 0
+    ln = get_charged_hops(len(channels[1]))
+    for c in channels[1][0:ln]:
+        amt_fee_msat += c[1] if c[1] >= 1000 else 1000
+
+    val_hop = int((payment_amount * 1000 + amt_fee_msat) / 1000)
+
+    routes['routes'][0]['total_fees_msat'] = amt_fee_msat
+    routes['routes'][0]['total_amt_msat'] = val_hop * 1000
+    routes['routes'][0]['total_fees'] = int(amt_fee_msat / 1000)
+    routes['routes'][0]['total_amt'] = val_hop
+
+    for i, val in enumerate(nodes):
+        if i < len(nodes) - 1:
+            channel = graph2[val][nodes[i + 1]][channels[1][i][0]]
+            hop = hop_temp.copy()
+            routes['routes'][0]['total_time_lock'] += channel['policy_source']['time_lock_delta']
+
+            hop['chan_id'] = channels[1][i][0].split('-')[0]
+            hop['chan_capacity'] = channel['capacity']
+            if i != 0 and i != len(nodes) - 2:
+                # hop['fee'] = int(1 if int(channel['policy_source']['fee_base_msat']) < 1000 else int(
+                #     channel['policy_source']['fee_base_msat']) / 1000)
+                # hop['fee_msat'] = hop['fee'] * 1000
+                fee_msat = channels[1][i][1]
+                hop['fee_msat'] = fee_msat if fee_msat >= 1000 else 1000
+                hop['fee'] = hop['fee_msat'] / 1000
+                val_hop -= hop['fee']
+            if i == 0:
+                no_fee = 0
+                if len(channels[1]) <= 2:
+                    no_fee = 0 if len(channels[1]) < 2 else (val_hop - payment_amount) * 1000 if channels[1][0][1] \
+                                                                                                 >= 1000 else 1000
+                hop['fee_msat'] = no_fee if len(channels[1]) <= 2 else 0
+                hop['amt_to_forward_msat'] = payment_amount * 1000 if len(channels[1]) <= 2 else \
+                    val_hop * 1000 - hop['fee_msat']
+                hop['amt_to_forward'] = int(hop['amt_to_forward_msat'] / 1000)
+                hop['fee'] = int(hop['fee_msat'] / 1000)
+            hop['amt_to_forward'] = hop['amt_to_forward'] if i == 0 else payment_amount if len(channels[1]) == 2 \
+                else val_hop
+            hop['expiry'] = channel['policy_source']['time_lock_delta']
+            hop['amt_to_forward_msat'] = hop['amt_to_forward'] * 1000
+            hop['pub_key'] = nodes[i + 1]
+
+            routes['routes'][0]['hops'].append(hop)
+
+    node_dict, edge_dict = get_hop_index(graph1, graph2)
+
+    return route_pay.create_route(routes, pubkey_origin, pubkey_destiny, payment_amount, edge_dict, node_dict)
+
+
 def populate_graphs(g1: nx, g2: nx) -> Tuple[dict, dict]:
     """
     Set the value of dictionaries for the node and edge that will be used to print data about the hops
@@ -326,3 +925,38 @@ def populate_graphs(g1: nx, g2: nx) -> Tuple[dict, dict]:
         dict_edge[e[2]] = e
 
     return dict_node, dict_edge
+
+
+def set_hop_index(g2: nx, node_dict: dict, edge_dict: dict):
+    """
+    Sets the dictionaries for the node and edge of a graph that are already built (i.e. nodeDict and edgeDict of the
+    simulator), so they are shared by the payments created on the graph
+
+    :param g2: contains specific data about the network
+    :param node_dict: dictionary with all the nodes
+    :param edge_dict: dictionary with all the edges (channels) of both graphs
+    """
+    hop_indexes[g2] = (node_dict, edge_dict, g2.number_of_edges(), utils.get_graph_version(g2))
+
+
+def get_hop_index(g1: nx, g2: nx) -> Tuple[dict, dict]:
+    """
+    Gets the dictionaries for the node and edge used to print data about the hops. They are built once per graph
+    instead of once per payment, and built again only when the number of channels of the graph changes. The channels
+    are only counted again when the whole graph is recorded as updated on its journal, since the payments only update
+    the balances of the pairs of nodes recorded on the journal
+
+    :param g1: contains detailed data about the network
+    :param g2: contains specific data about the network
+    :return: dictionaries of nodes and edges
+    """
+    index = hop_indexes.get(g2)
+    if index is not None and index[3] != utils.get_graph_version(g2):
+        if utils.get_graph_updates(g2, index[3]) is None and index[2] != g2.number_of_edges():
+            index = None
+        else:
+            hop_indexes[g2] = index = index[:3] + (utils.get_graph_version(g2),)
+    if index is None:
+        set_hop_index(g2, *populate_graphs(g1, g2))
+        index = hop_indexes[g2]
+    return index[0], index[1]
@@ -0,0 +1,622 @@
+import os
+import sys
+import json
+import struct
+import zipfile
+import numpy as np
+import networkx as nx
+from typing import Iterator, Optional, Tuple
+from ln import utils
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Size of the chunks read from the snapshot file by the stdlib parser
+CHUNK_SIZE = 1 << 20
+# Arrays of the snapshot whose records are streamed into the graphs
+RECORD_ARRAYS = ('nodes', 'edges')
+# Version of the structure of the snapshot cache, the files stored with another version are built again
+CACHE_VERSION = 3
+# Fields of the records stored on the snapshot cache, the ones used by the graphs once their defaults are set
+NODE_FIELDS = ('pub_key', 'last_update', 'alias', 'addresses', 'color', 'features')
+EDGE_FIELDS = ('channel_id', 'chan_point', 'last_update', 'node1_pub', 'node2_pub', 'capacity')
+POLICY_FIELDS = ('node1_policy', 'node2_policy')
+# Position of the policy of an edge on the snapshot cache when the edge has no such a key
+MISSING_POLICY = -1
+# Kinds of the values of the snapshot cache, the numbers are stored on arrays of their own and the strings on a buffer
+# of utf-8 bytes, only the lists and dicts (addresses and features of the nodes) are stored as json on the buffer
+KIND_NONE, KIND_BOOL, KIND_INT, KIND_FLOAT, KIND_TEXT, KIND_JSON = range(6)
+
+
+class RecordReader:
+    """
+    Stdlib parser of the snapshot that decodes the records of its arrays of nodes and edges one at a time from chunks
+    of the file, so only the record being parsed and the unread remainder of the current chunk are held in memory
+    """
+
+    def __init__(self, file, chunk_size: int = CHUNK_SIZE):
+        """
+        Sets the file from which the records are read
+
+        :param file: snapshot opened as a text file
+        :param chunk_size: number of characters read from the file at a time
+        """
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.is_eof = False
+
+    def __read(self) -> bool:
+        """
+        Appends the next chunk of the file to the unread part of the buffer. The chunk is at least as large as the
+        unread part so that a value spread over several chunks is decoded in linear time
+
+        :return: false if the end of the file was reached already
+        """
+        if self.is_eof:
+            return False
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.is_eof = chunk == ''
+        return not self.is_eof
+
+    def __error(self, message: str):
+        """
+        Raises the error of a malformed snapshot at the current position of the buffer
+
+        :param message: description of the error
+        """
+        raise json.JSONDecodeError(message, self.buffer, self.pos)
+
+    def __peek(self) -> str:
+        """
+        Skips the whitespaces up to the next character of the snapshot
+
+        :return: next character or an empty string at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.__read():
+                return ''
+
+    def __expect(self, chars: str) -> str:
+        """
+        Consumes the next character of the snapshot, which must be one of the given ones
+
+        :param chars: characters allowed
+        :return: character consumed
+        """
+        char = self.__peek()
+        if char == '' or char not in chars:
+            self.__error("Expecting one of '{}'".format(chars))
+        self.pos += 1
+        return char
+
+    def __decode(self):
+        """
+        Decodes the next value of the snapshot, reading more chunks while the value is incomplete. A value that ends
+        with the buffer is decoded again with the next chunk since a number could continue on it
+
+        :return: value decoded
+        """
+        self.__peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.__read():
+                    continue
+                raise
+            if end < len(self.buffer) or not self.__read():
+                self.pos = end
+                return value
+
+    def records(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Parses the snapshot, yielding the records of the arrays of nodes and edges as they are decoded. Any other value
+        of the snapshot is decoded and discarded.
+
+        :return: name of the array and record
+        """
+        self.__expect('{')
+        if self.__peek() == '}':
+            return
+        while True:
+            key = self.__decode()
+            if not isinstance(key, str):
+                self.__error("Expecting property name enclosed in double quotes")
+            self.__expect(':')
+            if key in RECORD_ARRAYS and self.__peek() == '[':
+                self.pos += 1
+                if self.__peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.__decode()
+                        if self.__expect(',]') == ']':
+                            break
+            else:
+                self.__decode()
+            if self.__expect(',}') == '}':
+                break
+        if self.__peek() != '':
+            self.__error("Extra data")
+
+
+def get_records_ijson(location: str, file_name: str) -> Iterator[Tuple[str, dict]]:
+    """
+    Parses the snapshot by means of ijson, building the records of the arrays of nodes and edges one at a time. Each
+    array is read on its own pass over the file, so the nodes are always given ahead of the edges
+
+    :param location: directory in which the file is located
+    :param file_name: name of the file
+    :return: name of the array and record
+    """
+    for key in RECORD_ARRAYS:
+        with open(os.path.join(location, file_name), 'rb') as f:
+            for record in ijson.items(f, key + '.item', use_float=True):
+                yield key, record
+
+
+def get_records(location: str, file_name: str, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, dict]]:
+    """
+    Streams the records of the nodes and edges of a snapshot by means of ijson when it is installed, otherwise by means
+    of the stdlib parser
+
+    :param location: directory in which the file is located
+    :param file_name: name of the file
+    :param chunk_size: number of characters read at a time by the stdlib parser
+    :return: name of the array and record
+    """
+    if ijson is not None:
+        yield from get_records_ijson(location, file_name)
+    else:
+        with open(os.path.join(location, file_name), encoding="utf8") as f:
+            yield from RecordReader(f, chunk_size).records()
+
+
+def load_graphs(location: str, file_name: str, is_message: bool = True, chunk_size: int = CHUNK_SIZE,
+                is_cache: bool = False, is_stats: bool = False) -> Optional[Tuple[nx.MultiGraph, nx.MultiDiGraph, dict,
+                                                                                  dict]]:
+    """
+    Loads the g1 and g2 graphs from a snapshot without holding the whole json file in memory. Each node and edge is set
+    as it is parsed and added straight to the graphs, so the snapshot yields the same graphs as populate_graphs does.
+    With the cache, the records are decoded from the arrays stored next to the snapshot, which are built again (and
+    stored) only when the snapshot changed
+
+    :param location: directory in which the file is located
+    :param file_name: name of the file
+    :param is_message: indicates whether the nodes and edges are printed as they are loaded
+    :param chunk_size: number of characters read at a time by the stdlib parser
+    :param is_cache: indicates whether the records are loaded from (and stored on) the snapshot cache
+    :param is_stats: indicates whether the time and memory of the build are printed
+    :return: g1, g2, nodeDict, edgeDict or None if the snapshot has no nodes
+    """
+    records = None
+    encoder = None
+    # The keys of the policies are shared by the edges instead of a copy per edge, the cache shares them already
+    is_shared = False
+    if is_cache:
+        path = get_cache_path(location, file_name)
+        cache = SnapshotCache.load(path, location, file_name)
+        if cache is None:
+            print('%sINFO: building snapshot cache of %s' % (utils.spaces, file_name))
+            encoder = SnapshotEncoder(get_cache_signature(location, file_name))
+        else:
+            print('%sINFO: snapshot %s loaded from %s' % (utils.spaces, file_name, path))
+            records = cache.records()
+            is_shared = True
+    if records is None:
+        records = get_records(location, file_name, chunk_size)
+
+    builder = utils.GraphBuilder(is_stats)
+    dict_pub_key = {}
+    # Edges found ahead of the nodes wait until all of them are added, as populate_graphs does
+    pending_edges = []
+    index_node = 0
+    index_edge = 0
+    with utils.pause_gc():
+        for key, record in records:
+            if key == 'nodes':
+                index_node += 1
+                utils.set_node_defaults(record)
+                builder.add_node(record)
+                dict_pub_key[record['pub_key']] = record['alias']
+                if encoder is not None:
+                    encoder.add_node(record)
+                if is_message:
+                    print('{}INFO: Node #{} - alias: {} - pub_key: {}'.format(utils.spaces, index_node,
+                                                                              record['alias'], record['pub_key']))
+            elif index_node == 0:
+                pending_edges.append(record)
+            else:
+                if is_message and index_edge == 0:
+                    builder.begin_phase(None)
+                    input("Press ENTER to continue.....")
+                index_edge += 1
+                add_edge_record(builder, record, is_shared, dict_pub_key, index_edge, is_message)
+                if encoder is not None:
+                    encoder.add_edge(record)
+        if is_message and index_edge == 0:
+            builder.begin_phase(None)
+            input("Press ENTER to continue.....")
+        for record in pending_edges:
+            index_edge += 1
+            add_edge_record(builder, record, is_shared, dict_pub_key, index_edge, is_message)
+            if encoder is not None:
+                encoder.add_edge(record)
+
+        graphs = builder.get_graphs()
+    if index_node == 0:
+        return None
+    if encoder is not None:
+        encoder.save(path)
+    return graphs
+
+
+def add_edge_record(builder: utils.GraphBuilder, edge: dict, is_shared: bool, dict_pub_key: dict, index: int,
+                    is_message: bool):
+    """
+    Sets an edge of the snapshot and adds it to the graphs. The keys of its policies are replaced by a single copy of
+    the strings, since each record is decoded on its own rather than along with the whole file, whereas the pub keys of
+    its nodes are shared by the intern table of the builder
+
+    :param builder: builder of the graphs
+    :param edge: edge gathered from the json file
+    :param is_shared: indicates whether the strings of the edge are shared already
+    :param dict_pub_key: aliases of the nodes by pub key
+    :param index: position of the edge on the snapshot
+    :param is_message: indicates whether the edge is printed
+    """
+    if not is_shared:
+        for policy in POLICY_FIELDS:
+            if edge.get(policy) is not None:
+                edge[policy] = {sys.intern(k): v for k, v in edge[policy].items()}
+    utils.set_edge_defaults(edge)
+    builder.add_edge(edge)
+    if is_message:
+        print('{}INFO: Channel #{}({}) - from {} ({}) to {} ({})'.format(utils.spaces, index, edge['channel_id'],
+                                                                         dict_pub_key.get(edge['node1_pub']),
+                                                                         edge['node1_pub'],
+                                                                         dict_pub_key.get(edge['node2_pub']),
+                                                                         edge['node2_pub']))
+
+
+class SnapshotEncoder:
+    """
+    Encodes the records of a snapshot into the arrays of the snapshot cache. The values of the records are stored once
+    on a table of values, hence the records only keep their positions on it. Each value of the table has a kind and a
+    slot on the array of its kind
+    """
+
+    def __init__(self, signature: list):
+        """
+        Sets the empty arrays of the snapshot cache
+
+        :param signature: values of the snapshot from which the cache is built (size, modification time and hash)
+        """
+        self.signature = signature
+        self.kinds = []
+        self.slots = []
+        self.ints = []
+        self.floats = []
+        self.texts = []
+        self.text_offsets = [0]
+        # Positions of the scalar values by type and value, the lists and dicts are stored once per record instead
+        self.positions = {}
+        self.nodes = []
+        self.edges = []
+        self.edge_policies = []
+        self.layout_sizes = []
+        self.layout_keys = []
+        self.layout_positions = {}
+        self.policy_layouts = []
+        self.policy_values = []
+
+    def __text(self, text: str) -> int:
+        """
+        Appends a string to the buffer of strings
+
+        :param text: string
+        :return: slot of the string
+        """
+        data = text.encode()
+        self.texts.append(data)
+        self.text_offsets.append(self.text_offsets[-1] + len(data))
+        return len(self.texts) - 1
+
+    def __value(self, value) -> int:
+        """
+        Gets the position of a value on the table of values, appending it if it is not there yet
+
+        :param value: value of a record
+        :return: position of the value
+        """
+        if isinstance(value, (dict, list)):
+            self.kinds.append(KIND_JSON)
+            self.slots.append(self.__text(json.dumps(value)))
+            return len(self.kinds) - 1
+        key = (type(value), value)
+        position = self.positions.get(key)
+        if position is None:
+            position = len(self.kinds)
+            self.positions[key] = position
+            if value is None:
+                kind, slot = KIND_NONE, 0
+            elif isinstance(value, bool):
+                kind, slot = KIND_BOOL, int(value)
+            elif isinstance(value, int) and -(1 << 63) <= value < (1 << 63):
+                kind, slot = KIND_INT, len(self.ints)
+                self.ints.append(value)
+            elif isinstance(value, float):
+                kind, slot = KIND_FLOAT, len(self.floats)
+                self.floats.append(value)
+            elif isinstance(value, str):
+                kind, slot = KIND_TEXT, self.__text(value)
+            else:
+                kind, slot = KIND_JSON, self.__text(json.dumps(value))
+            self.kinds.append(kind)
+            self.slots.append(slot)
+        return position
+
+    def __policy(self, policy: Optional[dict]) -> int:
+        """
+        Appends a policy to the arrays of policies, a None policy has no layout
+
+        :param policy: policy of an edge
+        :return: position of the policy
+        """
+        if policy is None:
+            self.policy_layouts.append(-1)
+        else:
+            keys = tuple(policy)
+            layout = self.layout_positions.get(keys)
+            if layout is None:
+                layout = len(self.layout_sizes)
+                self.layout_positions[keys] = layout
+                self.layout_sizes.append(len(keys))
+                self.layout_keys.extend(self.__value(k) for k in keys)
+            self.policy_layouts.append(layout)
+            self.policy_values.extend(self.__value(value) for value in policy.values())
+        return len(self.policy_layouts) - 1
+
+    def add_node(self, node: dict):
+        """
+        Appends a node to the arrays of the snapshot cache
+
+        :param node: node of the snapshot with its defaults set
+        """
+        self.nodes.extend(self.__value(node[field]) for field in NODE_FIELDS)
+
+    def add_edge(self, edge: dict):
+        """
+        Appends an edge to the arrays of the snapshot cache
+
+        :param edge: edge of the snapshot with its defaults set
+        """
+        self.edges.extend(self.__value(edge[field]) for field in EDGE_FIELDS)
+        self.edge_policies.extend(self.__policy(edge[field]) if field in edge else MISSING_POLICY
+                                  for field in POLICY_FIELDS)
+
+    def save(self, path: str):
+        """
+        Stores the arrays of the snapshot cache on an uncompressed numpy file, so that they can be memory-mapped
+
+        :param path: path of the file
+        """
+        save_arrays(path, version=np.array([CACHE_VERSION] + self.signature[:2], dtype=np.float64),
+                    hash=np.array(self.signature[2:], dtype=str),
+                    kinds=np.array(self.kinds, dtype=np.int8),
+                    slots=np.array(self.slots, dtype=np.int32),
+                    ints=np.array(self.ints, dtype=np.int64),
+                    floats=np.array(self.floats, dtype=np.float64),
+                    texts=np.frombuffer(b''.join(self.texts), dtype=np.uint8),
+                    text_offsets=np.array(self.text_offsets, dtype=np.int64),
+                    layout_sizes=np.array(self.layout_sizes, dtype=np.int32),
+                    layout_keys=np.array(self.layout_keys, dtype=np.int32),
+                    nodes=np.array(self.nodes, dtype=np.int32).reshape(-1, len(NODE_FIELDS)),
+                    edges=np.array(self.edges, dtype=np.int32).reshape(-1, len(EDGE_FIELDS)),
+                    edge_policies=np.array(self.edge_policies, dtype=np.int32).reshape(-1, len(POLICY_FIELDS)),
+                    policy_layouts=np.array(self.policy_layouts, dtype=np.int32),
+                    policy_values=np.array(self.policy_values, dtype=np.int32))
+
+
+class SnapshotCache:
+    """
+    Arrays of the snapshot cache: a table with the values of the records, whose numbers are kept on arrays by kind and
+    whose strings are kept on a buffer of bytes, and the positions on it of the fields of the nodes, the edges and their
+    policies
+    """
+
+    def __init__(self, arrays: dict):
+        """
+        Sets the arrays of the snapshot cache
+
+        :param arrays: arrays loaded from the file
+        """
+        self.kinds = arrays['kinds']
+        self.slots = arrays['slots']
+        self.ints = arrays['ints']
+        self.floats = arrays['floats']
+        self.texts = arrays['texts']
+        self.text_offsets = arrays['text_offsets']
+        self.layout_sizes = arrays['layout_sizes']
+        self.layout_keys = arrays['layout_keys']
+        self.nodes = arrays['nodes']
+        self.edges = arrays['edges']
+        self.edge_policies = arrays['edge_policies']
+        self.policy_layouts = arrays['policy_layouts']
+        self.policy_values = arrays['policy_values']
+
+    def __get_values(self) -> np.ndarray:
+        """
+        Decodes the table of values, gathering at once the values of the same kind. The numbers are taken from their
+        arrays as they are, and only the strings, lists and dicts are decoded one at a time
+
+        :return: values by position
+        """
+        kinds = np.asarray(self.kinds)
+        slots = np.asarray(self.slots)
+        values = np.empty(len(kinds), dtype=object)
+        positions = np.flatnonzero(kinds == KIND_BOOL)
+        values[positions] = [slot != 0 for slot in slots[positions].tolist()]
+        positions = np.flatnonzero(kinds == KIND_INT)
+        values[positions] = self.ints[slots[positions]].tolist()
+        positions = np.flatnonzero(kinds == KIND_FLOAT)
+        values[positions] = self.floats[slots[positions]].tolist()
+        texts = self.texts.tobytes()
+        offsets = np.asarray(self.text_offsets)
+        for kind in (KIND_TEXT, KIND_JSON):
+            positions = np.flatnonzero(kinds == kind)
+            text_slots = slots[positions]
+            decode = bytes.decode if kind == KIND_TEXT else lambda data: json.loads(data.decode())
+            for position, start, end in zip(positions.tolist(), offsets[text_slots].tolist(),
+                                            offsets[text_slots + 1].tolist()):
+                values[position] = decode(texts[start:end])
+        return values
+
+    def __get_policies(self, values: np.ndarray) -> list:
+        """
+        Decodes the policies of the edges, gathering at once the values of all the policies with the same layout
+
+        :param values: table of values
+        :return: policies by position
+        """
+        layout_sizes = np.asarray(self.layout_sizes, dtype=np.int64)
+        layout_starts = np.cumsum(layout_sizes) - layout_sizes
+        # The policies without layout (-1) take the size appended at the end, since they have no values
+        sizes = np.append(layout_sizes, 0)
+        lengths = sizes[self.policy_layouts]
+        starts = np.cumsum(lengths) - lengths
+        policies = [None] * len(self.policy_layouts)
+        for layout, (layout_start, size) in enumerate(zip(layout_starts.tolist(), layout_sizes.tolist())):
+            keys = values[self.layout_keys[layout_start:layout_start + size]].tolist()
+            positions = np.flatnonzero(self.policy_layouts == layout)
+            rows = values[self.policy_values[starts[positions, None] + np.arange(size)]]
+            for position, row in zip(positions.tolist(), rows.tolist()):
+                policies[position] = dict(zip(keys, row))
+        return policies
+
+    def records(self) -> Iterator[Tuple[str, dict]]:
+        """
+        Decodes the records of the nodes and edges as they were stored
+
+        :return: name of the array and record
+        """
+        values = self.__get_values()
+        for row in values[self.nodes].tolist():
+            yield 'nodes', dict(zip(NODE_FIELDS, row))
+        policies = self.__get_policies(values)
+        for row, positions in zip(values[self.edges].tolist(), self.edge_policies.tolist()):
+            edge = dict(zip(EDGE_FIELDS, row))
+            for field, position in zip(POLICY_FIELDS, positions):
+                if position != MISSING_POLICY:
+                    edge[field] = policies[position]
+            yield 'edges', edge
+
+    @classmethod
+    def load(cls, path: str, location: str, file_name: str):
+        """
+        Loads the snapshot cache from a numpy file. The cache is valid while the size of the snapshot does not change
+        and either its modification time or its hash does not change either, so the hash is only computed on a newer
+        snapshot, after which the new modification time is stored on the cache
+
+        :param path: path of the file
+        :param location: directory in which the snapshot is located
+        :param file_name: name of the snapshot
+        :return: SnapshotCache, None if the file does not exist or was built from another snapshot
+        """
+        try:
+            arrays = load_arrays(path)
+            version = arrays['version'].tolist()
+            signature = utils.get_file_signature(location, file_name)
+            if version[:2] != [CACHE_VERSION, signature[0]]:
+                return None
+            if version[2] != signature[1]:
+                if arrays['hash'].tolist() != [utils.get_file_hash(location, file_name)]:
+                    return None
+                arrays['version'] = np.array([CACHE_VERSION] + signature, dtype=np.float64)
+                try:
+                    save_arrays(path, **arrays)
+                except OSError as e:
+                    print('%sWARNING: modification time of %s not stored on %s: %s' % (utils.spaces, file_name,
+                                                                                      path, e))
+            return cls(arrays)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+
+
+def save_arrays(path: str, **arrays):
+    """
+    Stores arrays on an uncompressed numpy file. The arrays are written to a temporary file that replaces the file at
+    once, so the arrays memory-mapped from the previous file are still readable
+
+    :param path: path of the file
+    :param arrays: arrays by name
+    """
+    temporary = path + '.tmp.npz'
+    np.savez(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+def load_arrays(path: str) -> dict:
+    """
+    Loads the arrays of an uncompressed numpy file as memory-mapped arrays, since numpy only maps single arrays
+
+    :param path: path of the file
+    :return: arrays by name
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                raise ValueError('%s is not an uncompressed numpy file' % path)
+            # The array follows the local header of the member, whose name and extra field have variable lengths
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, is_fortran, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, is_fortran, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-4]
+            if dtype.hasobject:
+                raise ValueError('%s stores objects' % path)
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if is_fortran else 'C')
+    return arrays
+
+
+def get_cache_path(location: str, file_name: str) -> str:
+    """
+    Gets the path of the snapshot cache, which is stored next to the snapshot
+
+    :param location: directory in which the snapshot is located
+    :param file_name: name of the snapshot
+    :return: path of the cache
+    """
+    return os.path.join(location, os.path.splitext(file_name)[0] + '_snapshot.npz')
+
+
+def get_cache_signature(location: str, file_name: str) -> list:
+    """
+    Gets the values of the snapshot stored on its cache
+
+    :param location: directory in which the snapshot is located
+    :param file_name: name of the snapshot
+    :return: size, modification time and hash of the snapshot
+    """
+    return utils.get_file_signature(location, file_name) + [utils.get_file_hash(location, file_name)]
@@ -0,0 +1,280 @@
+import weakref
+import numpy as np
+import networkx as nx
+from collections import OrderedDict
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from typing import Tuple
+from ln import shortest_path_yen as spy, shortest_path_tree as spt, contraction_hierarchy as ch, utils as utils, \
+    intern_table as intern_table
+
+# Max number of classes of payment amounts whose costs are kept per graph
+MAX_AMOUNT_CLASSES = 16
+# Marker of a node without predecessor on the arrays returned by scipy
+NO_PREDECESSOR = -9999
+# Max number of hops of a route (BOLT #4 onion packets fit about 20 hops)
+MAX_HOPS = 20
+# Max number of sources relaxed at once by the hop-limited Bellman-Ford, it bounds the memory to sources x channels
+MAX_BATCH_SOURCES = 64
+# Sparse graphs of each graph, they are released along with the graph
+sparse_graphs = weakref.WeakKeyDictionary()
+
+
+class SparseGraph:
+    """
+        Class used to export the directed pairs of nodes of the network to compressed sparse row (CSR) arrays, so the
+        shortest paths are found by the Dijkstra of scipy.sparse.csgraph instead of walking the dictionaries of
+        networkx. The parallel channels of a pair of nodes are collapsed into the channel chosen by the cost index for
+        the payment amount, thus, there is an array of costs per class of payment amounts that shares the structure of
+        the graph, and the pairs of nodes that can not forward the payment have an infinite cost. The costs of the
+        pairs of nodes with a single channel do not depend on the payment amount, so they are compiled once and only the
+        costs of the pairs of nodes with parallel channels are compiled per class
+    """
+
+    def __init__(self, graph: nx):
+        """
+
+        :param graph: structure that contains the whole data about the network
+        """
+        self.graph = graph
+        # Rows of the nodes given by the intern table of the graph, which is shared and thus only read
+        table = intern_table.get_intern_table(graph)
+        self.nodes = table.nodes
+        self.positions = table.node_ids
+        self.indptr = np.zeros(len(self.nodes) + 1, dtype=np.int32)
+        indices = []
+        for pos, node in enumerate(self.nodes):
+            indices.extend(self.positions[v] for v in graph.adj[node])
+            self.indptr[pos + 1] = len(indices)
+        self.indices = np.array(indices, dtype=np.int32)
+        # Node u of each directed pair (u, v), i.e. the row of each entry of the arrays
+        self.tails = np.repeat(np.arange(len(self.nodes), dtype=np.int32), np.diff(self.indptr))
+        # Costs of the pairs of nodes with a single channel and positions of the pairs with parallel channels
+        self.weights = np.full(len(self.indices), np.inf)
+        parallel = []
+        for pos, (u, v) in enumerate(zip(self.tails.tolist(), self.indices.tolist())):
+            channels = graph.adj[self.nodes[u]][self.nodes[v]]
+            if len(channels) > 1:
+                parallel.append(pos)
+            else:
+                weight = ch.static_weight(channels)
+                if weight is not None:
+                    self.weights[pos] = weight
+        self.parallel = np.array(parallel, dtype=np.int64)
+        self.matrices = OrderedDict()
+
+    def matrix(self, payment_amount: int) -> csr_matrix:
+        """
+        Gets the CSR matrix with the costs of the directed pairs of nodes for a payment amount. The matrix is built once
+        per class of payment amounts, and the costs of the pairs of nodes recorded on the journal of the graph are
+        compiled again once the graph is updated. The matrices are keyed by the breakpoints that bound the class instead
+        of its position, since the updates of the balances shift the positions of the classes, whereas a matrix kept
+        for the same bounds only differs on the pairs of nodes recorded on the journal
+
+        :param payment_amount: amount to be paid to node destiny
+        :return: CSR matrix nodes x nodes
+        """
+        bounds = spt.get_amount_bounds(self.graph, payment_amount)
+        cost_index = spy.get_cost_index(self.graph, payment_amount)
+        version = utils.get_graph_version(self.graph)
+        entry = self.matrices.get(bounds)
+        if entry is not None and entry[0] != version:
+            updates = utils.get_graph_updates(self.graph, entry[0])
+            if updates is None:
+                entry = None
+            else:
+                for u, v in updates:
+                    for pair in ((u, v), (v, u)):
+                        pos = self.position(*pair)
+                        if pos is not None and len(self.graph.adj[pair[0]][pair[1]]) > 1:
+                            weight = cost_index.weight(*pair)
+                            entry[1].data[pos] = np.inf if weight is None else weight
+                entry = self.matrices[bounds] = (version, entry[1])
+        if entry is None:
+            data = self.weights.copy()
+            weights = [cost_index.weight(self.nodes[u], self.nodes[v])
+                       for u, v in zip(self.tails[self.parallel].tolist(), self.indices[self.parallel].tolist())]
+            data[self.parallel] = np.array([np.inf if w is None else w for w in weights], dtype=np.float64)
+            entry = self.matrices[bounds] = (version, csr_matrix((data, self.indices, self.indptr),
+                                                                       shape=(len(self.nodes), len(self.nodes))))
+            if len(self.matrices) > MAX_AMOUNT_CLASSES:
+                self.matrices.popitem(last=False)
+        self.matrices.move_to_end(bounds)
+        return entry[1]
+
+    def position(self, u, v):
+        """
+        Gets the position of a directed pair of nodes on the arrays
+
+        :param u: node u
+        :param v: node v
+        :return: position of the directed pair, None if the pair is not in the graph
+        """
+        i = self.positions.get(u)
+        j = self.positions.get(v)
+        if i is None or j is None:
+            return None
+        row = np.flatnonzero(self.indices[self.indptr[i]:self.indptr[i + 1]] == j)
+        return int(self.indptr[i] + row[0]) if len(row) else None
+
+    def shortest_paths(self, source: str, payment_amount: int, is_reverse: bool = False) -> Tuple[np.ndarray,
+                                                                                                 np.ndarray]:
+        """
+        Gets the costs and the predecessors of the shortest paths from a source node to every node of the network (or
+        from every node to the source node when is_reverse)
+
+        :param source: node origin (node destiny when is_reverse)
+        :param payment_amount: amount to be paid to node destiny
+        :param is_reverse: indicates that the paths go from every node to the source node
+        :return: costs and predecessors arrays indexed by the position of the nodes
+        """
+        if source not in self.positions:
+            raise nx.NodeNotFound("Source {} is not in G".format(source))
+        matrix = self.matrix(payment_amount)
+        return dijkstra(matrix.T.tocsr() if is_reverse else matrix, indices=self.positions[source],
+                        return_predecessors=True)
+
+    def path(self, predecessors: np.ndarray, source: str, target: str, is_reverse: bool = False) -> list:
+        """
+        Maps the predecessors of a shortest path tree to the path of pub keys between a source node and a target node
+
+        :param predecessors: predecessors array of the tree
+        :param source: root node of the tree
+        :param target: node reached by the path
+        :param is_reverse: indicates that the tree goes from every node to the root node
+        :return: path of nodes from source to target (from target to source when is_reverse), None if there is no path
+        """
+        j = self.positions.get(target)
+        if j is None or (j != self.positions[source] and predecessors[j] == NO_PREDECESSOR):
+            return None
+        path = [j]
+        while predecessors[path[-1]] != NO_PREDECESSOR:
+            path.append(int(predecessors[path[-1]]))
+        if not is_reverse:
+            path.reverse()
+        return [self.nodes[pos] for pos in path]
+
+    def shortest_path(self, source: str, target: str, payment_amount: int, hidden_nodes=(),
+                      hidden_edges=()) -> Tuple[int, list]:
+        """
+        Gets the shortest path between a source node and a target node, the hidden nodes and edges (used by the spur
+        paths of the Yen's algorithm) are given an infinite cost on a copy of the costs. A hidden node is reached but
+        not left, which is the same as not reaching it since it is never the target node
+
+        :param source: node origin
+        :param target: node destiny
+        :param payment_amount: amount to be paid to node destiny
+        :param hidden_nodes: nodes that the path can not go through
+        :param hidden_edges: directed pairs of nodes that the path can not go through
+        :return: cost of the path and the path
+        """
+        if source not in self.positions or target not in self.positions:
+            raise nx.NodeNotFound("Either source {} or target {} is not in G".format(source, target))
+        matrix = self.matrix(payment_amount)
+        if hidden_nodes or hidden_edges:
+            data = matrix.data.copy()
+            for node in hidden_nodes:
+                i = self.positions[node]
+                data[self.indptr[i]:self.indptr[i + 1]] = np.inf
+            for pair in hidden_edges:
+                pos = self.position(*pair)
+                if pos is not None:
+                    data[pos] = np.inf
+            matrix = csr_matrix((data, self.indices, self.indptr), shape=matrix.shape)
+
+        distances, predecessors = dijkstra(matrix, indices=self.positions[source], return_predecessors=True)
+        cost = distances[self.positions[target]]
+        if np.isinf(cost):
+            raise nx.NetworkXNoPath("No path between %s and %s." % (source, target))
+        return int(cost), self.path(predecessors, source, target)
+
+    def hop_limited_distances(self, sources: list, payment_amount: int, max_hops: int = MAX_HOPS,
+                              is_reverse: bool = False) -> np.ndarray:
+        """
+        Gets the costs of the shortest paths of at most max_hops from a batch of sources to every node of the network
+        (or from every node to the sources when is_reverse) by means of a Bellman-Ford on the CSR arrays. Each round
+        relaxes the directed pairs that leave the nodes improved on the previous round for all the sources at once as a
+        min-plus product, i.e. the candidate costs (pairs x sources) are reduced to the min per node by the pairs sorted
+        by node, thus, the costs after h rounds are the costs of the paths of at most h hops. The rounds stop as soon as
+        no cost improves
+
+        :param sources: nodes origin (nodes destiny when is_reverse)
+        :param payment_amount: amount to be paid to node destiny
+        :param max_hops: max number of hops of the paths
+        :param is_reverse: indicates that the paths go from every node to the sources
+        :return: matrix sources x nodes with the costs, infinite when the node is not reached within max_hops
+        """
+        tails, heads = (self.indices, self.tails) if is_reverse else (self.tails, self.indices)
+        weights = self.matrix(payment_amount).data
+        distances = np.full((len(sources), len(self.nodes)), np.inf)
+        for batch in range(0, len(sources), MAX_BATCH_SOURCES):
+            columns = [(i, self.positions[source]) for i, source in enumerate(sources[batch:batch + MAX_BATCH_SOURCES])
+                       if source in self.positions]
+            # Costs nodes x sources, so the rows of the tails of the pairs are gathered at once
+            block = np.full((len(self.nodes), min(MAX_BATCH_SOURCES, len(sources) - batch)), np.inf)
+            active = np.zeros(len(self.nodes), dtype=bool)
+            for i, pos in columns:
+                block[pos, i] = 0
+                active[pos] = True
+            for _ in range(max_hops):
+                pairs = np.flatnonzero(active[tails])
+                if len(pairs) == 0:
+                    break
+                pairs = pairs[np.argsort(heads[pairs], kind='stable')]
+                sorted_heads = heads[pairs]
+                starts = np.flatnonzero(np.r_[True, sorted_heads[1:] != sorted_heads[:-1]])
+                nodes = sorted_heads[starts]
+                costs = np.minimum.reduceat(block[tails[pairs]] + weights[pairs, None], starts, axis=0)
+                improved = costs < block[nodes]
+                block[nodes] = np.where(improved, costs, block[nodes])
+                active[:] = False
+                active[nodes[improved.any(axis=1)]] = True
+            distances[batch:batch + MAX_BATCH_SOURCES] = block.T
+        return distances
+
+    def route_baselines(self, routes: list, max_hops: int = MAX_HOPS) -> np.ndarray:
+        """
+        Gets the cost of the shortest path of at most max_hops of a batch of routes, the routes are grouped by class of
+        payment amount and their nodes origin are relaxed at once by the hop-limited Bellman-Ford
+
+        :param routes: list of routes as tuples (node origin, node destiny, payment amount)
+        :param max_hops: max number of hops of the paths
+        :return: cost of each route, infinite when node destiny is not reached within max_hops
+        """
+        baselines = np.full(len(routes), np.inf)
+        groups = {}
+        for i, (node_origin, node_destiny, payment_amount) in enumerate(routes):
+            groups.setdefault(spt.get_amount_class(self.graph, payment_amount), []).append(i)
+        for indexes in groups.values():
+            origins = list(dict.fromkeys(routes[i][0] for i in indexes))
+            rows = {node: row for row, node in enumerate(origins)}
+            distances = self.hop_limited_distances(origins, routes[indexes[0]][2], max_hops)
+            for i in indexes:
+                column = self.positions.get(routes[i][1])
+                if column is not None:
+                    baselines[i] = distances[rows[routes[i][0]], column]
+        return baselines
+
+    def hops(self, path: list, payment_amount: int) -> list:
+        """
+        Maps a path of pub keys to the keys (channel_id-pubkey) of the channels chosen to forward the payment
+
+        :param path: path of nodes
+        :param payment_amount: amount to be paid to node destiny
+        :return: list of channel keys
+        """
+        cost_index = spy.get_cost_index(self.graph, payment_amount)
+        return [cost_index.hop(path[i], path[i + 1])[0] for i in range(len(path) - 1)]
+
+
+def get_sparse_graph(graph: nx) -> SparseGraph:
+    """
+    Gets the sparse graph of a graph, it is built once per graph
+
+    :param graph: structure that contains the whole data about the network
+    :return: SparseGraph
+    """
+    sparse_graph = sparse_graphs.get(graph)
+    if sparse_graph is None:
+        sparse_graph = sparse_graphs[graph] = SparseGraph(graph)
+    return sparse_graph
@@ -1,18 +1,29 @@
 import re
 import os
+import gc
 import sys
 import json
+import time
 import random
 import hashlib
+import tracemalloc
 import ipaddress
+import contextlib
 import jsonpickle
 import numpy as np
 import networkx as nx
 from datetime import datetime
 from typing import Optional, Any, Tuple, Set
 from ln.connector import eclair_client as eclair, lnd_client as lnd, clightning_client as clight
+from ln import intern_table as intern_table
 
 spaces = "".rjust(5)
+# Max number of channel updates recorded on the journal of a graph
+MAX_JOURNAL_SIZE = 10000
+# Max number of times that the unreachable routes of a test file are drawn again
+MAX_TEST_DRAWS = 10
+# Numeric fields of the policies, which lnd gives as strings (uint64) and are converted to int once at load time
+POLICY_NUMERICS = ('time_lock_delta', 'min_htlc', 'fee_base_msat', 'fee_rate_milli_msat', 'max_htlc_msat')
 
 
 def input_value(default: str, message: str, is_path: bool, is_value: bool):
@@ -130,6 +141,34 @@ def load_file(location: str, file_name: str, is_snapshot: bool):
     return data
 
 
+def get_file_signature(location: str, file_name: str) -> list:
+    """
+    Gets the values that identify the version of a file, so the data derived from it can be stored and reloaded while
+    the file does not change
+
+    :param location: directory in which the file is located
+    :param file_name: name of the file
+    :return: size and modification time of the file
+    """
+    stat = os.stat(os.path.join(location, file_name))
+    return [stat.st_size, stat.st_mtime]
+
+
+def get_file_hash(location: str, file_name: str) -> str:
+    """
+    Gets the hash of the content of a file, which identifies its version when the modification time changed
+
+    :param location: directory in which the file is located
+    :param file_name: name of the file
+    :return: sha256 of the file
+    """
+    sha = hashlib.sha256()
+    with open(os.path.join(location, file_name), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
 def save_file(location: str, file_name: str, data, has_datetime: bool = True):
     """
     Let store data on a file
@@ -172,10 +211,11 @@ def save_file(location: str, file_name: str, data, has_datetime: bool = True):
 
 
 def create_test_file(g1: nx, connectors: dict, num_routes: int, max_amount: int, location: str, file_name: str,
-                     is_snapshot: bool):
+                     is_snapshot: bool, baselines=None):
     """
     Creates a test file with random nodes (origin and destiny) and payment amount. The result test.json file contains
-    data from the connector (lnd, eclair and c-lightning) from parameters.json
+    data from the connector (lnd, eclair and c-lightning) from parameters.json. When the baselines are given, the
+    routes whose node destiny is not reached from node origin are drawn again (up to MAX_TEST_DRAWS times)
 
     :param g1: data of the network with nodes and channels
     :param connectors: parameters of connection of the three implementations (lnd, eclair and c-lightning)
@@ -184,6 +224,8 @@ def create_test_file(g1: nx, connectors: dict, num_routes: int, max_amount: int,
     :param location: path that indicates the location where the file will be stored
     :param file_name: name of the file
     :param is_snapshot: the value of pub key is empty for the key eclair in the case of a snapshot
+    :param baselines: function that gets the costs of a batch of routes (origin, destiny, amount) at once, infinite
+    for the routes that are not reached
 
     :return: None
     """
@@ -198,11 +240,19 @@ def create_test_file(g1: nx, connectors: dict, num_routes: int, max_amount: int,
         result[key]["node"] = exclude_keys_dictionary(value, exclude)
         pubkey_eclair = '' if key != 'eclair' else '' if is_snapshot else \
             eclair.get_info(value['host'], value['port'], value["user"], value['passwd'])['nodeId']
-        for i in range(num_routes):
-            rand = get_randoms(num_nodes)
-            route = {"origin": pubkey_eclair if len(pubkey_eclair) > 0 else nodes[rand[0]][0],
-                     "destiny": nodes[rand[1]][0], "amount": random.randrange(1, max_amount)}
-            routes.append(route)
+        for draw in range(MAX_TEST_DRAWS if baselines is not None else 1):
+            candidates = []
+            for i in range(num_routes - len(routes)):
+                rand = get_randoms(num_nodes)
+                route = {"origin": pubkey_eclair if len(pubkey_eclair) > 0 else nodes[rand[0]][0],
+                         "destiny": nodes[rand[1]][0], "amount": random.randrange(1, max_amount)}
+                candidates.append(route)
+            if baselines is not None and draw < MAX_TEST_DRAWS - 1:
+                costs = baselines([(route["origin"], route["destiny"], route["amount"]) for route in candidates])
+                candidates = [route for route, cost in zip(candidates, costs) if cost < float('inf')]
+            routes.extend(candidates)
+            if len(routes) == num_routes:
+                break
         result[key]["routes"] = routes
 
     save_file(location, file_name, jsonpickle.encode(result), has_datetime=False)
@@ -258,15 +308,7 @@ def set_data_nodes_edges(data: nx, is_message: bool = True, parameters=None) ->
                 nodes[dic["nodeid"]] = dic["alias"]
     for node in data['nodes']:
         index += 1
-        if 'last_update' not in node: node['last_update'] = 0
-        if 'alias' not in node:
-            if nodes and node['pub_key'] in nodes:
-                node['alias'] = nodes[node['pub_key']]
-            else:
-                node['alias'] = node['pub_key'][:4] + '..' + node['pub_key'][-4:]
-        if 'addresses' not in node: node['addresses'] = []
-        if 'color' not in node: node['color'] = '#000000'
-        if 'features' not in node: node['features'] = {}
+        set_node_defaults(node, nodes)
         dict_pub_key[node['pub_key']] = node['alias']
         if is_message:
             print('{}INFO: Node #{} - alias: {} - pub_key: {}'.format(spaces, index, node['alias'],
@@ -277,13 +319,7 @@ def set_data_nodes_edges(data: nx, is_message: bool = True, parameters=None) ->
     if 'edges' in data:
         for edge in data['edges']:
             index += 1
-            if 'last_update' not in edge: edge['last_update'] = 0
-            if 'node1_policy' in edge and edge['node1_policy'] is not None:
-                policy1 = edge['node1_policy']
-                if 'disabled' not in policy1: policy1['disabled'] = True
-            if 'node2_policy' in edge and edge['node2_policy'] is not None:
-                policy2 = edge['node2_policy']
-                if 'disabled' not in policy2: policy2['disabled'] = True
+            set_edge_defaults(edge)
 
             if is_message:
                 print('{}INFO: Channel #{}({}) - from {} ({}) to {} ({})'.format(spaces, index,
@@ -295,60 +331,282 @@ def set_data_nodes_edges(data: nx, is_message: bool = True, parameters=None) ->
     return data
 
 
-def populate_graphs(data: nx):
+def set_node_defaults(node: dict, aliases: dict = None) -> dict:
+    """
+    Sets the value of those parameters of a node of the snapshot that are either None or empty
+
+    :param node: node gathered from the json file
+    :param aliases: aliases of the nodes by pub key gathered from the connectors
+    :return: node set
+    """
+    if 'last_update' not in node: node['last_update'] = 0
+    if 'alias' not in node:
+        if aliases and node['pub_key'] in aliases:
+            node['alias'] = aliases[node['pub_key']]
+        else:
+            node['alias'] = node['pub_key'][:4] + '..' + node['pub_key'][-4:]
+    if 'addresses' not in node: node['addresses'] = []
+    if 'color' not in node: node['color'] = '#000000'
+    if 'features' not in node: node['features'] = {}
+    return node
+
+
+def set_edge_defaults(edge: dict) -> dict:
+    """
+    Sets the value of those parameters of an edge of the snapshot that are either None or empty
+
+    :param edge: edge gathered from the json file
+    :return: edge set
+    """
+    if 'last_update' not in edge: edge['last_update'] = 0
+    if 'node1_policy' in edge and edge['node1_policy'] is not None:
+        policy1 = edge['node1_policy']
+        if 'disabled' not in policy1: policy1['disabled'] = True
+    if 'node2_policy' in edge and edge['node2_policy'] is not None:
+        policy2 = edge['node2_policy']
+        if 'disabled' not in policy2: policy2['disabled'] = True
+    return edge
+
+
+def set_policy_numerics(policy: Optional[dict]) -> Optional[dict]:
+    """
+    Converts the numeric fields of a policy to int, so that the routing and the payments use them without parsing them
+    again
+
+    :param policy: policy of an edge gathered from the json file
+    :return: policy set
+    """
+    if policy is not None:
+        for field in POLICY_NUMERICS:
+            if field in policy and type(policy[field]) is not int:
+                policy[field] = int(policy[field])
+    return policy
+
+
+class GraphBuilder:
+    """
+    Builds g1, g2, nodeDict and edgeDict in a single sweep over the nodes and edges of the snapshot, i.e. each record is
+    added to every structure as soon as it is read instead of sweeping the snapshot once per structure, and the time
+    and memory taken by each phase can be reported
+    """
+
+    def __init__(self, is_stats: bool = False):
+        """
+        Sets the empty graphs and dictionaries
+
+        :param is_stats: indicates whether the time and memory of each phase are measured and printed
+        """
+        self.g1 = nx.MultiGraph()
+        self.g2 = nx.MultiDiGraph()
+        self.node_dict = {}
+        self.edge_dict = {}
+        # Dense ids of the nodes of g2, it keeps a single copy of each pub key
+        self.table = intern_table.InternTable()
+        # Positions of the nodes on g1, since g1.edges gives each channel from the node added first
+        self.positions = {}
+        self.is_stats = is_stats
+        self.is_tracing = False
+        # Name, seconds and memory allocated (bytes) of each phase
+        self.phases = []
+        self.phase = None
+        self.start = None
+        self.memory = 0
+        if is_stats and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.is_tracing = True
+        self.begin_phase('nodes')
+
+    def begin_phase(self, phase: Optional[str]):
+        """
+        Ends the current phase of the build and starts the next one
+
+        :param phase: name of the next phase, None to stop measuring until the next node or edge
+        """
+        if self.is_stats:
+            now = time.perf_counter()
+            memory = tracemalloc.get_traced_memory()[0]
+            if self.phase is not None:
+                self.phases.append((self.phase, now - self.start, memory - self.memory))
+            self.start = now
+            self.memory = memory
+        self.phase = phase
+
+    def __add_node(self, pub_key: str, attr: dict):
+        """
+        Adds a node to g1 with its data
+
+        :param pub_key: pub key of the node
+        :param attr: data of the node
+        """
+        self.positions.setdefault(pub_key, len(self.positions))
+        self.g1.add_node(pub_key, **attr)
+
+    def __add_node_g2(self, pub_key: str):
+        """
+        Adds a node to g2
+
+        :param pub_key: pub key of the node
+        """
+        if pub_key not in self.g2:
+            self.g2.add_node(self.table.add_node(pub_key))
+
+    def add_node(self, n: dict):
+        """
+        Imports the data of a node to the g1 and g2 graph, and to nodeDict
+
+        :param n: node load from json file
+        """
+        if self.phase != 'nodes':
+            self.begin_phase('nodes')
+        pub_key = self.table.add_node(n['pub_key'])
+        self.__add_node(pub_key, {'last_update': n['last_update'], 'alias': n['alias'],
+                                  'addresses': n['addresses'], 'color': n['color'], 'features': n['features']})
+        self.__add_node_g2(pub_key)
+        self.node_dict[pub_key] = self.g1.nodes[pub_key]
+
+    def add_edge(self, e: dict):
+        """
+        Imports the data of an edge to the g1 graph, and to the g2 graph as a channel per direction when both policies
+        are given, along with their entries on edgeDict. The numeric fields of the policies are converted to int
+
+        :param e: edge load from json file
+        """
+        if self.phase != 'edges':
+            self.begin_phase('edges')
+        node1, node2, channel_id = self.table.get_node(e['node1_pub']), self.table.get_node(e['node2_pub']), \
+            e['channel_id']
+        set_policy_numerics(e.get('node1_policy'))
+        set_policy_numerics(e.get('node2_policy'))
+        for node in (node1, node2):
+            if node not in self.positions:
+                self.__add_node(node, {})
+        capacity = int(e['capacity'])
+        self.g1.add_edge(node1, node2, key=channel_id, chan_point=e['chan_point'], last_update=e['last_update'],
+                         node1_pub=node1, node2_pub=node2, capacity=capacity,
+                         policy_source=e["node1_policy"] if 'node1_policy' in e else {'node1_policy': {}},
+                         policy_dest=e["node2_policy"] if 'node2_policy' in e else {'node2_policy': {}})
+        attr = self.g1.adj[node1][node2][channel_id]
+        if self.positions[node1] <= self.positions[node2]:
+            self.edge_dict[channel_id] = (node1, node2, channel_id, attr)
+        else:
+            self.edge_dict[channel_id] = (node2, node1, channel_id, attr)
+
+        if 'node1_policy' in e and 'node2_policy' in e:
+            self.__add_node_g2(node1)
+            self.__add_node_g2(node2)
+            prefix = str(channel_id) + '-'
+            for u, v, policy_source, policy_dest in ((node1, node2, e["node1_policy"], e["node2_policy"]),
+                                                     (node2, node1, e["node2_policy"], e["node1_policy"])):
+                k = prefix + u
+                self.g2.add_edge(u, v, key=k, channel_id=channel_id, last_update=e['last_update'],
+                                 policy_source=policy_source, policy_dest=policy_dest, capacity=capacity)
+                self.edge_dict[k] = (u, v, k, self.g2.adj[u][v][k])
+
+    def get_graphs(self) -> Tuple[nx.MultiGraph, nx.MultiDiGraph, dict, dict]:
+        """
+        Ends the build, printing the time and memory of its phases when they are measured
+
+        :return: g1, g2, nodeDict, edgeDict
+        """
+        self.begin_phase(None)
+        if self.is_stats:
+            for phase, seconds, memory in self.phases:
+                print('%sINFO: graphs built (%s) in %.3f s allocating %.1f MB' % (spaces, phase, seconds,
+                                                                                   memory / 2 ** 20))
+            print('%sINFO: graphs built with a peak of %.1f MB' % (spaces, tracemalloc.get_traced_memory()[1] /
+                                                                   2 ** 20))
+            if self.is_tracing:
+                tracemalloc.stop()
+        intern_table.set_intern_table(self.g2, self.table)
+        return self.g1, self.g2, self.node_dict, self.edge_dict
+
+
+def populate_graphs(data: nx, is_stats: bool = False):
     """
     NODES: Read the JSON file and import all node data to the g1 and g2 graph.
     EDGES: Read the JSON file and import all edge data to the g1 and g2 graph.
 
     :param data: data load from json file
+    :param is_stats: indicates whether the time and memory of the build are printed
     :return: g1, g2, nodeDict, edgeDict
     """
-    g1 = nx.MultiGraph()
-    g2 = nx.MultiDiGraph()
-    # NODES: Read the JSON file and import all node data to the g1 graph.
-    for n in data['nodes']:
-        g1.add_node(n['pub_key'], last_update=n['last_update'],
-                    alias=n['alias'], addresses=n['addresses'], color=n['color'],
-                    features=n['features'])
-    node_dict = dict(g1.nodes(data=True))
-
-    # EDGES: Read the JSON file and import all edge data to the g1 graph.
-    for e in data['edges']:
-        g1.add_edge(e['node1_pub'], e['node2_pub'], key=e['channel_id'],
-                    chan_point=e['chan_point'], last_update=e['last_update'],
-                    node1_pub=e['node1_pub'], node2_pub=e['node2_pub'],
-                    capacity=int(e['capacity']),
-                    policy_source={'node1_policy': {}} if 'node1_policy' not in e else e["node1_policy"],
-                    policy_dest={'node2_policy': {}} if 'node2_policy' not in e else e["node2_policy"])
-    edge_dict = {}
-    for e in g1.edges(data=True, keys=True):
-        edge_dict[e[2]] = e
-
-    # NODES: Read the JSON file and import all node data to the g2 graph.
-    for n in data['nodes']:
-        g2.add_node(n['pub_key'])
-
-    # EDGES: Read the JSON file and import all edge data to the g2 graph.
-    for e in data['edges']:
-        if 'node1_policy' in e and 'node2_policy' in e:
-            capacity = int(e['capacity'])
-            k = "{}-{}".format(e['channel_id'], e['node1_pub'])
+    builder = GraphBuilder(is_stats)
+    with pause_gc():
+        for n in data['nodes']:
+            builder.add_node(n)
+        for e in data['edges']:
+            builder.add_edge(e)
+
+        return builder.get_graphs()
+
+
+@contextlib.contextmanager
+def pause_gc():
+    """
+    Pauses the garbage collector while the graphs grow, since they only hold acyclic data and the collections
+    triggered by their allocations take most of the build time
+    """
+    is_gc = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if is_gc:
+            gc.enable()
+
+
+def get_graph_version(graph: nx) -> int:
+    """
+    Returns the version of a graph, i.e. the number of updates applied to its channels (balances, capacities or
+    pending htlcs) since it was populated
 
-            g2.add_edge(e['node1_pub'], e['node2_pub'], key=k,
-                        channel_id=e['channel_id'], last_update=e['last_update'],
-                        policy_source=e["node1_policy"], policy_dest=e["node2_policy"],
-                        capacity=capacity)  # TODO:(now we can use mappings between graphs, but this may be faster)
+    :param graph: graph with the data about the network
+    :return: version of the graph
+    """
+    return graph.graph.get('version', 0)
+
+
+def update_graph_version(graph: nx, u: str = None, v: str = None) -> int:
+    """
+    Increases the version of a graph and records on its journal the pair of nodes whose channels were updated, hence,
+    the structures compiled from the graph (e.g. the cost index of the routing) only refresh those channels. In case
+    that the pair of nodes is not given, the whole graph is considered as updated
+
+    :param graph: graph with the data about the network
+    :param u: node u of the updated channels
+    :param v: node v of the updated channels
+    :return: new version of the graph
+    """
+    version = get_graph_version(graph) + 1
+    journal = graph.graph.setdefault('journal', [])
+    journal.append((version, (u, v) if u is not None and v is not None else None))
+    if len(journal) > MAX_JOURNAL_SIZE:
+        del journal[:len(journal) - MAX_JOURNAL_SIZE]
+    graph.graph['version'] = version
 
-            k = "{}-{}".format(e['channel_id'], e['node2_pub'])
+    return version
 
-            g2.add_edge(e['node2_pub'], e['node1_pub'], key=k,
-                        channel_id=e['channel_id'], last_update=e['last_update'],
-                        policy_source=e["node2_policy"], policy_dest=e["node1_policy"],
-                        capacity=capacity)  # TODO:(now we can use mappings between graphs, but this may be faster)
-    for e in g2.edges(data=True, keys=True):
-        edge_dict[e[2]] = e
 
-    return g1, g2, node_dict, edge_dict
+def get_graph_updates(graph: nx, version: int) -> Optional[Set[Tuple[str, str]]]:
+    """
+    Returns the pairs of nodes whose channels were updated after a given version of the graph
+
+    :param graph: graph with the data about the network
+    :param version: version of the graph from which the updates are gathered
+    :return: pairs of nodes updated, or None if the whole graph must be considered as updated
+    """
+    updates = set()
+    journal = graph.graph.get('journal', [])
+    if version < get_graph_version(graph) and (len(journal) == 0 or journal[0][0] > version + 1):
+        return None
+    for entry_version, pair in reversed(journal):
+        if entry_version <= version:
+            break
+        if pair is None:
+            return None
+        updates.add(pair)
+
+    return updates
 
 
 def get_parameters_connection(parameters: dict, g1: nx) -> dict:
@@ -0,0 +1,3 @@
+# The modules of ln import each other through ln.utils (ln.utils -> ln.connector -> ln.route_payment -> ln.utils), so
+# ln.utils is loaded before the test modules import any of them
+import ln.utils
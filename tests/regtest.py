@@ -0,0 +1,100 @@
+import os
+import copy
+import networkx as nx
+from ln import utils as utils, snapshot as snapshot
+
+LOCATION = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ln', 'data')
+FILE_NAME = 'lnd_describegraph_regtest.json'
+
+
+def load_graphs():
+    """
+    Loads the graphs of the regtest snapshot with the balance of every channel set to half its capacity (as the const
+    distribution of the balances of the simulator)
+
+    :return: g1, g2, nodeDict, edgeDict
+    """
+    g1, g2, node_dict, edge_dict = snapshot.load_graphs(LOCATION, FILE_NAME, False)
+    for _, _, channel in g2.edges(data=True):
+        channel['balance'] = int(channel['capacity'] / 2)
+    return g1, g2, node_dict, edge_dict
+
+
+def add_parallel_channel(graph: nx, u: str, v: str, channel_id: str, fee_base_msat: int):
+    """
+    Adds a copy of the channel between two nodes with another channel id and fee_base_msat, so both nodes are joined by
+    parallel channels in both directions
+
+    :param graph: g2 of the snapshot
+    :param u: node u
+    :param v: node v
+    :param channel_id: id of the new channel
+    :param fee_base_msat: fee_base_msat of both policies of the new channel
+    """
+    for source, dest in ((u, v), (v, u)):
+        channel = copy.deepcopy(next(iter(graph[source][dest].values())))
+        channel['channel_id'] = channel_id
+        for policy in ('policy_source', 'policy_dest'):
+            channel[policy]['fee_base_msat'] = fee_base_msat
+            channel[policy]['disabled'] = False
+        graph.add_edge(source, dest, key='{}-{}'.format(channel_id, source), **channel)
+    utils.update_graph_version(graph, u, v)
+
+
+def describe_payment(payment) -> tuple:
+    """
+    Gets the route of a payment with the data of its hops and its totals, so the payments found in different ways can
+    be compared
+
+    :param payment: route_payment.Payment
+    :return: hops and totals of the route, the error of the payment if any
+    """
+    if payment is None or payment.error is not None:
+        return None if payment is None else payment.error
+    route = payment.routes[0]
+    return ([sorted(vars(hop).items()) for hop in route.hops], route.total_fees, route.total_amt,
+            route.total_time_lock)
+
+
+def can_forward(channel: dict, name: str, payment_amount: int) -> bool:
+    """
+    Checks the conditions of get_min_source_dest_channels on a policy of a channel
+    """
+    policy = channel.get(name)
+    return policy is not None and not policy['disabled'] and int(policy['min_htlc']) < payment_amount and \
+        channel['balance'] > int(policy['fee_base_msat']) + payment_amount
+
+
+def get_channel(channels: dict, name: str, payment_amount: int) -> tuple:
+    """
+    Gets the channel whose policy is charged, as min(channels, key=can_forward) of get_min_source_dest_channels: the
+    first channel that can not forward the payment amount, otherwise the first channel
+
+    :return: key and data of the channel
+    """
+    for key, channel in channels.items():
+        if not can_forward(channel, name, payment_amount):
+            return key, channel
+    return next(iter(channels.items()))
+
+
+def get_reference_hop(graph: nx, u: str, v: str, payment_amount: int) -> tuple:
+    """
+    Gets the hop from node u to node v as calculate_weight and path_cost did before the cost index, parsing the policies
+    of the channels on every call
+
+    :return: key of the channel charged, its fee and the cost of the hop, None if the hop can not be used
+    """
+    key_source, source = get_channel(graph[u][v], 'policy_source', payment_amount)
+    key_dest, dest = get_channel(graph[u][v], 'policy_dest', payment_amount)
+    source, dest = source['policy_source'], dest['policy_dest']
+    if source is None:
+        return (None, None, None) if dest is None else \
+            (key_dest, int(dest['fee_base_msat']), int(dest['fee_base_msat']) + int(dest['min_htlc']))
+    if dest is None:
+        return key_source, int(source['fee_base_msat']), int(source['fee_base_msat']) + int(source['min_htlc'])
+    min_htlc_source = 1 if 'min_htlc' not in source else int(source['min_htlc'])
+    min_htlc_dest = 1 if 'min_htlc' not in dest else int(dest['min_htlc'])
+    if int(source['fee_base_msat']) <= int(dest['fee_base_msat']) and min_htlc_source <= min_htlc_dest:
+        return key_source, int(source['fee_base_msat']), int(source['fee_base_msat']) + min_htlc_source
+    return key_dest, int(dest['fee_base_msat']), int(dest['fee_base_msat']) + min_htlc_dest
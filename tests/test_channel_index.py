@@ -0,0 +1,108 @@
+import random
+import itertools
+import unittest
+import networkx as nx
+from ln import utils as utils, shortest_path_yen as spy, channel_index as ci, constrained_path as cp
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 999, 1000, 5000, 60000, 123999, 124000)
+
+
+def can_forward(channel: dict, payment_amount: int) -> bool:
+    """
+    Checks the conditions of get_min_source_dest_channels on both policies of a channel
+    """
+    return all(channel.get(name) is not None and not channel[name]['disabled'] and
+               channel[name]['min_htlc'] < payment_amount and
+               channel['balance'] > channel[name]['fee_base_msat'] + payment_amount
+               for name in ('policy_source', 'policy_dest'))
+
+
+class ChannelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+        self.channel_index = ci.ChannelIndex(self.g2)
+
+    def filtered_graph(self, payment_amount: int) -> nx:
+        """
+        Gets the graph without the channels that can not forward the payment amount, the nodes and the channels keep
+        their order, so the searches break the ties of the costs in the same way
+        """
+        keys = {k for u, v, k, d in self.g2.edges(keys=True, data=True) if can_forward(d, payment_amount)}
+        return nx.subgraph_view(self.g2, filter_edge=lambda u, v, k: k in keys)
+
+    def assert_same_feasibility(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            for u, v, key, channel in self.g2.edges(keys=True, data=True):
+                self.assertEqual(self.channel_index.is_channel_feasible(key, payment_amount),
+                                 can_forward(channel, payment_amount))
+            for u, v in self.g2.edges():
+                self.assertEqual(sorted(self.channel_index.channels(u, v, payment_amount)),
+                                 sorted(key for key, channel in self.g2[u][v].items()
+                                        if can_forward(channel, payment_amount)))
+
+    def test_feasibility_follows_balance_updates(self):
+        rand = random.Random(5)
+        pairs = list(self.g2.edges())
+        for _ in range(25):
+            self.assert_same_feasibility()
+            for u, v in rand.sample(pairs, 4):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 999.5, 2000, 6000.25, 70000, 125000])
+                utils.update_graph_version(self.g2, u, v)
+        self.assert_same_feasibility()
+
+    def test_paths_equal_paths_on_filtered_graph(self):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            filtered = self.filtered_graph(payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                try:
+                    expected = spy.spy(filtered, source, target, 3, payment_amount)
+                except nx.NetworkXNoPath:
+                    expected = None
+                try:
+                    found = spy.spy(self.g2, source, target, 3, payment_amount, channel_index=self.channel_index)
+                except nx.NetworkXNoPath:
+                    found = None
+                self.assertEqual(found, expected)
+                if found is None:
+                    continue
+                # Every hop is charged on a channel that can forward the payment amount
+                for path, (cost, hops) in zip(*found):
+                    self.assertEqual(len(hops), len(path) - 1)
+                    for (u, v), (key, _) in zip(zip(path, path[1:]), hops):
+                        self.assertTrue(can_forward(self.g2[u][v][key], payment_amount))
+                num_paths += len(found[0])
+        self.assertGreater(num_paths, 0)
+
+    def test_searches_skip_channels_that_can_not_forward(self):
+        # The first parallel channel of a pair can not forward the amount, so the pair is charged on the other one
+        u, v = self.parallel[0]
+        first = next(iter(self.g2[u][v].values()))
+        first['balance'] = 0
+        utils.update_graph_version(self.g2, u, v)
+        payment_amount = 5000
+        view = spy.search_graph(self.g2, payment_amount, self.channel_index)
+        key, _ = spy.get_cost_index(view, payment_amount).hop(u, v)
+        self.assertTrue(can_forward(self.g2[u][v][key], payment_amount))
+        for source, target in itertools.permutations(self.g2, 2):
+            try:
+                cost, path = cp.constrained_shortest_path(self.g2, source, target, payment_amount,
+                                                          channel_index=self.channel_index)
+            except nx.NetworkXNoPath:
+                self.assertFalse(nx.has_path(self.filtered_graph(payment_amount), source, target))
+                continue
+            self.assertEqual(cost, nx.dijkstra_path_length(view, source, target,
+                                                           weight=spy.get_cost_index(view, payment_amount).weight))
+            self.assertTrue(all(self.channel_index.channels(path[i], path[i + 1], payment_amount)
+                                for i in range(len(path) - 1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
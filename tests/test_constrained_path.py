@@ -0,0 +1,86 @@
+import random
+import itertools
+import unittest
+import networkx as nx
+from ln import shortest_path_yen as spy, constrained_path as cp
+from tests import regtest
+
+PAYMENT_AMOUNTS = (5000, 60000)
+FEE_LIMITS = (None, 0, 1000, 2000, 3000)
+CLTV_LIMITS = (None, 40, 150, 300, 600)
+
+
+class ConstrainedPathTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        rand = random.Random(19)
+        # The time locks of the channels do not follow their costs, so the limits leave out some of the cheapest paths
+        for _, _, channel in self.g2.edges(data=True):
+            channel['policy_source']['time_lock_delta'] = rand.choice([6, 40, 144, 500])
+        self.pairs = rand.sample(list(itertools.permutations(self.g2, 2)), 16)
+
+    def get_paths(self, source: str, target: str, payment_amount: int) -> list:
+        """
+        Gets every simple path between two nodes with its cost, and the total fees (msat) and total time lock of the
+        route that create_payment sets for it
+
+        :return: list of tuples (cost, fees, time lock, path)
+        """
+        cost_index = spy.get_cost_index(self.g2, payment_amount)
+        paths = []
+        for path in nx.all_simple_paths(self.g2, source, target):
+            weights = [cost_index.weight(u, v) for u, v in zip(path, path[1:])]
+            if None in weights:
+                continue
+            hops = [regtest.get_reference_hop(self.g2, u, v, payment_amount) for u, v in zip(path, path[1:])]
+            fees = sum(max(fee, 1000) for _, fee, _ in hops[:spy.get_charged_hops(len(hops))])
+            time_lock = sum(self.g2[u][v][key]['policy_source']['time_lock_delta']
+                            for (u, v), (key, _, _) in zip(zip(path, path[1:]), hops))
+            paths.append((sum(weights), fees, time_lock, path))
+        return paths
+
+    def test_cheapest_path_within_limits(self):
+        num_paths = num_limited = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in self.pairs:
+                paths = self.get_paths(source, target, payment_amount)
+                for fee_limit, cltv_limit in itertools.product(FEE_LIMITS, CLTV_LIMITS):
+                    costs = [cost for cost, fees, time_lock, _ in paths
+                             if (fee_limit is None or fees <= fee_limit) and
+                             (cltv_limit is None or time_lock <= cltv_limit)]
+                    try:
+                        cost, path = cp.constrained_shortest_path(self.g2, source, target, payment_amount, fee_limit,
+                                                                  cltv_limit)
+                    except nx.NetworkXNoPath:
+                        self.assertEqual(costs, [])
+                        continue
+                    self.assertEqual(cost, min(costs))
+                    self.assertEqual(sum(cost_index.weight(u, v) for u, v in zip(path, path[1:])), cost)
+                    payment = cp.query_route_constrained(self.g1, self.g2, source, target, payment_amount, fee_limit,
+                                                         cltv_limit)
+                    route = payment.routes[0]
+                    self.assertTrue(fee_limit is None or route.total_fees_msat <= fee_limit)
+                    self.assertTrue(cltv_limit is None or route.total_time_lock <= cltv_limit)
+                    num_paths += 1
+                    num_limited += cost > min(cost for cost, _, _, _ in paths)
+        self.assertGreater(num_paths, 0)
+        # Some of the limits left the cheapest path out
+        self.assertGreater(num_limited, 0)
+
+    def test_without_limits_equals_dijkstra(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                try:
+                    expected = nx.dijkstra_path_length(self.g2, source, target, weight=cost_index.weight)
+                except nx.NetworkXNoPath:
+                    self.assertRaises(nx.NetworkXNoPath, cp.constrained_shortest_path, self.g2, source, target,
+                                      payment_amount)
+                    continue
+                self.assertEqual(cp.constrained_shortest_path(self.g2, source, target, payment_amount)[0], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import itertools
+import unittest
+import networkx as nx
+from ln import shortest_path_yen as spy, contraction_hierarchy as ch
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 60000, 124000)
+# Max number of paths pulled from the generator per pair of nodes
+MAX_PATHS = 6
+
+
+class ContractionHierarchyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+        self.hierarchy = ch.ContractionHierarchy.build(self.g2)
+
+    def path_cost(self, path: list, weight) -> int:
+        return sum(weight(path[i], path[i + 1], None) for i in range(len(path) - 1))
+
+    def test_query_equals_dijkstra_on_static_costs(self):
+        def weight(u, v, d):
+            return ch.static_weight(d)
+
+        for source, target in itertools.permutations(self.g2, 2):
+            try:
+                expected = nx.dijkstra_path_length(self.g2, source, target, weight=weight)
+            except nx.NetworkXNoPath:
+                self.assertRaises(nx.NetworkXNoPath, self.hierarchy.query, source, target)
+                continue
+            cost, path = self.hierarchy.query(source, target)
+            self.assertEqual(cost, expected)
+            self.assertEqual((path[0], path[-1]), (source, target))
+            self.assertEqual(self.path_cost(path, lambda u, v, d: weight(u, v, self.g2[u][v])), expected)
+
+    def test_shortest_path_equals_dijkstra(self):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                try:
+                    expected = spy.shortest_path(self.g2, source, target, cost_index.weight)
+                except nx.NetworkXNoPath:
+                    continue
+                found = self.hierarchy.shortest_path(source, target, cost_index.weight)
+                if found is None:
+                    continue
+                self.assertEqual(found[0], expected[0])
+                self.assertEqual(self.path_cost(found[1], cost_index.weight), expected[0])
+                num_paths += 1
+        self.assertGreater(num_paths, 0)
+
+    def test_yen_paths_with_hierarchy_equal_paths_without(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                try:
+                    expected = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount),
+                                                     MAX_PATHS))
+                except nx.NetworkXNoPath:
+                    continue
+                found = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount,
+                                                            hierarchy=self.hierarchy), MAX_PATHS))
+                # The seed path of the hierarchy may be another path of the same cost
+                self.assertEqual([self.path_cost(path, cost_index.weight) for path in found],
+                                 [self.path_cost(path, cost_index.weight) for path in expected])
+                self.assertEqual(len({tuple(path) for path in found}), len(found))
+
+
+if __name__ == '__main__':
+    unittest.main()
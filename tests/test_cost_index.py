@@ -0,0 +1,43 @@
+import random
+import unittest
+from ln import utils as utils, shortest_path_yen as spy
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 999, 1000, 1001, 5000, 60000, 123999, 124000, 200000)
+
+
+class CostIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:6]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+
+    def assert_same_weights(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for u, v in self.g2.edges():
+                expected = regtest.get_reference_hop(self.g2, u, v, payment_amount)[2]
+                self.assertEqual(cost_index.weight(u, v), expected)
+                self.assertEqual(spy.calculate_weight(self.g2, u, v, payment_amount), expected)
+
+    def test_weights_equal_reference(self):
+        self.assert_same_weights()
+
+    def test_weights_follow_graph_updates(self):
+        rand = random.Random(3)
+        pairs = list(self.g2.edges())
+        for _ in range(30):
+            self.assert_same_weights()
+            for u, v in rand.sample(pairs, 3) + rand.sample(self.parallel, 1):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 999.5, 2000, 6000.25, 70000, 125000])
+                    channel['policy_source']['disabled'] = rand.random() < 0.2
+                utils.update_graph_version(self.g2, u, v)
+        self.assert_same_weights()
+
+
+if __name__ == '__main__':
+    unittest.main()
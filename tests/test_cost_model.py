@@ -0,0 +1,127 @@
+import math
+import unittest
+import networkx as nx
+from ln import utils as utils, cost_model as cm, shortest_path_yen as spy
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1000, 50000, 240000)
+
+
+def normalize(value: float, low: float, high: float) -> float:
+    return min(max((value - low) / (high - low), 0.00001), 0.99999)
+
+
+def get_reference_cost(graph: nx, channel: dict, payment_amount: int, implementation: str) -> float:
+    """
+    Gets the cost of a channel for a cost model from its policy, one channel at a time
+
+    :return: cost of the channel, inf if the implementation would not use the channel
+    """
+    policy = channel.get('policy_source')
+    amount_msat = payment_amount * 1000
+    capacity = int(channel.get('capacity', 0))
+    if policy is None or policy['disabled'] or int(policy['min_htlc']) > amount_msat or \
+            amount_msat > (int(policy.get('max_htlc_msat', 0)) or math.inf) or payment_amount > capacity:
+        return math.inf
+    fee = int(policy['fee_base_msat']) + amount_msat * int(policy['fee_rate_milli_msat']) / 1000000
+    time_lock = int(policy['time_lock_delta'])
+    if implementation == 'lnd':
+        probability = cm.LND_APRIORI_HOP_PROBABILITY
+        if capacity > 0:
+            smearing = max(capacity * 1000. * cm.LND_CAPACITY_SMEARING_FRACTION, 1.)
+            exponent = -(amount_msat - capacity * 1000. * cm.LND_CAPACITY_CUTOFF_FRACTION) / smearing
+            probability *= 1 - 1 / (1 + math.exp(min(max(exponent, -700), 700)))
+        penalty = cm.LND_ATTEMPT_COST_MSAT + amount_msat * cm.LND_ATTEMPT_COST_PPM / 1000000
+        return fee + amount_msat * time_lock * cm.LND_RISK_FACTOR_BILLIONTHS / 1000000000 + penalty / probability
+    if implementation == 'c-lightning':
+        return fee + 1 + amount_msat * time_lock * cm.CLIGHTNING_RISK_FACTOR / cm.CLIGHTNING_BLOCKS_PER_YEAR / 100
+    current_height = max(int(c['channel_id']) >> 40 for _, _, c in graph.edges(data=True))
+    factor = cm.ECLAIR_BASE_RATIO + \
+        cm.ECLAIR_CLTV_RATIO * normalize(time_lock, cm.ECLAIR_CLTV_LOW, cm.ECLAIR_CLTV_HIGH) + \
+        cm.ECLAIR_AGE_RATIO * normalize(int(channel['channel_id']) >> 40,
+                                        current_height - cm.ECLAIR_BLOCK_TIME_TWO_MONTHS, current_height) + \
+        cm.ECLAIR_CAPACITY_RATIO * (1 - normalize(capacity * 1000., cm.ECLAIR_CAPACITY_LOW_MSAT,
+                                                  cm.ECLAIR_CAPACITY_HIGH_MSAT))
+    return (fee + cm.ECLAIR_HOP_COST_BASE_MSAT + amount_msat * cm.ECLAIR_HOP_COST_PPM / 1000000) * factor
+
+
+def get_reference_edge(graph: nx, u: str, v: str, payment_amount: int, implementation: str) -> tuple:
+    """
+    Gets the cheapest channel from node u to node v for a cost model, the first one among the channels of equal cost
+
+    :return: key and cost of the channel, None and inf if no channel can be used
+    """
+    key, cost = None, math.inf
+    for k, channel in graph[u][v].items():
+        channel_cost = get_reference_cost(graph, channel, payment_amount, implementation)
+        if channel_cost < cost:
+            key, cost = k, channel_cost
+    return key, cost
+
+
+class CostModelTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, _, _ = regtest.load_graphs()
+        u, v = next(iter(self.g2.edges()))
+        regtest.add_parallel_channel(self.g2, u, v, '900000', 1)
+        self.pairs = list(self.g2.edges())
+
+    def assert_costs_equal_reference(self):
+        for implementation, model in cm.MODELS.items():
+            for payment_amount in PAYMENT_AMOUNTS:
+                cost_index = spy.get_cost_index(self.g2, payment_amount, model)
+                for u, v in self.pairs:
+                    key, cost = get_reference_edge(self.g2, u, v, payment_amount, implementation)
+                    if key is None:
+                        self.assertIsNone(cost_index.weight(u, v))
+                        continue
+                    self.assertAlmostEqual(cost_index.weight(u, v), cost, delta=cost * 1e-9)
+                    self.assertEqual(cost_index.hop(u, v)[0], key)
+
+    def test_costs_equal_reference(self):
+        self.assert_costs_equal_reference()
+
+    def test_costs_follow_graph_updates(self):
+        self.assert_costs_equal_reference()
+        for i, (u, v, channel) in enumerate(self.g2.edges(data=True)):
+            if i % 3 == 0:
+                channel['policy_source']['disabled'] = not channel['policy_source']['disabled']
+            elif i % 3 == 1:
+                channel['policy_source']['fee_base_msat'] = 1000 * i
+            utils.update_graph_version(self.g2, u, v)
+        self.assert_costs_equal_reference()
+
+    def test_route_is_shortest_path_of_model(self):
+        num_routes = 0
+        for implementation in cm.MODELS:
+            for payment_amount in PAYMENT_AMOUNTS:
+                def weight(u, v, d):
+                    cost = get_reference_edge(self.g2, u, v, payment_amount, implementation)[1]
+                    return None if cost == math.inf else cost
+                for source in self.g2:
+                    for target in self.g2:
+                        if source == target:
+                            continue
+                        payment = cm.query_route_model(self.g1, self.g2, source, target, payment_amount,
+                                                       implementation)
+                        try:
+                            expected = nx.dijkstra_path_length(self.g2, source, target, weight=weight)
+                        except nx.NetworkXNoPath:
+                            self.assertIsNotNone(payment.error)
+                            continue
+                        self.assertIsNone(payment.error)
+                        nodes = [source] + [hop.pub_key for hop in payment.routes[0].hops]
+                        self.assertEqual(nodes[-1], target)
+                        cost = 0
+                        for u, v, hop in zip(nodes, nodes[1:], payment.routes[0].hops):
+                            key, hop_cost = get_reference_edge(self.g2, u, v, payment_amount, implementation)
+                            self.assertEqual(key, '{}-{}'.format(hop.channel_id, u))
+                            cost += hop_cost
+                        self.assertAlmostEqual(cost, expected, delta=expected * 1e-9)
+                        num_routes += 1
+        self.assertGreater(num_routes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
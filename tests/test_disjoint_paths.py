@@ -0,0 +1,79 @@
+import itertools
+import unittest
+import networkx as nx
+from ln import shortest_path_yen as spy
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 124000)
+NUM_PATHS = (1, 2, 3, 5)
+
+
+class DisjointPathsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+
+    def get_flow_graph(self, source: str, target: str, payment_amount: int, is_node_disjoint: bool) -> nx.DiGraph:
+        """
+        Gets the graph of the flow of the disjoint paths, where every directed pair of nodes that can be used carries a
+        single path at its cost, and every intermediate node is split into an entry and an exit that carry a single
+        path when is_node_disjoint
+        """
+        cost_index = spy.get_cost_index(self.g2, payment_amount)
+
+        def entry(node):
+            return (node, 'in') if is_node_disjoint and node not in (source, target) else node
+
+        flow_graph = nx.DiGraph()
+        for u, v in self.g2.edges():
+            weight = cost_index.weight(u, v)
+            if weight is not None:
+                flow_graph.add_edge(u, entry(v), weight=weight, capacity=1)
+        if is_node_disjoint:
+            for node in self.g2:
+                if node not in (source, target):
+                    flow_graph.add_edge((node, 'in'), node, weight=0, capacity=1)
+        flow_graph.add_nodes_from([source, target])
+        return flow_graph
+
+    def assert_min_cost_paths(self, is_node_disjoint: bool):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                flow_graph = self.get_flow_graph(source, target, payment_amount, is_node_disjoint)
+                max_paths = nx.maximum_flow_value(flow_graph, source, target)
+                for num_k in NUM_PATHS:
+                    if max_paths == 0:
+                        self.assertRaises(nx.NetworkXNoPath, spy.disjoint_paths, self.g2, source, target, num_k,
+                                          payment_amount, is_node_disjoint=is_node_disjoint)
+                        continue
+                    paths, costs = spy.disjoint_paths(self.g2, source, target, num_k, payment_amount,
+                                                      is_node_disjoint=is_node_disjoint)
+                    self.assertEqual(len(paths), min(num_k, max_paths))
+                    pairs = [pair for path in paths for pair in zip(path, path[1:])]
+                    self.assertEqual(len(set(pairs)), len(pairs))
+                    if is_node_disjoint:
+                        nodes = [node for path in paths for node in path[1:-1]]
+                        self.assertEqual(len(set(nodes)), len(nodes))
+                    for path, cost in zip(paths, costs):
+                        self.assertEqual((path[0], path[-1]), (source, target))
+                        self.assertEqual(cost, spy.path_cost(self.g2, path, payment_amount))
+                    flow_graph.nodes[source]['demand'] = -len(paths)
+                    flow_graph.nodes[target]['demand'] = len(paths)
+                    self.assertEqual(sum(cost_index.weight(u, v) for u, v in pairs),
+                                     nx.network_simplex(flow_graph)[0])
+                    num_paths += len(paths)
+        self.assertGreater(num_paths, 0)
+
+    def test_edge_disjoint_paths_at_min_cost(self):
+        self.assert_min_cost_paths(False)
+
+    def test_node_disjoint_paths_at_min_cost(self):
+        self.assert_min_cost_paths(True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+from ln import utils as utils, intern_table as intern_table, sparse_graph as sg
+from tests import regtest
+
+
+class InternTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+
+    def test_ids_follow_the_order_of_the_graph(self):
+        table = intern_table.get_intern_table(self.g2)
+        self.assertEqual(table.nodes, list(self.g2))
+        self.assertEqual(table.node_ids, {node: i for i, node in enumerate(self.g2)})
+        self.assertIs(sg.SparseGraph(self.g2).positions, table.node_ids)
+
+    def test_pub_keys_are_shared(self):
+        table = intern_table.get_intern_table(self.g2)
+        for node in self.g1:
+            self.assertIs(table.get_node(node), node)
+        for u, v in self.g2.edges():
+            self.assertIs(table.get_node(u), u)
+            self.assertIs(table.get_node(v), v)
+        for edge in self.edge_dict.values():
+            self.assertIs(table.get_node(edge[0]), edge[0])
+            self.assertIs(table.get_node(edge[1]), edge[1])
+
+    def test_table_built_again_when_nodes_are_added(self):
+        table = intern_table.get_intern_table(self.g2)
+        self.g2.add_node('new')
+        utils.update_graph_version(self.g2)
+        rebuilt = intern_table.get_intern_table(self.g2)
+        self.assertIsNot(rebuilt, table)
+        self.assertEqual(rebuilt.node_ids['new'], self.g2.number_of_nodes() - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
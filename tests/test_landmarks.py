@@ -0,0 +1,69 @@
+import itertools
+import unittest
+import networkx as nx
+from ln import shortest_path_yen as spy, landmarks as lm
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 1000, 5000, 60000, 124000)
+MAX_PATHS = 6
+
+
+def get_canonical_path(graph: nx, source: str, target: str, weight) -> list:
+    """
+    Gets the path that breaks the ties of shortest_path: among the paths with the least cost and the fewest hops, the
+    one whose nodes from the target backwards are the least
+    """
+    paths = list(nx.all_shortest_paths(graph, source, target, weight=weight))
+    hops = min(len(path) for path in paths)
+    return min((path for path in paths if len(path) == hops), key=lambda path: path[::-1])
+
+
+class LandmarksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        # Parallel channels with the same fee_base_msat give paths with the same cost
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:6]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 1000)
+        self.landmarks = lm.Landmarks.build(self.g2, 3)
+
+    def test_astar_finds_dijkstra_paths(self):
+        num_ties = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                try:
+                    expected = get_canonical_path(self.g2, source, target, cost_index.weight)
+                except nx.NetworkXNoPath:
+                    self.assertRaises(nx.NetworkXNoPath, spy.shortest_path, self.g2, source, target,
+                                      cost_index.weight, self.landmarks.heuristic(target))
+                    continue
+                num_ties += len(list(nx.all_shortest_paths(self.g2, source, target, weight=cost_index.weight))) > 1
+                cost = sum(cost_index.weight(u, v) for u, v in zip(expected, expected[1:]))
+                self.assertEqual(spy.shortest_path(self.g2, source, target, cost_index.weight), (cost, expected))
+                self.assertEqual(spy.shortest_path(self.g2, source, target, cost_index.weight,
+                                                   self.landmarks.heuristic(target)), (cost, expected))
+        # The regtest snapshot has pairs of nodes joined by more than one shortest path
+        self.assertGreater(num_ties, 0)
+
+    def test_yen_paths_with_landmarks_equal_paths_without(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            for source, target in itertools.permutations(self.g2, 2):
+                expected = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount), MAX_PATHS))
+                found = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount,
+                                                            landmarks=self.landmarks), MAX_PATHS))
+                self.assertEqual(found, expected)
+
+    def test_spy_with_landmarks_equals_spy_without(self):
+        for source, target in itertools.permutations(self.g2, 2):
+            try:
+                expected = spy.spy(self.g2, source, target, 3, 5000)
+            except nx.NetworkXNoPath:
+                self.assertRaises(nx.NetworkXNoPath, spy.spy, self.g2, source, target, 3, 5000,
+                                  landmarks=self.landmarks)
+                continue
+            self.assertEqual(spy.spy(self.g2, source, target, 3, 5000, landmarks=self.landmarks), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import math
+import unittest
+import networkx as nx
+from ln import utils as utils, multi_path as mp
+from tests import regtest
+
+PAYMENT_AMOUNTS = (50000, 150000, 240000)
+
+
+class MinCostFlowTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+
+    def get_channels(self, payment_amount: int) -> dict:
+        """
+        Gets the channels of g2 that can carry the flow of a payment amount from their policies and balances: a channel
+        from node u to node v carries up to the balance of the channel from node v to node u (the one blocked by
+        block_payment) less the headroom for the fees, at the proportional fee plus the base fee per satoshi of the
+        payment amount and the cost of a hop
+
+        :param payment_amount: amount to be paid to node destiny
+        :return: arc (u, v), cost and capacity by key of the channel
+        """
+        channels = {}
+        for u, v, key, channel in self.g2.edges(keys=True, data=True):
+            policy = channel['policy_source']
+            opposite = self.g2[v][u].get('{}-{}'.format(channel['channel_id'], v)) if self.g2.has_edge(v, u) else None
+            if policy['disabled'] or opposite is None or int(policy['min_htlc']) >= payment_amount:
+                continue
+            capacity = int(opposite['balance']) - mp.FEE_HEADROOM
+            if capacity > 0:
+                cost = int(policy['fee_rate_milli_msat']) + \
+                    math.ceil(int(policy['fee_base_msat']) * 1000 / payment_amount) + mp.HOP_COST
+                channels[key] = ((u, v), cost, capacity)
+        return channels
+
+    def get_min_cost(self, source: str, target: str, payment_amount: int, channels: dict):
+        """
+        Gets the cost of the min cost flow of a payment amount found from scratch by the network simplex of networkx,
+        each channel is an arc through a node of its own, so the parallel channels are kept apart
+
+        :return: cost of the flow, None if the amount can not be carried
+        """
+        graph = nx.DiGraph()
+        graph.add_node(source, demand=-payment_amount)
+        graph.add_node(target, demand=payment_amount)
+        for key, ((u, v), cost, capacity) in channels.items():
+            graph.add_edge(u, key, weight=cost, capacity=capacity)
+            graph.add_edge(key, v, weight=0, capacity=capacity)
+        try:
+            return nx.network_simplex(graph)[0]
+        except nx.NetworkXUnfeasible:
+            return None
+
+    def assert_valid_parts(self, source: str, target: str, payment_amount: int, parts: list) -> dict:
+        """
+        Checks that the parts carry the payment amount from the source node to the target node, within the balances
+        and above the min_htlc of their channels
+
+        :return: flow by key of the channel
+        """
+        self.assertEqual(sum(amount for amount, _, _ in parts), payment_amount)
+        channels = self.get_channels(1 << 62)
+        flows = {}
+        for amount, nodes, keys in parts:
+            self.assertGreater(amount, 0)
+            self.assertEqual((nodes[0], nodes[-1]), (source, target))
+            for u, v, key in zip(nodes, nodes[1:], keys):
+                self.assertEqual(channels[key][0], (u, v))
+                self.assertLess(int(self.g2[u][v][key]['policy_source']['min_htlc']), amount)
+                flows[key] = flows.get(key, 0) + amount
+        for key, flow in flows.items():
+            self.assertLessEqual(flow, channels[key][2])
+        return flows
+
+    def test_parts_carry_amount_at_min_cost(self):
+        num_flows = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            channels = self.get_channels(payment_amount)
+            for source in self.g2:
+                for target in self.g2:
+                    if source == target:
+                        continue
+                    min_cost = self.get_min_cost(source, target, payment_amount, channels)
+                    try:
+                        parts = mp.min_cost_flow(self.g2, source, target, payment_amount, max_parts=len(channels))
+                    except nx.NetworkXNoPath:
+                        self.assertIsNone(min_cost)
+                        continue
+                    self.assertIsNotNone(min_cost)
+                    flows = self.assert_valid_parts(source, target, payment_amount, parts)
+                    self.assertEqual(sum(flow * channels[key][1] for key, flow in flows.items()), min_cost)
+                    num_flows += len(parts) > 1
+        # Some of the payments were split among several routes
+        self.assertGreater(num_flows, 0)
+
+    def test_parts_reach_min_htlc_of_their_channels(self):
+        num_flows = 0
+        payment_amount = 240000
+        for source in self.g2:
+            for target in self.g2:
+                if source == target:
+                    continue
+                try:
+                    parts = mp.min_cost_flow(self.g2, source, target, payment_amount, max_parts=16)
+                except nx.NetworkXNoPath:
+                    continue
+                if len(parts) == 1:
+                    continue
+                # The min_htlc of a channel of the smallest part is raised above the part, but below the payment amount
+                amount, nodes, keys = min(parts, key=lambda part: part[0])
+                u, v, key = nodes[0], nodes[1], keys[0]
+                policy = self.g2[u][v][key]['policy_source']
+                min_htlc = policy['min_htlc']
+                policy['min_htlc'] = amount
+                utils.update_graph_version(self.g2, u, v)
+                try:
+                    parts = mp.min_cost_flow(self.g2, source, target, payment_amount, max_parts=16)
+                    self.assert_valid_parts(source, target, payment_amount, parts)
+                    num_flows += 1
+                except nx.NetworkXNoPath:
+                    pass
+                policy['min_htlc'] = min_htlc
+                utils.update_graph_version(self.g2, u, v)
+        self.assertGreater(num_flows, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import random
+import itertools
+import unittest
+from ln import utils as utils, shortest_path_yen as spy
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 1000, 5000, 60000, 124000)
+# Max number of paths of each pair of nodes evaluated at once
+MAX_PATHS = 5
+
+
+class PathCostsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:6]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+
+    def assert_same_costs(self):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            for source, target in itertools.permutations(self.g2, 2):
+                paths = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount), MAX_PATHS))
+                # A path of a single node and a path with a pair of nodes that is not joined, as padding and -1
+                paths += [[source], [source, target]]
+                totals, fees, time_locks, edges = spy.path_costs(self.g2, paths, payment_amount)
+                evaluated = spy.evaluate_paths(self.g2, paths, payment_amount)
+                for i, path in enumerate(paths):
+                    hops = [regtest.get_reference_hop(self.g2, u, v, payment_amount) if self.g2.has_edge(u, v)
+                            else (None, None, None) for u, v in zip(path, path[1:])]
+                    expected = [(key, fee) for key, fee, _ in hops if key is not None]
+                    self.assertEqual(int(totals[i]), sum(fee for _, fee in expected))
+                    self.assertEqual(evaluated[i], (int(totals[i]), expected))
+                    self.assertEqual(spy.path_cost(self.g2, path, payment_amount), evaluated[i])
+                    self.assertEqual(time_locks[i].tolist()[:len(hops)],
+                                     [0 if key is None else self.g2[u][v][key]['policy_source']['time_lock_delta']
+                                      for (u, v), (key, _, _) in zip(zip(path, path[1:]), hops)])
+                    self.assertEqual(fees[i].tolist()[len(hops):], [0] * (fees.shape[1] - len(hops)))
+                    self.assertTrue((edges[i][len(hops):] == -1).all())
+                num_paths += len(paths)
+        self.assertGreater(num_paths, 0)
+
+    def test_path_costs_equal_reference(self):
+        self.assert_same_costs()
+
+    def test_path_costs_follow_graph_updates(self):
+        rand = random.Random(17)
+        for _ in range(4):
+            for u, v in rand.sample(list(self.g2.edges()), 3) + rand.sample(self.parallel, 2):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 3000, 6000.5, 70000, 125000])
+                utils.update_graph_version(self.g2, u, v)
+            self.assert_same_costs()
+
+
+if __name__ == '__main__':
+    unittest.main()
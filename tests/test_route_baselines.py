@@ -0,0 +1,86 @@
+import random
+import itertools
+import unittest
+import numpy as np
+import networkx as nx
+from ln import utils as utils, shortest_path_yen as spy, sparse_graph as sg
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 60000, 124000, 200000)
+
+
+def get_hop_limited_costs(graph: nx, source: str, payment_amount: int, max_hops: int) -> dict:
+    """
+    Gets the costs of the shortest paths of at most max_hops from a source node by a Bellman-Ford on the cost index,
+    one round per hop
+
+    :return: cost by node reached
+    """
+    cost_index = spy.get_cost_index(graph, payment_amount)
+    costs = {source: 0}
+    for _ in range(max_hops):
+        rounds = dict(costs)
+        for u, v in graph.edges():
+            weight = cost_index.weight(u, v)
+            if u in costs and weight is not None and costs[u] + weight < rounds.get(v, float('inf')):
+                rounds[v] = costs[u] + weight
+        costs = rounds
+    return costs
+
+
+class RouteBaselinesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:6]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+        self.sparse_graph = sg.SparseGraph(self.g2)
+        self.nodes = list(self.g2)
+
+    def assert_same_costs(self, distances: np.ndarray, expected: list):
+        for row, costs in zip(distances, expected):
+            self.assertEqual({node: int(row[pos]) for node, pos in self.sparse_graph.positions.items()
+                              if not np.isinf(row[pos])}, costs)
+
+    def test_hop_limited_distances_equal_bellman_ford(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            for max_hops in (1, 2, 3):
+                self.assert_same_costs(self.sparse_graph.hop_limited_distances(self.nodes, payment_amount, max_hops),
+                                       [get_hop_limited_costs(self.g2, source, payment_amount, max_hops)
+                                        for source in self.nodes])
+                reverse = self.g2.reverse(copy=False)
+                self.assert_same_costs(self.sparse_graph.hop_limited_distances(self.nodes, payment_amount, max_hops,
+                                                                               is_reverse=True),
+                                       [get_hop_limited_costs(reverse, source, payment_amount, max_hops)
+                                        for source in self.nodes])
+
+    def test_hop_limited_distances_equal_dijkstra(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            self.assert_same_costs(self.sparse_graph.hop_limited_distances(self.nodes, payment_amount),
+                                   [nx.single_source_dijkstra_path_length(self.g2, source, weight=cost_index.weight)
+                                    for source in self.nodes])
+
+    def test_route_baselines_follow_graph_updates(self):
+        rand = random.Random(23)
+        pairs = list(itertools.permutations(self.g2, 2))
+        for _ in range(10):
+            routes = [pair + (rand.choice(PAYMENT_AMOUNTS),) for pair in rand.sample(pairs, 40)]
+            baselines = self.sparse_graph.route_baselines(routes)
+            for (source, target, payment_amount), baseline in zip(routes, baselines.tolist()):
+                cost_index = spy.get_cost_index(self.g2, payment_amount)
+                try:
+                    expected = nx.dijkstra_path_length(self.g2, source, target, weight=cost_index.weight)
+                except nx.NetworkXNoPath:
+                    expected = float('inf')
+                self.assertEqual(baseline, expected)
+            for u, v in rand.sample(self.parallel, 2) + rand.sample(list(self.g2.edges()), 2):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 2000, 4000.5, 50000, 150000, 250000])
+                utils.update_graph_version(self.g2, u, v)
+
+
+if __name__ == '__main__':
+    unittest.main()
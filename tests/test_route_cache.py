@@ -0,0 +1,55 @@
+import random
+import itertools
+import unittest
+import networkx as nx
+from ln import utils as utils, shortest_path_yen as spy, route_cache as rc, channel_index as ci
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1000, 5000)
+
+
+class RouteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+
+    def query(self, source: str, target: str, payment_amount: int, channel_index=None):
+        try:
+            return spy.query_route_yen(self.g1, self.g2, source, target, payment_amount, 3,
+                                       channel_index=channel_index)
+        except nx.NetworkXNoPath:
+            return None
+
+    def assert_cache_equals_queries(self, channel_index=None):
+        rand = random.Random(7)
+        cache = rc.RouteCache(self.g1, self.g2, 40, channel_index)
+        pairs = rand.sample(list(itertools.permutations(self.g2, 2)), 12)
+        for _ in range(12):
+            # Each pair of nodes is queried more than once between the updates of the graph
+            for source, target in rand.sample(pairs * 3, 30):
+                payment_amount = rand.choice(PAYMENT_AMOUNTS)
+                found = cache.query_route(source, target, payment_amount,
+                                          lambda: self.query(source, target, payment_amount, channel_index))
+                expected = self.query(source, target, payment_amount, channel_index)
+                self.assertEqual(regtest.describe_payment(found), regtest.describe_payment(expected))
+            # The updates of the balances change the costs of the parallel channels and the routes that can forward
+            for u, v in rand.sample(list(self.g2.edges()), 3) + rand.sample(self.parallel, 1):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 3000, 6000.5, 70000, 125000])
+                utils.update_graph_version(self.g2, u, v)
+        self.assertGreater(cache.hits, 0)
+        self.assertGreater(cache.misses, 0)
+
+    def test_cached_routes_equal_queries(self):
+        self.assert_cache_equals_queries()
+
+    def test_cached_routes_equal_queries_with_channel_index(self):
+        self.assert_cache_equals_queries(ci.ChannelIndex(self.g2))
+
+
+if __name__ == '__main__':
+    unittest.main()
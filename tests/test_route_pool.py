@@ -0,0 +1,107 @@
+import random
+import itertools
+import unittest
+import networkx as nx
+from ln import utils as utils, shortest_path_yen as spy, route_pool as rpool, channel_index as ci
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 100000)
+# Max number of paths pulled from the generator per pair of nodes
+MAX_PATHS = 6
+
+
+@unittest.skipUnless(rpool.is_available(), 'the worker processes can not be forked')
+class SpurPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        u, v = sorted((u, v) for u, v in self.g2.edges() if u < v)[0]
+        regtest.add_parallel_channel(self.g2, u, v, '900000', 500)
+        self.parallel = (u, v)
+        self.spur_pool = rpool.SpurPool(self.g2, 2)
+
+    def tearDown(self):
+        self.spur_pool.close()
+
+    def assert_same_paths(self):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            for source, target in itertools.permutations(self.g2, 2):
+                serial = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount), MAX_PATHS))
+                pooled = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount,
+                                                             spur_pool=self.spur_pool), MAX_PATHS))
+                self.assertEqual(serial, pooled)
+                num_paths += len(pooled)
+        self.assertGreater(num_paths, len(PAYMENT_AMOUNTS) * self.g2.number_of_nodes())
+
+    def test_pooled_spurs_equal_serial_spurs(self):
+        self.assert_same_paths()
+        self.assertIsNotNone(self.spur_pool.executor)
+
+    def test_pool_forked_again_after_parallel_updates(self):
+        self.assert_same_paths()
+        for channel in self.g2[self.parallel[0]][self.parallel[1]].values():
+            channel['balance'] = 0
+        utils.update_graph_version(self.g2, *self.parallel)
+        self.assert_same_paths()
+
+    def test_query_route_uses_pool(self):
+        for source, target in itertools.permutations(list(self.g2)[:4], 2):
+            serial = spy.spy(self.g2, source, target, 3, 5000)
+            pooled = spy.spy(self.g2, source, target, 3, 5000, spur_pool=self.spur_pool)
+            self.assertEqual(serial, pooled)
+            payment = spy.query_route_yen(self.g1, self.g2, source, target, 5000, 3, spur_pool=self.spur_pool)
+            self.assertEqual([hop.pub_key for hop in payment.routes[0].hops], pooled[0][0][1:])
+
+
+
+@unittest.skipUnless(rpool.is_available(), 'the worker processes can not be forked')
+class RoutePoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v in self.g2.edges() if u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+        self.routes = [(u, v, payment_amount, False) for u, v in itertools.permutations(self.g2, 2)
+                       for payment_amount in PAYMENT_AMOUNTS]
+
+    def query(self, source: str, target: str, payment_amount: int, channel_index=None):
+        try:
+            return spy.query_route_yen(self.g1, self.g2, source, target, payment_amount, 1,
+                                       channel_index=channel_index)
+        except nx.NetworkXNoPath:
+            return None
+
+    def assert_pool_equals_queries(self, channel_index=None):
+        rand = random.Random(13)
+        pool = rpool.RoutePool(self.g1, self.g2, 1, 2, False, channel_index=channel_index)
+        pool.submit(self.routes)
+        num_pooled = num_missed = 0
+        for _ in range(8):
+            for source, target, payment_amount, is_reverse in rand.sample(self.routes, 40):
+                payment = pool.query_route(source, target, payment_amount, is_reverse)
+                if payment is None:
+                    num_missed += 1
+                    continue
+                num_pooled += 1
+                self.assertEqual(regtest.describe_payment(payment),
+                                 regtest.describe_payment(self.query(source, target, payment_amount, channel_index)))
+            # The payments blocked meanwhile update the balances of the graph
+            for u, v in rand.sample(list(self.g2.edges()), 2) + rand.sample(self.parallel, 1):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 3000, 6000.5, 70000, 125000])
+                utils.update_graph_version(self.g2, u, v)
+        self.assertGreater(num_pooled, 0)
+        self.assertGreater(num_missed, 0)
+
+    def test_pooled_routes_equal_queries(self):
+        self.assert_pool_equals_queries()
+
+    def test_pooled_routes_equal_queries_with_channel_index(self):
+        self.assert_pool_equals_queries(ci.ChannelIndex(self.g2))
+
+
+if __name__ == '__main__':
+    unittest.main()
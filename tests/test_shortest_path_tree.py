@@ -0,0 +1,61 @@
+import random
+import unittest
+from ln import utils as utils, shortest_path_yen as spy, shortest_path_tree as spt
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 100000)
+
+
+class ShortestPathTreeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        # The trees are only repaired after the updates of pairs of nodes with parallel channels
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v, d in self.g2.edges(data=True)
+                                           if not d['policy_source']['disabled'] and u < v})[:4]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+
+    def assert_same_tree(self, tree: spt.ShortestPathTree):
+        rebuilt = spt.ShortestPathTree(self.g2, tree.root, tree.payment_amount, tree.is_reverse)
+        self.assertEqual(tree.distances, rebuilt.distances)
+        cost_index = spy.get_cost_index(self.g2, tree.payment_amount)
+        for node, distance in tree.distances.items():
+            path = tree.path(node)
+            self.assertEqual(path[-1 if tree.is_reverse else 0], tree.root)
+            self.assertEqual(sum(cost_index.weight(path[i], path[i + 1]) for i in range(len(path) - 1)), distance)
+
+    def test_repaired_tree_equals_rebuilt_tree(self):
+        rand = random.Random(7)
+        trees = [spt.ShortestPathTree(self.g2, root, payment_amount, is_reverse) for root in self.g2
+                 for payment_amount in PAYMENT_AMOUNTS for is_reverse in (False, True)]
+        distances = [dict(tree.distances) for tree in trees]
+        for _ in range(30):
+            for u, v in rand.sample(self.parallel, 2):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 1000, 6000, 90000, 125000])
+                utils.update_graph_version(self.g2, u, v)
+            for tree in trees:
+                self.assertTrue(tree.is_valid())
+                self.assert_same_tree(tree)
+        # The balances changed the costs of the trees, so their paths were repaired rather than kept
+        self.assertTrue(any(tree.distances != before for tree, before in zip(trees, distances)))
+
+    def test_same_class_same_costs_with_fractional_balances(self):
+        for i, (u, v) in enumerate(self.parallel):
+            for j, channel in enumerate(self.g2[u][v].values()):
+                channel['balance'] = 4000.5 + 1000 * i + 0.25 * j
+            utils.update_graph_version(self.g2, u, v)
+        breakpoints = spt.get_amount_breakpoints(self.g2)
+        amounts = sorted({max(b + d, 1) for b in breakpoints for d in (-1, 0, 1)})
+        classes = {}
+        for payment_amount in amounts:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            weights = [cost_index.weight(u, v) for u, v in self.parallel]
+            self.assertEqual(classes.setdefault(spt.get_amount_class(self.g2, payment_amount), weights), weights)
+        self.assertGreater(len(set(map(tuple, classes.values()))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import itertools
+import unittest
+from ln import shortest_path_yen as spy
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 5000, 100000)
+# Max number of paths pulled from the generator per pair of nodes
+MAX_PATHS = 10
+
+
+class YenPathsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+
+    def test_paths_in_non_decreasing_cost(self):
+        num_paths = 0
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source, target in itertools.permutations(self.g2, 2):
+                paths = list(itertools.islice(spy.yen_paths(self.g2, source, target, payment_amount, cost_index),
+                                              MAX_PATHS))
+                costs = [sum(cost_index.weight(path[i], path[i + 1]) for i in range(len(path) - 1)) for path in paths]
+                self.assertEqual(costs, sorted(costs))
+                self.assertEqual(len({tuple(path) for path in paths}), len(paths))
+                for path in paths:
+                    self.assertEqual((path[0], path[-1]), (source, target))
+                    self.assertEqual(len(set(path)), len(path))
+                num_paths += len(paths)
+        self.assertGreater(num_paths, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
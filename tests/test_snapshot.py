@@ -0,0 +1,133 @@
+import io
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from ln import utils as utils, snapshot as snapshot
+from tests import regtest
+
+
+def get_reference_records(data: dict) -> list:
+    """
+    Gets the records of the arrays of nodes and edges of a snapshot decoded at once by json
+    """
+    return [(key, record) for key in snapshot.RECORD_ARRAYS for record in data.get(key, [])]
+
+
+def get_records(graphs: tuple) -> list:
+    """
+    Gets the nodes and edges of both graphs with their data, along with the types of the values of the data
+    """
+    g1, g2, _, _ = graphs
+    records = list(g1.nodes(data=True)) + list(g1.edges(keys=True, data=True)) + list(g2.edges(keys=True, data=True))
+    types = [sorted((k, type(v).__name__) for k, v in record[-1].items()) for record in records]
+    return records + types
+
+
+class SnapshotCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        shutil.copy(os.path.join(regtest.LOCATION, regtest.FILE_NAME), self.location)
+        self.path = snapshot.get_cache_path(self.location, regtest.FILE_NAME)
+        self.expected = get_records(snapshot.load_graphs(self.location, regtest.FILE_NAME, False))
+
+    def load(self) -> list:
+        return get_records(snapshot.load_graphs(self.location, regtest.FILE_NAME, False, is_cache=True))
+
+    def test_cache_equals_snapshot(self):
+        self.assertEqual(self.load(), self.expected)
+        self.assertIsNotNone(snapshot.SnapshotCache.load(self.path, self.location, regtest.FILE_NAME))
+        self.assertEqual(self.load(), self.expected)
+
+    def test_numbers_are_stored_as_arrays(self):
+        self.load()
+        arrays = snapshot.load_arrays(self.path)
+        self.assertEqual(arrays['ints'].dtype.name, 'int64')
+        self.assertEqual(arrays['floats'].dtype.name, 'float64')
+        self.assertTrue(all(not array.dtype.hasobject for array in arrays.values()))
+        # The numbers are not on the buffer of strings, which only keeps strings, lists and dicts
+        kinds = arrays['kinds'].tolist()
+        self.assertEqual(kinds.count(snapshot.KIND_INT), len(arrays['ints']))
+        self.assertGreater(len(arrays['ints']), 0)
+        self.assertEqual(len(arrays['text_offsets']) - 1,
+                         kinds.count(snapshot.KIND_TEXT) + kinds.count(snapshot.KIND_JSON))
+
+    def test_hash_is_computed_once_per_modification_time(self):
+        self.load()
+        stat = os.stat(os.path.join(self.location, regtest.FILE_NAME))
+        os.utime(os.path.join(self.location, regtest.FILE_NAME), (stat.st_atime, stat.st_mtime + 100))
+        with mock.patch.object(utils, 'get_file_hash', wraps=utils.get_file_hash) as get_file_hash:
+            self.assertIsNotNone(snapshot.SnapshotCache.load(self.path, self.location, regtest.FILE_NAME))
+            self.assertEqual(get_file_hash.call_count, 1)
+            self.assertIsNotNone(snapshot.SnapshotCache.load(self.path, self.location, regtest.FILE_NAME))
+            self.assertEqual(get_file_hash.call_count, 1)
+        self.assertEqual(snapshot.load_arrays(self.path)['version'].tolist()[2], stat.st_mtime + 100)
+        self.assertEqual(self.load(), self.expected)
+
+    def test_changed_snapshot_builds_cache_again(self):
+        self.load()
+        file_path = os.path.join(self.location, regtest.FILE_NAME)
+        with open(file_path) as f:
+            text = f.read()
+        # Same size, another alias
+        alias = text[text.index('"alias": "') + 10:].split('"')[0]
+        with open(file_path, 'w') as f:
+            f.write(text.replace('"alias": "%s"' % alias, '"alias": "%s"' % alias[::-1].swapcase(), 1))
+        stat = os.stat(file_path)
+        os.utime(file_path, (stat.st_atime, stat.st_mtime + 100))
+        self.assertIsNone(snapshot.SnapshotCache.load(self.path, self.location, regtest.FILE_NAME))
+        expected = get_records(snapshot.load_graphs(self.location, regtest.FILE_NAME, False))
+        self.assertNotEqual(expected, self.expected)
+        self.assertEqual(self.load(), expected)
+        self.assertEqual(self.load(), expected)
+
+
+class RecordReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(regtest.LOCATION, regtest.FILE_NAME)) as f:
+            self.text = f.read()
+        self.data = json.loads(self.text)
+
+    def read(self, text: str, chunk_size: int) -> list:
+        return list(snapshot.RecordReader(io.StringIO(text), chunk_size).records())
+
+    def test_records_equal_json(self):
+        expected = get_reference_records(self.data)
+        for chunk_size in (1, 2, 7, 64, 4096, snapshot.CHUNK_SIZE):
+            self.assertEqual(self.read(self.text, chunk_size), expected)
+
+    def test_other_layouts_equal_json(self):
+        data = {'edges': self.data['edges'][:3], 'graph_diff': {'nodes': [1.5, -2e3, None, True]},
+                'nodes': self.data['nodes'][:2], 'empty': [], 'numbers': [12345678901234567890, 0.125]}
+        # The edges come ahead of the nodes, so the records are given in the order of the file
+        expected = [('edges', record) for record in data['edges']] + [('nodes', record) for record in data['nodes']]
+        for text in (json.dumps(data), json.dumps(data, indent=4), json.dumps(data, separators=(',', ':'))):
+            for chunk_size in (1, 3, 16, snapshot.CHUNK_SIZE):
+                self.assertEqual(self.read(text, chunk_size), expected)
+        for text in ('{}', ' { "nodes" : [ ] , "edges" : [] } ', '{"nodes": {"edges": [1]}}'):
+            for chunk_size in (1, snapshot.CHUNK_SIZE):
+                self.assertEqual(self.read(text, chunk_size), [])
+
+    def test_malformed_snapshot_raises_error(self):
+        for text in ('', '[]', '{"nodes": [{"a": 1}', '{"nodes": [1 2]}', '{"nodes": []} 1', '{1: 2}',
+                     '{"nodes": [1]'):
+            for chunk_size in (1, snapshot.CHUNK_SIZE):
+                with self.assertRaises(json.JSONDecodeError):
+                    self.read(text, chunk_size)
+
+    def test_get_records_equals_json(self):
+        expected = get_reference_records(self.data)
+        if snapshot.ijson is not None:
+            self.assertEqual(list(snapshot.get_records_ijson(regtest.LOCATION, regtest.FILE_NAME)), expected)
+        with mock.patch.object(snapshot, 'ijson', None):
+            self.assertEqual(list(snapshot.get_records(regtest.LOCATION, regtest.FILE_NAME, 5)), expected)
+        self.assertEqual(list(snapshot.get_records(regtest.LOCATION, regtest.FILE_NAME)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+import networkx as nx
+from ln import utils as utils, shortest_path_yen as spy, sparse_graph as sg
+from tests import regtest
+
+PAYMENT_AMOUNTS = (1, 3000, 5000, 20000, 60000, 100000, 200000)
+
+
+class SparseGraphTest(unittest.TestCase):
+
+    def setUp(self):
+        self.g1, self.g2, self.node_dict, self.edge_dict = regtest.load_graphs()
+        self.parallel = []
+        for i, (u, v) in enumerate(sorted({(u, v) for u, v, d in self.g2.edges(data=True)
+                                           if not d['policy_source']['disabled'] and u < v})[:6]):
+            regtest.add_parallel_channel(self.g2, u, v, str(900000 + i), 500 * (i + 1))
+            self.parallel.extend([(u, v), (v, u)])
+        self.sparse_graph = sg.SparseGraph(self.g2)
+
+    def assert_same_distances(self):
+        for payment_amount in PAYMENT_AMOUNTS:
+            cost_index = spy.get_cost_index(self.g2, payment_amount)
+            for source in self.g2:
+                expected = nx.single_source_dijkstra_path_length(self.g2, source, weight=cost_index.weight)
+                distances, _ = self.sparse_graph.shortest_paths(source, payment_amount)
+                found = {node: int(distances[pos]) for node, pos in self.sparse_graph.positions.items()
+                         if distances[pos] != float('inf')}
+                self.assertEqual(found, expected)
+
+    def test_shortest_paths_equal_networkx(self):
+        self.assert_same_distances()
+        for source, target in [(u, v) for u in list(self.g2)[:4] for v in self.g2 if u != v]:
+            cost_index = spy.get_cost_index(self.g2, 5000)
+            self.assertEqual(self.sparse_graph.shortest_path(source, target, 5000)[0],
+                             nx.dijkstra_path_length(self.g2, source, target, weight=cost_index.weight))
+
+    def test_kept_matrices_follow_balance_updates(self):
+        # The balances add and remove breakpoints, so the classes of the amounts shift between updates
+        rand = random.Random(11)
+        for _ in range(40):
+            self.assert_same_distances()
+            for u, v in rand.sample(self.parallel, 2):
+                for channel in self.g2[u][v].values():
+                    channel['balance'] = rand.choice([0, 2000, 4000.5, 10000, 50000, 150000, 250000])
+                utils.update_graph_version(self.g2, u, v)
+        self.assert_same_distances()
+
+
+if __name__ == '__main__':
+    unittest.main()
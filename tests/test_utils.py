@@ -0,0 +1,190 @@
+import gc
+import io
+import os
+import copy
+import json
+import contextlib
+import tracemalloc
+import unittest
+import networkx as nx
+from ln import utils as utils, snapshot as snapshot
+from tests import regtest
+
+
+def populate_graphs_reference(data: dict):
+    """
+    Builds g1, g2, nodeDict and edgeDict as populate_graphs did before the GraphBuilder, i.e. one sweep per structure
+    """
+    g1 = nx.MultiGraph()
+    g2 = nx.MultiDiGraph()
+    for n in data['nodes']:
+        g1.add_node(n['pub_key'], last_update=n['last_update'], alias=n['alias'], addresses=n['addresses'],
+                    color=n['color'], features=n['features'])
+    node_dict = dict(g1.nodes(data=True))
+    for e in data['edges']:
+        g1.add_edge(e['node1_pub'], e['node2_pub'], key=e['channel_id'], chan_point=e['chan_point'],
+                    last_update=e['last_update'], node1_pub=e['node1_pub'], node2_pub=e['node2_pub'],
+                    capacity=int(e['capacity']),
+                    policy_source={'node1_policy': {}} if 'node1_policy' not in e else e["node1_policy"],
+                    policy_dest={'node2_policy': {}} if 'node2_policy' not in e else e["node2_policy"])
+    edge_dict = {}
+    for e in g1.edges(data=True, keys=True):
+        edge_dict[e[2]] = e
+    for n in data['nodes']:
+        g2.add_node(n['pub_key'])
+    for e in data['edges']:
+        if 'node1_policy' in e and 'node2_policy' in e:
+            for u, v, policy_source, policy_dest in ((e['node1_pub'], e['node2_pub'], e["node1_policy"],
+                                                      e["node2_policy"]),
+                                                     (e['node2_pub'], e['node1_pub'], e["node2_policy"],
+                                                      e["node1_policy"])):
+                g2.add_edge(u, v, key="{}-{}".format(e['channel_id'], u), channel_id=e['channel_id'],
+                            last_update=e['last_update'], policy_source=policy_source, policy_dest=policy_dest,
+                            capacity=int(e['capacity']))
+    for e in g2.edges(data=True, keys=True):
+        edge_dict[e[2]] = e
+    return g1, g2, node_dict, edge_dict
+
+
+class GraphBuilderTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(regtest.LOCATION, regtest.FILE_NAME)) as f:
+            self.data = json.load(f)
+        # A channel without policies and another one whose node is not on the nodes of the snapshot
+        edge = copy.deepcopy(self.data['edges'][0])
+        edge['channel_id'] = '900000'
+        del edge['node2_policy']
+        self.data['edges'].append(edge)
+        edge = copy.deepcopy(self.data['edges'][1])
+        edge['channel_id'] = '900001'
+        edge['node2_pub'] = '03' + '0' * 64
+        self.data['edges'].insert(0, edge)
+
+    def reference(self, data: dict):
+        for e in data['edges']:
+            utils.set_policy_numerics(e.get('node1_policy'))
+            utils.set_policy_numerics(e.get('node2_policy'))
+        return populate_graphs_reference(data)
+
+    def assert_same_graphs(self, graphs: tuple, expected: tuple):
+        g1, g2, node_dict, edge_dict = graphs
+        expected_g1, expected_g2, expected_node_dict, expected_edge_dict = expected
+        for graph, expected_graph in ((g1, expected_g1), (g2, expected_g2)):
+            self.assertEqual(type(graph), type(expected_graph))
+            self.assertEqual(list(graph.nodes(data=True)), list(expected_graph.nodes(data=True)))
+            self.assertEqual(list(graph.edges(keys=True, data=True)), list(expected_graph.edges(keys=True, data=True)))
+            for node in expected_graph:
+                self.assertEqual(list(graph.adj[node].items()), list(expected_graph.adj[node].items()))
+        for node in expected_g2:
+            self.assertEqual(list(g2.pred[node].items()), list(expected_g2.pred[node].items()))
+        self.assertEqual(node_dict, expected_node_dict)
+        self.assertEqual(edge_dict, expected_edge_dict)
+        # The entries of the dictionaries are the data of the graphs, not copies
+        for node, attr in node_dict.items():
+            self.assertIs(attr, g1.nodes[node])
+        for key, (u, v, k, attr) in edge_dict.items():
+            self.assertIs(attr, (g2 if '-' in k else g1).adj[u][v][k])
+
+    def test_populate_graphs_equals_reference(self):
+        self.assert_same_graphs(utils.populate_graphs(copy.deepcopy(self.data)), self.reference(self.data))
+
+    def test_graph_updates_reach_dictionaries(self):
+        g1, g2, node_dict, edge_dict = utils.populate_graphs(copy.deepcopy(self.data))
+        u, v, k, _ = next(iter(g2.edges(keys=True, data=True)))
+        g2.add_edge(u, v, key=k, balance=1)
+        self.assertEqual(edge_dict[k][3]['balance'], 1)
+        g1.add_node(u, alias='updated')
+        self.assertEqual(node_dict[u]['alias'], 'updated')
+
+    def test_snapshot_equals_reference(self):
+        data = copy.deepcopy(self.data)
+        data['edges'] = [e for e in data['edges'] if e['channel_id'] not in ('900000', '900001')]
+        data['nodes'] = [utils.set_node_defaults(n) for n in data['nodes']]
+        data['edges'] = [utils.set_edge_defaults(e) for e in data['edges']]
+        self.assert_same_graphs(snapshot.load_graphs(regtest.LOCATION, regtest.FILE_NAME, False), self.reference(data))
+
+    def test_stats_build_equals_reference(self):
+        with contextlib.redirect_stdout(io.StringIO()) as stdout:
+            graphs = utils.populate_graphs(copy.deepcopy(self.data), is_stats=True)
+        self.assert_same_graphs(graphs, self.reference(self.data))
+        self.assertIn('graphs built (nodes)', stdout.getvalue())
+        self.assertIn('graphs built (edges)', stdout.getvalue())
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertTrue(gc.isenabled())
+        with contextlib.redirect_stdout(io.StringIO()):
+            graphs = snapshot.load_graphs(regtest.LOCATION, regtest.FILE_NAME, False, is_stats=True)
+        expected = snapshot.load_graphs(regtest.LOCATION, regtest.FILE_NAME, False)
+        self.assert_same_graphs(graphs, expected)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_stats_measure_each_phase(self):
+        builder = utils.GraphBuilder(is_stats=True)
+        self.assertTrue(tracemalloc.is_tracing())
+        for n in self.data['nodes']:
+            builder.add_node(copy.deepcopy(n))
+        for e in self.data['edges']:
+            builder.add_edge(copy.deepcopy(e))
+        with contextlib.redirect_stdout(io.StringIO()):
+            builder.get_graphs()
+        self.assertEqual([phase for phase, _, _ in builder.phases], ['nodes', 'edges'])
+        self.assertTrue(all(seconds >= 0 and memory > 0 for _, seconds, memory in builder.phases))
+        self.assertFalse(tracemalloc.is_tracing())
+        # A tracing started by the caller is left running
+        tracemalloc.start()
+        self.addCleanup(tracemalloc.stop)
+        with contextlib.redirect_stdout(io.StringIO()):
+            utils.GraphBuilder(is_stats=True).get_graphs()
+        self.assertTrue(tracemalloc.is_tracing())
+
+
+class PolicyNumericsTest(unittest.TestCase):
+
+    def test_numerics_equal_int(self):
+        with open(os.path.join(regtest.LOCATION, regtest.FILE_NAME)) as f:
+            data = json.load(f)
+        num_fields = 0
+        for e in data['edges']:
+            for name in ('node1_policy', 'node2_policy'):
+                policy = e.get(name)
+                if policy is None:
+                    self.assertIsNone(utils.set_policy_numerics(policy))
+                    continue
+                expected = {k: int(v) if k in utils.POLICY_NUMERICS else v for k, v in policy.items()}
+                num_fields += sum(type(v) is str for k, v in policy.items() if k in utils.POLICY_NUMERICS)
+                self.assertIs(utils.set_policy_numerics(policy), policy)
+                self.assertEqual(policy, expected)
+                self.assertEqual([type(v) for v in policy.values()], [type(v) for v in expected.values()])
+                # Converting them again leaves them as they are
+                self.assertEqual(utils.set_policy_numerics(policy), expected)
+        self.assertGreater(num_fields, 0)
+
+    def test_missing_fields_are_not_added(self):
+        policy = {'fee_base_msat': '1000', 'disabled': False}
+        self.assertEqual(utils.set_policy_numerics(policy), {'fee_base_msat': 1000, 'disabled': False})
+
+
+class PauseGcTest(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(gc.enable if gc.isenabled() else gc.disable)
+
+    def test_gc_is_paused_and_restored(self):
+        gc.enable()
+        with utils.pause_gc():
+            self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+        with self.assertRaises(ValueError):
+            with utils.pause_gc():
+                raise ValueError()
+        self.assertTrue(gc.isenabled())
+
+    def test_disabled_gc_stays_disabled(self):
+        gc.disable()
+        with utils.pause_gc():
+            self.assertFalse(gc.isenabled())
+        self.assertFalse(gc.isenabled())
+
+
+if __name__ == '__main__':
+    unittest.main()